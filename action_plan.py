@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+多步操作计划模块
+模型一次返回当前操作和之后几步可以确定的操作（如点击搜索框、输入名字、回车），
+后续操作在本地依次执行，每执行一步用低分辨率截图比较预期变化区域确认操作生效，
+确认失败时放弃剩余计划，重新请求模型
+"""
+import cv2
+import numpy as np
+
+from frame_change import make_thumbnail
+
+
+# 开启多步计划时追加在系统提示词之后的说明，{max_actions}为最多的后续操作数
+PLAN_PROMPT = """
+
+## 多步计划（本节优先于“单步聚焦”约束）
+
+当你能从当前截图**确定**之后几步的操作时（例如表单填写：点击输入框并输入、点击下一个输入框并输入、点击提交），
+可以在 `next_actions` 中按顺序给出最多 {max_actions} 个后续操作，系统会在本地依次执行，不再为每一步截图请求你。
+后续操作的位置必须在当前截图中可见且执行前面的操作后不会移动；无法确定时 `next_actions` 返回空列表。
+
+在原有字段之外增加：
+
+```json
+{{
+  "expected_region": "[x1, y1, x2, y2] 当前操作执行后预期发生变化的区域，无法确定时为 []",
+  "next_actions": [
+    {{
+      "element_info": "元素描述",
+      "coordinates": "[x, y] 或 [[x1, y1], [x2, y2]]",
+      "action": "与 action 字段相同的枚举值",
+      "type_information": "要输入的文本或快捷键，或空字符串",
+      "submit": "与 submit 字段相同，输入后是否按回车，可省略",
+      "expected_region": "[x1, y1, x2, y2] 本操作执行后预期发生变化的区域，无法确定时为 []"
+    }}
+  ]
+}}
+```
+
+每一步执行后系统会检查 `expected_region` 内的画面是否变化，没有变化时放弃剩余操作并重新截图请求你。
+"""
+
+
+def _valid_region(region):
+    return (isinstance(region, (list, tuple)) and len(region) == 4
+            and all(isinstance(value, (int, float)) for value in region)
+            and region[2] > region[0] and region[3] > region[1])
+
+
+def _valid_step(step):
+    return (isinstance(step, dict) and isinstance(step.get("action"), str)
+            and isinstance(step.get("coordinates"), list) and len(step["coordinates"]) > 0)
+
+
+class ActionPlan:
+    """
+    待执行的后续操作队列
+
+    set()在模型返回后保存next_actions，remember()在每次执行操作前记录画面和预期变化区域，
+    next_element()先确认上一步操作生效，再取出下一步操作（格式与模型输出相同）
+    """
+
+    def __init__(self, max_actions=4, change_ratio=0.01, frame_change_ratio=0.001, pixel_threshold=10,
+                 thumbnail_width=320):
+        """
+        参数:
+            max_actions: 每次模型输出最多采用的后续操作数
+            change_ratio: 预期区域内变化像素占比超过该值认为操作已生效
+            frame_change_ratio: 未给出预期区域时，整个画面变化像素占比超过该值认为操作已生效
+            pixel_threshold: 单个像素灰度差超过该值才算变化
+            thumbnail_width: 比较用灰度缩略图的宽度
+        """
+        self.max_actions = max_actions
+        self.change_ratio = change_ratio
+        self.frame_change_ratio = frame_change_ratio
+        self.pixel_threshold = pixel_threshold
+        self.thumbnail_width = thumbnail_width
+        self.pending = []
+        self.current_status = ""
+        self.reference = None
+        self.region = None
+        self.last_ratio = None
+        # 统计：模型给出的后续操作数、本地执行数、确认失败后放弃的操作数
+        self.planned = 0
+        self.executed = 0
+        self.rejected = 0
+
+    def set(self, element):
+        """保存模型输出中的后续操作，替换之前未执行完的计划；格式不正确的操作及其之后的操作不采用"""
+        self.pending = []
+        self.current_status = element.get("current_status", "")
+        for step in (element.get("next_actions") or [])[:self.max_actions]:
+            if not _valid_step(step):
+                break
+            self.pending.append(step)
+        self.planned += len(self.pending)
+
+    def clear(self):
+        """放弃剩余计划"""
+        self.rejected += len(self.pending)
+        self.pending = []
+        self.reference = None
+
+    def remember(self, image, region=None):
+        """执行操作前记录画面和该操作的预期变化区域（千分比坐标），没有后续操作时不记录"""
+        if not self.pending:
+            self.reference = None
+            return
+        self.reference = make_thumbnail(image, self.thumbnail_width)
+        self.region = region if _valid_region(region) else None
+
+    def verify(self, image):
+        """确认上一步操作已生效：预期区域（或整个画面）内的画面发生了变化"""
+        if self.reference is None:
+            return True
+        thumb = make_thumbnail(image, self.thumbnail_width)
+        if thumb.shape != self.reference.shape:
+            self.last_ratio = 1.0
+            return True
+        threshold = self.frame_change_ratio
+        before, after = self.reference, thumb
+        if self.region is not None:
+            height, width = thumb.shape[:2]
+            left, top = int(self.region[0] / 1000 * width), int(self.region[1] / 1000 * height)
+            right = max(left + 1, int(np.ceil(self.region[2] / 1000 * width)))
+            bottom = max(top + 1, int(np.ceil(self.region[3] / 1000 * height)))
+            before, after = before[top:bottom, left:right], after[top:bottom, left:right]
+            threshold = self.change_ratio
+        diff = cv2.absdiff(before, after)
+        self.last_ratio = np.count_nonzero(diff > self.pixel_threshold) / max(1, diff.size)
+        return self.last_ratio > threshold
+
+    def next_element(self, image):
+        """
+        取出下一步操作，上一步未确认生效时放弃剩余计划并返回None
+        """
+        if not self.pending:
+            return None
+        if not self.verify(image):
+            self.clear()
+            return None
+        step = self.pending.pop(0)
+        self.executed += 1
+        return {
+            "current_status": self.current_status,
+            "whether_completed": "False",
+            "element_info": step.get("element_info", ""),
+            "coordinates": step["coordinates"],
+            "action": step["action"],
+            "type_information": step.get("type_information", ""),
+            "submit": step.get("submit", True),
+            "expected_region": step.get("expected_region", [])
+        }
+
+    def report(self):
+        """返回统计摘要文本"""
+        return (f"多步计划: 模型给出后续操作 {self.planned} 步，本地执行 {self.executed} 步，"
+                f"确认失败放弃 {self.rejected} 步")
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+异步执行引擎模块
+在常驻的后台事件循环中运行自动控制任务，截图、模型请求、鼠标操作和等待都是可等待的阶段。
+停止时取消任务：进行中的HTTP请求立即中止，工作线程中的等待通过停止事件立即返回
+"""
+import asyncio
+import threading
+
+
+class AgentEngine:
+    """
+    异步执行引擎
+
+    事件循环运行在独立的守护线程中，整个进程只创建一次，异步HTTP客户端的连接池因此
+    可以在多次任务之间复用。同步代码通过run()提交协程并阻塞等待结果，
+    其他线程（如界面的停止按钮）通过cancel()取消当前任务
+    """
+
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self._loop = None
+        self._thread = None
+        self._task = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """引擎的事件循环，首次访问时启动后台线程"""
+        with self._lock:
+            if self._loop is None:
+                ready = threading.Event()
+
+                def run_loop():
+                    self._loop = asyncio.new_event_loop()
+                    asyncio.set_event_loop(self._loop)
+                    ready.set()
+                    self._loop.run_forever()
+
+                self._thread = threading.Thread(target=run_loop, name="AgentEngine", daemon=True)
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    @property
+    def running(self):
+        """是否有任务正在运行"""
+        return self._task is not None
+
+    @property
+    def cancelled(self):
+        """当前任务是否已被请求停止"""
+        return self.stop_event.is_set()
+
+    async def _run_task(self, coro):
+        self._task = asyncio.current_task()
+        try:
+            return await coro
+        finally:
+            self._task = None
+
+    def run(self, coro):
+        """
+        在引擎线程中运行协程，阻塞等待并返回结果
+
+        协程自身处理取消时返回其结果；未处理时抛出concurrent.futures.CancelledError
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("不能在引擎线程中同步等待任务")
+        self.stop_event.clear()
+        future = asyncio.run_coroutine_threadsafe(self._run_task(coro), self.loop)
+        return future.result()
+
+    def cancel(self):
+        """请求停止当前任务（线程安全），工作线程中的等待和进行中的请求都会立即中止"""
+        self.stop_event.set()
+        task = self._task
+        if task is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(task.cancel)
+
+    def sleep(self, seconds):
+        """
+        可被停止打断的阻塞等待，供工作线程中的同步代码替代time.sleep
+
+        返回:
+            bool: 完整等待返回True，因停止而提前返回False
+        """
+        return not self.stop_event.wait(seconds)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_agent_engine():
+    """获取进程内唯一的执行引擎"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AgentEngine()
+        return _engine
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+后台标记图片写入模块
+操作执行后在后台线程中绘制坐标标记、写入调试图片和会话录制，不再占用操作与下一次截图之间的时间。
+队列有上限，写盘跟不上时按背压策略丢弃或等待，任务结束时统一刷新
+"""
+import queue
+import threading
+
+import cv2
+
+from cv_shot_doubao import mark_coordinate_on_image
+
+
+# 队列满时的处理策略
+BACKPRESSURE_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+def to_image_coordinates(frame, mapped_coordinates):
+    """
+    将实际屏幕坐标转换回截图帧上的像素坐标
+
+    参数:
+        frame: 执行操作时使用的截图帧
+        mapped_coordinates: 单点 [x, y] 或拖拽 [[x1, y1], [x2, y2]]
+
+    返回:
+        list: 截图上的像素坐标，格式与输入相同
+    """
+    def convert(coord):
+        # 去掉裁剪偏移后应用缩放比例，将实际坐标转换为图片坐标
+        return [int((coord[0] - frame.offset_x) * frame.scale),
+                int((coord[1] - frame.offset_y) * frame.scale)]
+
+    if isinstance(mapped_coordinates[0], (list, tuple)):
+        return [convert(coord) for coord in mapped_coordinates]
+    return convert(mapped_coordinates)
+
+
+class AnnotationWriter:
+    """
+    后台标记图片写入器
+
+    提交时复制截图（截图缓冲区会被后续截图复用），由后台线程按提交顺序绘制标记并写盘
+    """
+
+    def __init__(self, max_queue=8, backpressure="drop_oldest", block_timeout=1.0):
+        """
+        参数:
+            max_queue: 队列中最多等待写入的任务数
+            backpressure: 队列满时的策略："drop_oldest"丢弃最早的任务，"drop_newest"丢弃新任务，
+                "block"等待至多block_timeout秒后丢弃新任务
+            block_timeout: block策略的最长等待时间（秒）
+        """
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"不支持的背压策略: {backpressure}")
+        self.backpressure = backpressure
+        self.block_timeout = block_timeout
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="AnnotationWriter", daemon=True)
+        self._thread.start()
+
+    def submit_annotation(self, frame, mapped_coordinates, output_path):
+        """
+        提交一张标记图片
+
+        参数:
+            frame: 执行操作时使用的截图帧
+            mapped_coordinates: move_mouse_to_coordinates返回的实际屏幕坐标
+            output_path: 标记图片输出路径
+        """
+        coordinates = to_image_coordinates(frame, mapped_coordinates)
+        return self._put((mark_coordinate_on_image, (coordinates,),
+                          {"output_path": output_path, "image": frame.image.copy(), "copy_image": False}))
+
+    def submit_image(self, image, output_path):
+        """提交一张原样保存的截图"""
+        return self._put((cv2.imwrite, (output_path, image.copy()), {}))
+
+    def submit_step(self, recorder, frame, info):
+        """
+        提交一步会话录制
+
+        参数:
+            recorder: SessionRecorder
+            frame: 本步截图帧，为None时只记录元数据
+            info: 本步的元数据字典
+        """
+        image = frame.image.copy() if frame is not None else None
+        return self._put((recorder.add_step, (image, info), {}))
+
+    def _put(self, item):
+        if self.backpressure == "block":
+            try:
+                self._queue.put(item, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                return False
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        if self.backpressure == "drop_newest":
+            self.dropped += 1
+            return False
+        # drop_oldest：丢弃最早的任务，为最新一步腾出位置
+        try:
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self.dropped += 1
+        except queue.Empty:
+            pass
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                func, args, kwargs = item
+                if func(*args, **kwargs):
+                    self.written += 1
+                else:
+                    self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"后台写入失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    @property
+    def pending(self):
+        """队列中等待写入的数量"""
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        """
+        等待队列中的图片全部写入
+
+        参数:
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        返回:
+            bool: 全部写入返回True，超时返回False
+        """
+        if timeout is None:
+            self._queue.join()
+            return True
+        done = threading.Event()
+        waiter = threading.Thread(target=lambda: (self._queue.join(), done.set()), daemon=True)
+        waiter.start()
+        return done.wait(timeout)
+
+    def close(self, timeout=None):
+        """刷新队列后停止后台线程"""
+        flushed = self.flush(timeout)
+        if flushed:
+            self._queue.put(None)
+            self._thread.join(timeout)
+        return flushed
+
+    def report(self):
+        """返回统计摘要文本"""
+        return (f"后台写入: 完成 {self.written} 项，丢弃 {self.dropped} 项，"
+                f"失败 {self.failed} 项，未写入 {self.pending} 项")
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+剪贴板模块
+pyperclip在Linux下每次复制都启动一个xclip/xsel子进程，这里改为在进程内常驻一个X11剪贴板所有者：
+用ctypes打开独立的X显示连接，创建一个不显示的窗口持有CLIPBOARD选区，后台线程响应其他程序的粘贴请求。
+复制只需通知后台线程更新内容并确认取得选区，不再启动子进程。
+其他平台（Windows的pyperclip直接调用系统接口，macOS在安装pyobjc时使用NSPasteboard）或X11不可用时仍使用pyperclip
+"""
+import os
+import sys
+import select
+import ctypes
+import ctypes.util
+import threading
+
+
+# X11事件类型和常量
+SELECTION_CLEAR = 29
+SELECTION_REQUEST = 30
+SELECTION_NOTIFY = 31
+XA_ATOM = 4
+PROP_MODE_REPLACE = 0
+
+# 单次回复的最大字节数，超过时需要INCR分段传输（模型给出的输入文本远小于该值）
+MAX_REPLY_BYTES = 256 * 1024
+
+
+class XSelectionRequestEvent(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_int), ("serial", ctypes.c_ulong), ("send_event", ctypes.c_int),
+                ("display", ctypes.c_void_p), ("owner", ctypes.c_ulong), ("requestor", ctypes.c_ulong),
+                ("selection", ctypes.c_ulong), ("target", ctypes.c_ulong), ("property", ctypes.c_ulong),
+                ("time", ctypes.c_ulong)]
+
+
+class XSelectionEvent(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_int), ("serial", ctypes.c_ulong), ("send_event", ctypes.c_int),
+                ("display", ctypes.c_void_p), ("requestor", ctypes.c_ulong), ("selection", ctypes.c_ulong),
+                ("target", ctypes.c_ulong), ("property", ctypes.c_ulong), ("time", ctypes.c_ulong)]
+
+
+class XEvent(ctypes.Union):
+    _fields_ = [("type", ctypes.c_int), ("xselectionrequest", XSelectionRequestEvent),
+                ("xselection", XSelectionEvent), ("pad", ctypes.c_long * 24)]
+
+
+class X11ClipboardOwner:
+    """
+    常驻的X11剪贴板所有者
+
+    所有Xlib调用都在后台线程中完成（同一个Display连接不能跨线程使用），
+    copy()通过管道唤醒后台线程，等待其取得CLIPBOARD选区后返回，随后的粘贴不会读到旧内容
+    """
+
+    def __init__(self, display=None, timeout=1.0):
+        """
+        参数:
+            display: X显示名，为None时使用DISPLAY环境变量
+            timeout: copy()等待取得选区的最长时间（秒）
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError("X11剪贴板仅支持Linux")
+        x11_path = ctypes.util.find_library("X11")
+        if not x11_path:
+            raise OSError("未找到libX11")
+        x11 = ctypes.cdll.LoadLibrary(x11_path)
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x11.XCreateSimpleWindow.restype = ctypes.c_ulong
+        x11.XCreateSimpleWindow.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int, ctypes.c_int,
+                                            ctypes.c_uint, ctypes.c_uint, ctypes.c_uint, ctypes.c_ulong,
+                                            ctypes.c_ulong]
+        x11.XInternAtom.restype = ctypes.c_ulong
+        x11.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+        x11.XSetSelectionOwner.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_ulong]
+        x11.XGetSelectionOwner.restype = ctypes.c_ulong
+        x11.XGetSelectionOwner.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        x11.XChangeProperty.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_ulong,
+                                        ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        x11.XSendEvent.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int, ctypes.c_long,
+                                   ctypes.POINTER(XEvent)]
+        x11.XPending.argtypes = [ctypes.c_void_p]
+        x11.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.POINTER(XEvent)]
+        x11.XConnectionNumber.argtypes = [ctypes.c_void_p]
+        x11.XFlush.argtypes = [ctypes.c_void_p]
+        x11.XDestroyWindow.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self._x11 = x11
+
+        name = display if display is not None else os.environ.get("DISPLAY")
+        self._display = x11.XOpenDisplay(name.encode() if name else None)
+        if not self._display:
+            raise OSError(f"无法连接X显示: {name}")
+        self._window = x11.XCreateSimpleWindow(self._display, x11.XDefaultRootWindow(self._display),
+                                               0, 0, 1, 1, 0, 0, 0)
+        atoms = ("CLIPBOARD", "TARGETS", "UTF8_STRING", "STRING", "TEXT", "text/plain;charset=utf-8")
+        self._atoms = {atom: x11.XInternAtom(self._display, atom.encode(), 0) for atom in atoms}
+
+        self.timeout = timeout
+        self._data = b""
+        self._owned = False
+        self._pending = False
+        self._lock = threading.Lock()
+        self._acquired = threading.Event()
+        self._stopped = False
+        self._wake_read, self._wake_write = os.pipe()
+        self._thread = threading.Thread(target=self._run, name="x11-clipboard", daemon=True)
+        self._thread.start()
+
+    def copy(self, text):
+        """设置剪贴板内容，取得选区后返回；超时或被拒绝时抛出OSError"""
+        if self._stopped:
+            raise OSError("X11剪贴板已关闭")
+        with self._lock:
+            self._data = text.encode("utf-8")
+            self._pending = True
+            self._acquired.clear()
+        os.write(self._wake_write, b"x")
+        if not self._acquired.wait(self.timeout) or not self._owned:
+            raise OSError("未能取得X11剪贴板选区")
+
+    def _acquire(self):
+        with self._lock:
+            if not self._pending:
+                return
+            self._pending = False
+        clipboard = self._atoms["CLIPBOARD"]
+        # 使用CurrentTime取得选区，与xclip等工具的做法一致
+        self._x11.XSetSelectionOwner(self._display, clipboard, self._window, 0)
+        self._owned = self._x11.XGetSelectionOwner(self._display, clipboard) == self._window
+        self._acquired.set()
+
+    def _reply(self, request):
+        """按请求的目标格式把内容写入请求方窗口的属性，再发送SelectionNotify"""
+        atoms = self._atoms
+        target = request.target
+        prop = request.property or target
+        with self._lock:
+            data = self._data
+        if target == atoms["TARGETS"]:
+            targets = (ctypes.c_ulong * 5)(atoms["TARGETS"], atoms["UTF8_STRING"], atoms["STRING"], atoms["TEXT"],
+                                           atoms["text/plain;charset=utf-8"])
+            self._x11.XChangeProperty(self._display, request.requestor, prop, XA_ATOM, 32, PROP_MODE_REPLACE,
+                                      targets, len(targets))
+        elif target in (atoms["UTF8_STRING"], atoms["TEXT"], atoms["text/plain;charset=utf-8"], atoms["STRING"]):
+            if target == atoms["STRING"]:
+                data = data.decode("utf-8").encode("latin-1", errors="replace")
+            if len(data) > MAX_REPLY_BYTES:
+                prop = 0
+            else:
+                kind = atoms["UTF8_STRING"] if target == atoms["TEXT"] else target
+                self._x11.XChangeProperty(self._display, request.requestor, prop, kind, 8, PROP_MODE_REPLACE,
+                                          data, len(data))
+        else:
+            # 不支持的格式，按协议回复None表示拒绝
+            prop = 0
+
+        notify = XEvent()
+        notify.xselection.type = SELECTION_NOTIFY
+        notify.xselection.display = self._display
+        notify.xselection.requestor = request.requestor
+        notify.xselection.selection = request.selection
+        notify.xselection.target = target
+        notify.xselection.property = prop
+        notify.xselection.time = request.time
+        self._x11.XSendEvent(self._display, request.requestor, 0, 0, ctypes.byref(notify))
+
+    def _run(self):
+        connection = self._x11.XConnectionNumber(self._display)
+        event = XEvent()
+        try:
+            while not self._stopped:
+                while self._x11.XPending(self._display):
+                    self._x11.XNextEvent(self._display, ctypes.byref(event))
+                    if event.type == SELECTION_REQUEST:
+                        self._reply(event.xselectionrequest)
+                    elif event.type == SELECTION_CLEAR:
+                        # 其他程序复制了新内容
+                        self._owned = False
+                self._x11.XFlush(self._display)
+                readable, _, _ = select.select([connection, self._wake_read], [], [], 1.0)
+                if self._wake_read in readable:
+                    os.read(self._wake_read, 64)
+                    self._acquire()
+        finally:
+            self._x11.XDestroyWindow(self._display, self._window)
+            self._x11.XCloseDisplay(self._display)
+            self._display = None
+
+    def close(self):
+        """放弃选区并关闭X显示连接，剪贴板内容随之失效"""
+        if self._stopped:
+            return
+        self._stopped = True
+        os.write(self._wake_write, b"x")
+        self._thread.join(2.0)
+        os.close(self._wake_read)
+        os.close(self._wake_write)
+
+
+def create_clipboard():
+    """
+    创建剪贴板，返回带有copy(text)方法的对象
+
+    Linux X11下使用常驻的X11ClipboardOwner，其他情况使用pyperclip
+    """
+    if sys.platform.startswith("linux") and os.environ.get("DISPLAY"):
+        try:
+            return X11ClipboardOwner()
+        except OSError as e:
+            print(f"X11剪贴板不可用，使用pyperclip: {e}")
+    import pyperclip
+    return pyperclip
@@ -1,83 +1,197 @@
 import cv2
 import numpy as np
-import pyautogui
 import os
 import time
 import platform
 import re
 import sys
 from mac_app_utils import is_mac_app, get_app_resource_path, get_resource_file_path, get_default_imgs_path
+from screen_backends import select_capture_backend
+from monitors import get_monitor_layout
+from frame_pool import resize_into
 
-def capture_screen_and_save(save_path=None, optimize_for_speed=True, max_png=1280):
+# 当前使用的截图后端及其配置，首次截图时自动选择
+_capture_backend = None
+_capture_settings = None
+
+def configure_capture_backend(name="auto", replay_path=None):
     """
-    使用OpenCV实现自动截屏并保存到指定路径
+    按配置选择截图后端；配置与当前后端相同时直接沿用，不重新测速
     
     参数:
-        save_path: 保存路径，默认为"imgs/screen.png"（在Mac App环境下会自动调整为资源包路径）
-        optimize_for_speed: 是否优化速度（减少日志和使用更快的保存参数）
-        max_png: 图片最大尺寸限制
+        name: 后端名称（"auto"、"pyautogui"、"mss"、"xshm"、"replay"）
+        replay_path: 回放后端使用的图片文件或文件夹
+    
+    返回:
+        CaptureBackend: 选中的后端
     """
-    # 如果未提供save_path，使用默认路径
-    if save_path is None:
-        default_imgs_path = get_default_imgs_path()
-        save_path = os.path.join(default_imgs_path, "screen.png")
-    # 如果是相对路径且是Mac App环境，则修改为资源包路径
-    elif not os.path.isabs(save_path) and is_mac_app():
-        save_path = get_resource_file_path(save_path)
-    # 创建输出目录（如果不存在）
-    output_dir = os.path.dirname(save_path)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        if not optimize_for_speed:
-            print(f"创建文件夹: {output_dir}")
+    global _capture_backend, _capture_settings
+    settings = (name, replay_path)
+    if _capture_backend is not None and _capture_settings == settings:
+        return _capture_backend
+    backend = select_capture_backend(name, replay_path)
+    if _capture_backend is not None and _capture_backend is not backend:
+        _capture_backend.close()
+    _capture_backend = backend
+    _capture_settings = settings
+    return backend
+
+def get_capture_backend():
+    """获取当前截图后端，尚未配置时自动测速选择"""
+    if _capture_backend is None:
+        configure_capture_backend("auto")
+    return _capture_backend
+
+class ScreenFrame:
+    """
+    内存中的截图帧，在截图、编码、坐标映射和标记各阶段之间传递，避免磁盘往返
+    
+    属性:
+        image: BGR格式的像素数组（已按scale缩放）
+        scale: 图像相对于实际屏幕的缩放比例
+        width: 图像宽度
+        height: 图像高度
+        screen_width: 原始截图宽度
+        screen_height: 原始截图高度
+        timestamp: 截图时间戳
+        offset_x: 图像左上角在屏幕上的x坐标（区域放大截图时非0）
+        offset_y: 图像左上角在屏幕上的y坐标
+        full_image: 缩放前的原始分辨率图像（仅在需要区域放大时保留）
+        full_scale: full_image像素与鼠标坐标的比例（高DPI显示器上大于1）
+    
+    其中scale为image像素与鼠标坐标的比例，鼠标坐标 = 图像像素坐标 / scale + 偏移
+    """
+    def __init__(self, image, scale=1, screen_width=None, screen_height=None, timestamp=None,
+                 offset_x=0, offset_y=0, full_image=None, full_scale=1):
+        self.image = image
+        self.scale = scale
+        self.height, self.width = image.shape[:2]
+        self.screen_width = screen_width if screen_width is not None else self.width
+        self.screen_height = screen_height if screen_height is not None else self.height
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.full_image = full_image
+        self.full_scale = full_scale
+
+    @property
+    def size(self):
+        """返回图像尺寸 (宽, 高)"""
+        return self.width, self.height
+
+    def save(self, save_path, optimize_for_speed=True):
+        """
+        将帧写入磁盘，仅在调试或录制时使用
+        
+        参数:
+            save_path: 保存路径（在Mac App环境下会自动调整为资源包路径）
+            optimize_for_speed: 是否使用更快的保存参数
+        
+        返回:
+            bool: 保存成功返回True，失败返回False
+        """
+        if not os.path.isabs(save_path) and is_mac_app():
+            save_path = get_resource_file_path(save_path)
+        output_dir = os.path.dirname(save_path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        save_params = [int(cv2.IMWRITE_PNG_COMPRESSION), 1] if optimize_for_speed else []
+        return cv2.imwrite(save_path, self.image, save_params)
+
+
+def capture_screen_frame(optimize_for_speed=True, max_png=1280, save_path=None, backend=None, keep_full_image=False,
+                         monitor=None, pool=None):
+    """
+    截屏并返回内存中的ScreenFrame，后续各阶段直接使用该对象
+    
+    参数:
+        optimize_for_speed: 是否优化速度（减少日志并按max_png缩小图片）
+        max_png: 图片最大尺寸限制
+        save_path: 调试用保存路径，为None时不写入磁盘
+        backend: 截图后端，默认使用get_capture_backend()
+        keep_full_image: 是否在帧中保留缩放前的原始分辨率图像（区域放大模式使用）
+        monitor: 目标显示器序号，0表示所有显示器拼接，None表示沿用后端默认的整屏截图
+        pool: 帧缓冲池（FrameBufferPool），提供时截图、颜色转换和缩放都写入预分配的缓冲区，
+            返回帧中的数组会在之后的截图中被复用，需要长期保存时应自行复制
     
+    返回:
+        ScreenFrame: 截图帧，失败时返回None
+    """
     try:
         if not optimize_for_speed:
             print("正在执行截屏...")
             start_time = time.time()
         
-        # 使用pyautogui进行截屏
-        screenshot = pyautogui.screenshot()
+        if backend is None:
+            backend = get_capture_backend()
         
-        # 转换PIL图像为OpenCV格式（BGR）
-        screenshot_np = np.array(screenshot)
-        screenshot_bgr = cv2.cvtColor(screenshot_np, cv2.COLOR_RGB2BGR)
+        timestamp = time.time()
+        if monitor is None:
+            # 由截图后端直接返回OpenCV格式（BGR）的图像
+            screenshot_bgr = backend.grab(pool)
+            screen_height, screen_width = screenshot_bgr.shape[:2]
+            pixel_scale = 1
+            offset_x, offset_y = backend.origin()
+        else:
+            # 按显示器截图，同时得到该显示器的DPI比例和在虚拟屏幕中的偏移
+            screenshot_bgr, pixel_scale, offset_x, offset_y, screen_width, screen_height = \
+                get_monitor_layout().capture(backend, monitor, pool)
+        full_image = screenshot_bgr if keep_full_image else None
 
         scale = 1
         if optimize_for_speed:
-            # # 将图片等比例缩小一半
-            # screenshot_bgr = cv2.resize(screenshot_bgr, None, fx=0.5, fy=0.5)
             # 若图片的最长边大于max_png,则将最长边缩小为max_png,其他边等比缩小
-            height, width, _ = screenshot_bgr.shape
-            max_edge = max(height, width)
+            max_edge = max(screenshot_bgr.shape[:2])
             if max_edge > max_png:
                 scale = max_png / max_edge
-                screenshot_bgr = cv2.resize(screenshot_bgr, None, fx=scale, fy=scale)
-            
-        # 使用更快的保存参数
-        save_params = [int(cv2.IMWRITE_PNG_COMPRESSION), 1] if optimize_for_speed else []
-        success = cv2.imwrite(save_path, screenshot_bgr, save_params)
+                screenshot_bgr = resize_into(screenshot_bgr, scale, pool)
         
-        if success and not optimize_for_speed:
-            # 获取文件信息
-            file_size = os.path.getsize(save_path) / 1024  # KB
-            img_height, img_width, _ = screenshot_bgr.shape
-            
+        # 帧的缩放比例相对鼠标坐标计算，包含显示器自身的DPI比例
+        frame = ScreenFrame(screenshot_bgr, scale * pixel_scale, screen_width, screen_height, timestamp,
+                            offset_x=offset_x, offset_y=offset_y,
+                            full_image=full_image, full_scale=pixel_scale)
+        
+        if save_path is not None:
+            if not frame.save(save_path, optimize_for_speed):
+                print("保存图像失败")
+        
+        if not optimize_for_speed:
             print(f"截屏成功！")
-            print(f"保存路径: {os.path.abspath(save_path)}")
-            print(f"图像尺寸: {img_width} x {img_height} 像素")
-            print(f"文件大小: {file_size:.2f} KB")
+            print(f"图像尺寸: {frame.width} x {frame.height} 像素")
             print(f"处理耗时: {(time.time() - start_time):.2f} 秒")
-        elif not success:
-            print("保存图像失败")
-            
-        return success, scale
+        
+        return frame
 
     except Exception as e:
         print(f"截屏过程中发生错误: {e}")
-        return False, scale
+        return None
+
+def capture_screen_and_save(save_path=None, optimize_for_speed=True, max_png=1280):
+    """
+    使用OpenCV实现自动截屏并保存到指定路径
+    
+    参数:
+        save_path: 保存路径，默认为"imgs/screen.png"（在Mac App环境下会自动调整为资源包路径）
+        optimize_for_speed: 是否优化速度（减少日志和使用更快的保存参数）
+        max_png: 图片最大尺寸限制
+    """
+    # 如果未提供save_path，使用默认路径
+    if save_path is None:
+        default_imgs_path = get_default_imgs_path()
+        save_path = os.path.join(default_imgs_path, "screen.png")
+    
+    frame = capture_screen_frame(optimize_for_speed=optimize_for_speed, max_png=max_png)
+    if frame is None:
+        return False, 1
+    
+    success = frame.save(save_path, optimize_for_speed)
+    if success and not optimize_for_speed:
+        print(f"保存路径: {os.path.abspath(save_path)}")
+    elif not success:
+        print("保存图像失败")
+    return success, frame.scale
 
-def mark_coordinate_on_image(coordinates, input_path=None, output_path=None, point_radius=10, point_color=(0, 0, 255), thickness=-1):
+def mark_coordinate_on_image(coordinates, input_path=None, output_path=None, point_radius=10, point_color=(0, 0, 255), thickness=-1, image=None, copy_image=True):
     """
     在图片上标记指定坐标点
     
@@ -88,6 +202,8 @@ def mark_coordinate_on_image(coordinates, input_path=None, output_path=None, poi
         point_radius: 标记点的半径
         point_color: 标记点的颜色，使用BGR格式，默认为红色(0, 0, 255)
         thickness: 线条粗细，-1表示填充
+        image: 内存中的BGR图像，提供时不再读取input_path（在副本上绘制）
+        copy_image: 为False时直接在image上绘制（调用方已持有独立副本时使用）
     
     返回:
         bool: 标记成功返回True，失败返回False
@@ -105,14 +221,19 @@ def mark_coordinate_on_image(coordinates, input_path=None, output_path=None, poi
     elif not os.path.isabs(output_path) and is_mac_app():
         output_path = get_resource_file_path(output_path)
     try:
-        # 检查输入文件是否存在
-        if not os.path.exists(input_path):
-            return False
-        
-        # 读取图片
-        image = cv2.imread(input_path)
-        if image is None:
-            return False
+        if image is not None:
+            # 使用内存中的图像，复制后绘制以免修改原始帧
+            if copy_image:
+                image = image.copy()
+        else:
+            # 检查输入文件是否存在
+            if not os.path.exists(input_path):
+                return False
+            
+            # 读取图片
+            image = cv2.imread(input_path)
+            if image is None:
+                return False
         
         # 获取图片尺寸
         img_height, img_width = image.shape[:2]
@@ -176,7 +297,7 @@ def mark_coordinate_on_image(coordinates, input_path=None, output_path=None, poi
         return False
 
 # 坐标映射
-def map_coordinates(x, y, scale, img_width=None, img_height=None):
+def map_coordinates(x, y, scale, img_width=None, img_height=None, offset_x=0, offset_y=0):
     """
     将坐标映射到实际屏幕上
     
@@ -186,6 +307,8 @@ def map_coordinates(x, y, scale, img_width=None, img_height=None):
         scale: 图像缩放比例
         img_width: 图像实际宽度
         img_height: 图像实际高度
+        offset_x: 图像左上角在屏幕上的x坐标（区域放大截图的裁剪偏移）
+        offset_y: 图像左上角在屏幕上的y坐标
     
     返回:
         tuple: 实际屏幕上的坐标
@@ -204,13 +327,13 @@ def map_coordinates(x, y, scale, img_width=None, img_height=None):
         x_abs = x
         y_abs = y
     
-    # 应用缩放比例映射到实际屏幕
-    x_r = x_abs / scale
-    y_r = y_abs / scale
+    # 应用缩放比例映射到实际屏幕，再加上裁剪区域的偏移
+    x_r = x_abs / scale + offset_x
+    y_r = y_abs / scale + offset_y
     
-    # 确保最终坐标在有效范围内
-    x_r = max(0, min(100000, x_r))
-    y_r = max(0, min(100000, y_r))
+    # 确保最终坐标在有效范围内（主屏左侧/上方的显示器坐标为负数）
+    x_r = max(min(0, offset_x), min(100000, x_r))
+    y_r = max(min(0, offset_y), min(100000, y_r))
     
     return x_r, y_r
 
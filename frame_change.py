@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+画面变化检测模块
+通过缩小后的灰度缩略图比较相邻截图，在屏幕没有变化时跳过视觉模型调用
+"""
+import time
+
+import cv2
+import numpy as np
+
+
+def make_thumbnail(image, width=160):
+    """
+    生成用于比较的灰度缩略图
+
+    参数:
+        image: BGR格式的图像
+        width: 缩略图宽度，高度按比例计算
+
+    返回:
+        numpy.ndarray: uint8灰度缩略图
+    """
+    height, img_width = image.shape[:2]
+    thumb_height = max(1, int(round(height * width / img_width)))
+    small = cv2.resize(image, (width, thumb_height), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return small
+
+
+class FrameChangeDetector:
+    """
+    画面变化检测器
+
+    记录最近一次执行了操作的画面缩略图，新截图与之比较：
+    灰度差超过pixel_threshold的像素占比超过change_ratio时认为画面发生了变化
+    """
+
+    def __init__(self, thumbnail_width=160, pixel_threshold=10, change_ratio=0.001,
+                 recheck_interval=0.3, max_wait=5.0):
+        """
+        参数:
+            thumbnail_width: 缩略图宽度
+            pixel_threshold: 单个像素灰度差超过该值才算变化（过滤压缩噪声、抗锯齿抖动）
+            change_ratio: 变化像素占比超过该值认为画面已变化
+            recheck_interval: 画面未变化时重新截图的间隔（秒）
+            max_wait: 等待画面变化的最长时间（秒），超时后仍会调用模型
+        """
+        self.thumbnail_width = thumbnail_width
+        self.pixel_threshold = pixel_threshold
+        self.change_ratio = change_ratio
+        self.recheck_interval = recheck_interval
+        self.max_wait = max_wait
+        self.reset()
+
+    def reset(self):
+        """开始新任务时清空参考画面和统计"""
+        self.reference = None
+        self.saved_calls = 0
+        self.recaptures = 0
+
+    def thumbnail(self, frame):
+        """生成截图帧的比较缩略图"""
+        return make_thumbnail(frame.image, self.thumbnail_width)
+
+    def diff_ratio(self, thumb_a, thumb_b):
+        """返回两张缩略图之间变化像素的占比"""
+        if thumb_a.shape != thumb_b.shape:
+            return 1.0
+        diff = cv2.absdiff(thumb_a, thumb_b)
+        return np.count_nonzero(diff > self.pixel_threshold) / diff.size
+
+    def remember(self, frame):
+        """记录已据此执行了操作的画面，作为后续比较的参考"""
+        self.reference = self.thumbnail(frame)
+
+    def forget(self):
+        """清空参考画面（本步出错或未执行操作时调用），下一步不再等待画面变化"""
+        self.reference = None
+
+    def has_changed(self, frame):
+        """判断画面相对参考画面是否发生变化，没有参考画面时视为已变化"""
+        if self.reference is None:
+            return True
+        return self.diff_ratio(self.reference, self.thumbnail(frame)) > self.change_ratio
+
+    def wait_for_change(self, frame, capture, should_stop=None, sleep=time.sleep):
+        """
+        画面与参考画面相同时，在本地重复截图等待变化，而不是再次请求模型
+
+        参数:
+            frame: 当前截图帧
+            capture: 无参数的截图函数，返回新的ScreenFrame（失败返回None）
+            should_stop: 无参数函数，返回True时立即停止等待
+            sleep: 等待函数，可替换为能被停止打断的等待
+
+        返回:
+            tuple: (截图帧, 是否在等待期间检测到变化)
+        """
+        if self.has_changed(frame):
+            return frame, True
+
+        deadline = time.time() + self.max_wait
+        while time.time() < deadline:
+            if should_stop is not None and should_stop():
+                break
+            sleep(self.recheck_interval)
+            if should_stop is not None and should_stop():
+                break
+            new_frame = capture()
+            if new_frame is None:
+                continue
+            self.recaptures += 1
+            frame = new_frame
+            if self.has_changed(frame):
+                # 画面未变时本应发出的那次请求被省掉了
+                self.saved_calls += 1
+                return frame, True
+        return frame, False
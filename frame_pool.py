@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+帧缓冲池模块
+按形状预分配并循环复用截图、颜色转换和缩放使用的数组，避免每次循环都重新分配
+几十MB的大数组；同时提供100次截图循环的内存基准测试
+"""
+import sys
+import time
+import json
+import argparse
+import threading
+import subprocess
+import tracemalloc
+
+import cv2
+import numpy as np
+
+
+class FrameBufferPool:
+    """
+    帧缓冲池
+
+    每种 (形状, dtype) 预分配slots个数组并轮流使用。一个缓冲区在被再取用slots次之后
+    才会被覆盖，因此最近slots-1帧始终有效；需要更长时间保存的图像应自行复制
+    """
+
+    def __init__(self, slots=2):
+        self.slots = slots
+        self._buffers = {}
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def get(self, shape, dtype=np.uint8):
+        """
+        取出一个指定形状的缓冲区
+
+        参数:
+            shape: 数组形状
+            dtype: 数据类型
+
+        返回:
+            numpy.ndarray: 可直接作为cv2函数dst参数的连续数组（内容未初始化）
+        """
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            buffers = self._buffers.get(key)
+            if buffers is None:
+                buffers = [np.empty(shape, dtype=dtype) for _ in range(self.slots)]
+                self._buffers[key] = buffers
+                self._next[key] = 0
+            index = self._next[key]
+            self._next[key] = (index + 1) % self.slots
+            return buffers[index]
+
+    def clear(self):
+        """释放所有缓冲区（分辨率变化后调用）"""
+        with self._lock:
+            self._buffers.clear()
+            self._next.clear()
+
+    @property
+    def nbytes(self):
+        """缓冲池占用的总字节数"""
+        with self._lock:
+            return sum(buffer.nbytes for buffers in self._buffers.values() for buffer in buffers)
+
+
+def resize_into(image, scale, pool=None, interpolation=cv2.INTER_LINEAR):
+    """
+    按比例缩放图像，提供缓冲池时把结果写入池中的缓冲区
+
+    参数:
+        image: 源图像
+        scale: 缩放比例
+        pool: FrameBufferPool，为None时由OpenCV分配新数组
+        interpolation: 插值方法
+
+    返回:
+        numpy.ndarray: 缩放后的图像
+    """
+    height, width = image.shape[:2]
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    if pool is None:
+        return cv2.resize(image, size, interpolation=interpolation)
+    dst = pool.get((size[1], size[0]) + image.shape[2:], image.dtype)
+    return cv2.resize(image, size, dst=dst, interpolation=interpolation)
+
+
+# 截图流水线使用的全局缓冲池
+_capture_pool = FrameBufferPool()
+
+
+def get_capture_pool():
+    """获取截图流水线使用的缓冲池"""
+    return _capture_pool
+
+
+class _SyntheticBackend:
+    """基准测试用的模拟后端：每次截图从预先生成的4K BGRA原始数据转换，模拟mss/XShm的数据形态"""
+    name = "synthetic"
+
+    def __init__(self, width=3840, height=2160):
+        rng = np.random.default_rng(0)
+        self._raw = rng.integers(0, 256, size=(height, width, 4), dtype=np.uint8)
+
+    def grab(self, pool=None):
+        dst = pool.get(self._raw.shape[:2] + (3,)) if pool is not None else None
+        return cv2.cvtColor(self._raw, cv2.COLOR_BGRA2BGR, dst=dst)
+
+    def notify_action(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _peak_rss_mb():
+    """返回进程峰值常驻内存（MB），不支持的系统返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux下单位为KB，macOS下为字节
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def run_memory_benchmark(use_pool, iterations=100, backend_name="synthetic", max_png=1280):
+    """
+    运行截图流水线（截图 -> 颜色转换 -> 缩放）若干次并统计内存
+
+    参数:
+        use_pool: 是否使用缓冲池
+        iterations: 循环次数
+        backend_name: "synthetic"或screen_backends中的后端名称
+        max_png: 缩放后的最长边
+
+    返回:
+        dict: 峰值RSS、每次循环的临时分配量、分配速率和平均耗时
+    """
+    from cv_shot_doubao import capture_screen_frame
+    if backend_name == "synthetic":
+        backend = _SyntheticBackend()
+    else:
+        from screen_backends import create_capture_backend
+        backend = create_capture_backend(backend_name)
+
+    pool = FrameBufferPool() if use_pool else None
+    # 预热一次，让缓冲池完成预分配
+    capture_screen_frame(max_png=max_png, backend=backend, pool=pool)
+
+    tracemalloc.start()
+    allocated = 0
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        frame = capture_screen_frame(max_png=max_png, backend=backend, pool=pool)
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - before
+        del frame
+    elapsed = time.perf_counter() - start_time
+    tracemalloc.stop()
+    backend.close()
+
+    return {
+        "mode": "pooled" if use_pool else "baseline",
+        "iterations": iterations,
+        "peak_rss_mb": _peak_rss_mb(),
+        "alloc_per_iteration_mb": allocated / iterations / 1024 / 1024,
+        "alloc_rate_mb_s": allocated / elapsed / 1024 / 1024,
+        "ms_per_iteration": elapsed / iterations * 1000,
+    }
+
+
+def main():
+    """命令行入口：分别在子进程中运行未使用/使用缓冲池的流水线，对比峰值RSS和分配速率"""
+    parser = argparse.ArgumentParser(description="截图流水线内存基准测试")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--backend", default="synthetic", help="synthetic或截图后端名称")
+    parser.add_argument("--mode", choices=["baseline", "pooled"], help="仅运行一种模式并输出JSON（内部使用）")
+    args = parser.parse_args()
+
+    if args.mode:
+        result = run_memory_benchmark(args.mode == "pooled", args.iterations, args.backend)
+        print(json.dumps(result))
+        return
+
+    print(f"=== 截图流水线内存基准测试（{args.iterations} 次循环，后端: {args.backend}）===")
+    for mode in ("baseline", "pooled"):
+        # 每种模式在独立子进程中运行，峰值RSS互不影响
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--iterations", str(args.iterations),
+             "--backend", args.backend],
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        peak_rss = f"{result['peak_rss_mb']:.1f} MB" if result["peak_rss_mb"] is not None else "未知"
+        print(f"{mode:<10} 峰值RSS: {peak_rss:<12} 每次分配: {result['alloc_per_iteration_mb']:.1f} MB  "
+              f"分配速率: {result['alloc_rate_mb_s']:.0f} MB/s  耗时: {result['ms_per_iteration']:.1f} ms/次")
+
+
+if __name__ == "__main__":
+    main()
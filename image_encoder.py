@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+图片编码模块
+将截图编码为发送给视觉模型的图片数据，支持PNG压缩级别、JPEG/WebP质量和灰度选项，
+并提供对比各编码方案耗时与体积的基准测试
+"""
+import os
+import sys
+import time
+import base64
+import argparse
+
+import cv2
+
+
+# 默认编码参数：PNG压缩级别与原先cv2.imencode('.png')使用的OpenCV默认值相同（1，速度优先）
+DEFAULT_ENCODING = {
+    "format": "png",
+    "png_level": 1,
+    "quality": 85,
+    "grayscale": False
+}
+
+MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp"
+}
+
+
+class EncodedImage:
+    """
+    编码后的图片数据
+
+    属性:
+        data: 编码后的字节
+        mime_type: MIME类型
+        width: 图片宽度
+        height: 图片高度
+        encode_time: 编码耗时（秒）
+    """
+    def __init__(self, data, mime_type, width, height, encode_time):
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        self.encode_time = encode_time
+
+    @property
+    def size(self):
+        """编码后的字节数"""
+        return len(self.data)
+
+    def to_data_url(self):
+        """转换为base64的data URL"""
+        img_base64 = base64.b64encode(self.data).decode('utf-8')
+        return f"data:{self.mime_type};base64,{img_base64}"
+
+
+def encode_image(image, format="png", png_level=1, quality=85, grayscale=False):
+    """
+    按指定参数编码图片
+
+    参数:
+        image: BGR格式的图像
+        format: "png"、"jpeg"或"webp"
+        png_level: PNG压缩级别（0-9，越大越小越慢）
+        quality: JPEG/WebP质量（1-100）
+        grayscale: 是否转换为灰度图后编码
+
+    返回:
+        EncodedImage: 编码结果
+    """
+    format = format.lower()
+    if format == "jpg":
+        format = "jpeg"
+    if format not in MIME_TYPES:
+        raise ValueError(f"不支持的图片格式: {format}")
+
+    start_time = time.perf_counter()
+    if grayscale and image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    if format == "png":
+        params = [int(cv2.IMWRITE_PNG_COMPRESSION), int(png_level)]
+        extension = ".png"
+    elif format == "jpeg":
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]
+        extension = ".jpg"
+    else:
+        params = [int(cv2.IMWRITE_WEBP_QUALITY), int(quality)]
+        extension = ".webp"
+
+    success, buffer = cv2.imencode(extension, image, params)
+    if not success:
+        raise RuntimeError(f"图片编码失败: {format}")
+    height, width = image.shape[:2]
+    return EncodedImage(buffer.tobytes(), MIME_TYPES[format], width, height,
+                        time.perf_counter() - start_time)
+
+
+def get_encoding_for_model(encoding_config, model_name):
+    """
+    获取指定模型使用的编码参数
+
+    参数:
+        encoding_config: 配置文件中的image_encoding_config，
+            {"default": {...}, "models": {"模型名": {...}}}
+        model_name: 模型名称
+
+    返回:
+        dict: 合并了默认值后的编码参数
+    """
+    settings = dict(DEFAULT_ENCODING)
+    if not encoding_config:
+        return settings
+    settings.update(encoding_config.get("default", {}))
+    settings.update(encoding_config.get("models", {}).get(model_name, {}))
+    return settings
+
+
+def encode_with_settings(image, settings):
+    """按配置字典编码图片"""
+    return encode_image(
+        image,
+        format=settings.get("format", DEFAULT_ENCODING["format"]),
+        png_level=settings.get("png_level", DEFAULT_ENCODING["png_level"]),
+        quality=settings.get("quality", DEFAULT_ENCODING["quality"]),
+        grayscale=settings.get("grayscale", DEFAULT_ENCODING["grayscale"])
+    )
+
+
+# 基准测试默认比较的编码方案
+BENCHMARK_SETTINGS = [
+    {"format": "png", "png_level": 1},
+    {"format": "png", "png_level": 3},
+    {"format": "png", "png_level": 6},
+    {"format": "png", "png_level": 3, "grayscale": True},
+    {"format": "jpeg", "quality": 95},
+    {"format": "jpeg", "quality": 85},
+    {"format": "jpeg", "quality": 70},
+    {"format": "jpeg", "quality": 85, "grayscale": True},
+    {"format": "webp", "quality": 90},
+    {"format": "webp", "quality": 75},
+]
+
+
+def describe_settings(settings):
+    """生成编码方案的简短描述"""
+    format = settings.get("format", "png")
+    if format == "png":
+        text = f"png level={settings.get('png_level', DEFAULT_ENCODING['png_level'])}"
+    else:
+        text = f"{format} q={settings.get('quality', DEFAULT_ENCODING['quality'])}"
+    if settings.get("grayscale"):
+        text += " gray"
+    return text
+
+
+def measure_upload(url, payload, timeout=30):
+    """
+    把payload以POST方式发送到url，返回实际上传耗时（秒）
+    """
+    import urllib.request
+    request = urllib.request.Request(url, data=payload, method="POST",
+                                     headers={"Content-Type": "application/octet-stream"})
+    start_time = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+    return time.perf_counter() - start_time
+
+
+def benchmark_encodings(images, settings_list=BENCHMARK_SETTINGS, upload_mbps=10.0, upload_url=None, rounds=3):
+    """
+    对比各编码方案
+
+    参数:
+        images: BGR图像列表
+        settings_list: 参与比较的编码参数列表
+        upload_mbps: 估算上传耗时使用的上行带宽（Mbit/s）
+        upload_url: 提供时实际POST base64数据并计时，否则按带宽估算
+        rounds: 每张图片编码次数，取平均耗时
+
+    返回:
+        list: 每个方案一个字典，包含平均编码耗时、base64载荷字节数和上传耗时
+    """
+    results = []
+    for settings in settings_list:
+        encode_times = []
+        payload_sizes = []
+        upload_times = []
+        for image in images:
+            for _ in range(rounds):
+                encoded = encode_with_settings(image, settings)
+                encode_times.append(encoded.encode_time)
+            payload = encoded.to_data_url().encode("utf-8")
+            payload_sizes.append(len(payload))
+            if upload_url:
+                upload_times.append(measure_upload(upload_url, payload))
+            else:
+                upload_times.append(len(payload) * 8 / (upload_mbps * 1000 * 1000))
+        count = len(images)
+        results.append({
+            "settings": settings,
+            "description": describe_settings(settings),
+            "encode_ms": sum(encode_times) / len(encode_times) * 1000,
+            "payload_bytes": sum(payload_sizes) / count,
+            "upload_ms": sum(upload_times) / count * 1000,
+        })
+    for row in results:
+        row["total_ms"] = row["encode_ms"] + row["upload_ms"]
+    return results
+
+
+def load_sample_images(paths):
+    """读取图片文件或文件夹中的所有图片"""
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                     if name.lower().endswith((".png", ".jpg", ".jpeg", ".bmp", ".webp"))]
+        else:
+            files = [path]
+        for file in files:
+            image = cv2.imread(file)
+            if image is not None:
+                images.append(image)
+    return images
+
+
+def main():
+    """命令行入口：python image_encoder.py [图片或文件夹 ...] --upload-mbps 10"""
+    parser = argparse.ArgumentParser(description="图片编码方案基准测试")
+    parser.add_argument("paths", nargs="*", default=["imgs"], help="示例截图文件或文件夹")
+    parser.add_argument("--upload-mbps", type=float, default=10.0, help="估算上传耗时使用的上行带宽（Mbit/s）")
+    parser.add_argument("--upload-url", default=None, help="实际上传测试的HTTP地址（可选）")
+    parser.add_argument("--max-png", type=int, default=1280, help="编码前将图片最长边缩小到该尺寸")
+    args = parser.parse_args()
+
+    images = load_sample_images(args.paths)
+    if not images:
+        print("没有找到示例截图")
+        sys.exit(1)
+
+    # 与实际运行时一致，先按max_png缩小
+    resized = []
+    for image in images:
+        height, width = image.shape[:2]
+        scale = min(1.0, args.max_png / max(height, width))
+        if scale < 1.0:
+            image = cv2.resize(image, None, fx=scale, fy=scale)
+        resized.append(image)
+
+    print(f"=== 图片编码基准测试（{len(resized)} 张截图）===")
+    print(f"{'方案':<20}{'编码(ms)':>10}{'载荷(KB)':>12}{'上传(ms)':>10}{'合计(ms)':>10}")
+    results = benchmark_encodings(resized, upload_mbps=args.upload_mbps, upload_url=args.upload_url)
+    for row in sorted(results, key=lambda item: item["total_ms"]):
+        print(f"{row['description']:<20}{row['encode_ms']:>10.1f}{row['payload_bytes'] / 1024:>12.1f}"
+              f"{row['upload_ms']:>10.1f}{row['total_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
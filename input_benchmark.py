@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+输入执行器延迟基准测试
+在同一个X显示（通常是Xvfb虚拟桌面）上依次用各个执行器重复执行移动、点击、快捷键、滚动、拖拽和输入文本，
+每次操作后等待X服务器处理完事件再计时，输出每种操作的p50/p95延迟
+
+用法:
+    xvfb-run -s "-screen 0 1920x1080x24" python input_benchmark.py
+    python input_benchmark.py --xvfb --backends xtest,pyautogui,pyautogui:0.1 --iterations 100
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+
+from input_executor import create_executor
+from text_input import TextInput
+
+
+# 输入文本操作使用的短消息（含键盘上没有的中文字符）
+SAMPLE_TEXT = "晚上好，see you at 8"
+
+
+# 测量的操作：名称 -> 执行函数（参数为执行器和本次迭代序号）
+ACTIONS = {
+    "move": lambda executor, index: executor.move_to(100 + index % 500, 200),
+    "click": lambda executor, index: _batched(executor, lambda: (executor.move_to(300, 300 + index % 200),
+                                                                 executor.click())),
+    "double_click": lambda executor, index: executor.double_click(),
+    "hotkey": lambda executor, index: executor.hotkey("ctrl", "a"),
+    "press": lambda executor, index: executor.press("enter"),
+    "scroll": lambda executor, index: executor.scroll(-5),
+    "drag": lambda executor, index: (executor.move_to(400, 400), executor.drag_to(600, 500)),
+    "type": lambda executor, index: _text_input(executor).enter(SAMPLE_TEXT, submit=False),
+}
+
+# 每个执行器的文本输入引擎（保留auto改用粘贴的判断，不在每次迭代中重新尝试）
+_text_inputs = {}
+
+
+def _text_input(executor):
+    if executor not in _text_inputs:
+        _text_inputs[executor] = TextInput(executor, focus_delay=0.0)
+    return _text_inputs[executor]
+
+
+def _batched(executor, operations):
+    with executor.batch():
+        operations()
+
+
+def _percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(ratio * (len(ordered) - 1))))]
+
+
+def start_xvfb(display=":99", screen="1920x1080x24"):
+    """启动Xvfb虚拟桌面并设置DISPLAY，返回进程（未安装Xvfb时返回None）"""
+    if not shutil.which("Xvfb"):
+        return None
+    process = subprocess.Popen(["Xvfb", display, "-screen", "0", screen, "-nolisten", "tcp"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ["DISPLAY"] = display
+    # 等待X服务器开始接受连接
+    socket_path = f"/tmp/.X11-unix/X{display.lstrip(':')}"
+    deadline = time.time() + 5
+    while time.time() < deadline and not os.path.exists(socket_path):
+        time.sleep(0.05)
+    return process
+
+
+def create_backend(spec):
+    """按 名称[:pyautogui隐式等待秒数] 创建执行器，例如 pyautogui:0.1 为pyautogui的默认设置"""
+    name, _, pause = spec.partition(":")
+    return create_executor(name, pause=float(pause) if pause else 0.0)
+
+
+def measure(executor, iterations):
+    """
+    测量执行器每种操作的延迟（包括等待X服务器处理完事件）
+
+    返回:
+        dict: {操作: {"p50", "p95", "mean"}}（秒）
+    """
+    results = {}
+    for action, run in ACTIONS.items():
+        samples = []
+        for index in range(iterations):
+            start = time.perf_counter()
+            run(executor, index)
+            executor.sync()
+            samples.append(time.perf_counter() - start)
+        results[action] = {"p50": _percentile(samples, 0.5), "p95": _percentile(samples, 0.95),
+                           "mean": sum(samples) / len(samples)}
+    return results
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="输入执行器延迟基准测试（在Xvfb虚拟桌面上运行）")
+    parser.add_argument("--backends", default="xtest,pyautogui,pyautogui:0.1,dry_run",
+                        help="逗号分隔的执行器，pyautogui:0.1 表示pyautogui默认的隐式等待")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--xvfb", action="store_true", help="没有DISPLAY时自动启动Xvfb")
+    parser.add_argument("--json", default=None, help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    xvfb = None
+    if args.xvfb and not os.environ.get("DISPLAY"):
+        xvfb = start_xvfb()
+        if xvfb is None:
+            print("未找到Xvfb，无法启动虚拟桌面")
+            return 1
+    try:
+        report = {}
+        for spec in args.backends.split(","):
+            try:
+                executor = create_backend(spec)
+            except Exception as e:
+                print(f"{spec}: 不可用（{e}）")
+                continue
+            try:
+                report[spec] = measure(executor, args.iterations)
+            finally:
+                executor.close()
+
+        print(f"\n=== 输入执行器延迟（每种操作 {args.iterations} 次，DISPLAY={os.environ.get('DISPLAY')}）===")
+        print(f"{'执行器':<16}" + "".join(f"{action:>16}" for action in ACTIONS))
+        for spec, results in report.items():
+            row = "".join(f"{results[action]['p50'] * 1000:8.2f}/{results[action]['p95'] * 1000:<7.2f}"
+                          for action in ACTIONS)
+            print(f"{spec:<16}{row}")
+        print("（单位ms，p50/p95）")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+    sys.stdout.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,644 @@
+# -*- coding: utf-8 -*-
+"""
+输入执行模块
+鼠标、键盘和剪贴板操作统一通过执行器完成：xtest执行器在Linux X11下通过XTest扩展直接注入输入事件，
+pyautogui执行器兼容所有平台，dry_run执行器只记录操作不产生任何输入，配合回放截图后端在无桌面环境下运行完整的主循环。
+执行器之间的固定等待统一由调用方通过pause()控制，执行器本身不附加隐式等待。
+type_text()直接注入Unicode文本（不经过剪贴板），当前平台不支持时抛出NotImplementedError，由调用方改用粘贴
+"""
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import threading
+from contextlib import contextmanager
+
+from clipboard_owner import create_clipboard
+
+
+# Windows SendInput的结构体，INPUT的联合体大小以最大的MOUSEINPUT为准
+class _MOUSEINPUT(ctypes.Structure):
+    _fields_ = [("dx", ctypes.c_long), ("dy", ctypes.c_long), ("mouseData", ctypes.c_uint32),
+                ("dwFlags", ctypes.c_uint32), ("time", ctypes.c_uint32), ("dwExtraInfo", ctypes.c_size_t)]
+
+
+class _KEYBDINPUT(ctypes.Structure):
+    _fields_ = [("wVk", ctypes.c_ushort), ("wScan", ctypes.c_ushort), ("dwFlags", ctypes.c_uint32),
+                ("time", ctypes.c_uint32), ("dwExtraInfo", ctypes.c_size_t)]
+
+
+class _INPUTUNION(ctypes.Union):
+    _fields_ = [("mi", _MOUSEINPUT), ("ki", _KEYBDINPUT)]
+
+
+class _INPUT(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_uint32), ("union", _INPUTUNION)]
+
+
+INPUT_KEYBOARD = 1
+KEYEVENTF_KEYUP = 0x0002
+KEYEVENTF_UNICODE = 0x0004
+
+# macOS单个键盘事件最多携带的UTF-16字符数
+QUARTZ_UNICODE_CHUNK = 20
+
+
+def _utf16_units(text):
+    data = text.encode("utf-16-le")
+    return [int.from_bytes(data[index:index + 2], "little") for index in range(0, len(data), 2)]
+
+
+def send_unicode_input(text):
+    """Windows下用SendInput的KEYEVENTF_UNICODE逐个发送UTF-16字符，一次调用发送全部按下和抬起事件"""
+    units = _utf16_units(text)
+    events = (_INPUT * (len(units) * 2))()
+    for index, unit in enumerate(units):
+        for offset, flags in enumerate((KEYEVENTF_UNICODE, KEYEVENTF_UNICODE | KEYEVENTF_KEYUP)):
+            event = events[index * 2 + offset]
+            event.type = INPUT_KEYBOARD
+            event.union.ki.wScan = unit
+            event.union.ki.dwFlags = flags
+    sent = ctypes.windll.user32.SendInput(len(events), events, ctypes.sizeof(_INPUT))
+    if sent != len(events):
+        # 目标窗口权限更高（UIPI）等情况下事件会被拒绝
+        raise OSError(f"SendInput只发送了 {sent}/{len(events)} 个事件")
+
+
+def post_unicode_quartz(text):
+    """macOS下用CGEventKeyboardSetUnicodeString发送文本，每个事件最多携带20个UTF-16字符"""
+    try:
+        import Quartz
+    except ImportError:
+        raise NotImplementedError("未安装pyobjc（Quartz），无法直接输入文本")
+    chunks = [""]
+    for char in text:
+        if len(_utf16_units(chunks[-1] + char)) > QUARTZ_UNICODE_CHUNK:
+            chunks.append("")
+        chunks[-1] += char
+    for chunk in chunks:
+        length = len(_utf16_units(chunk))
+        for down in (True, False):
+            event = Quartz.CGEventCreateKeyboardEvent(None, 0, down)
+            Quartz.CGEventKeyboardSetUnicodeString(event, length, chunk)
+            Quartz.CGEventPost(Quartz.kCGHIDEventTap, event)
+
+
+class PyAutoGUIExecutor:
+    """
+    使用pyautogui操作真实桌面
+
+    pyautogui默认在每次调用后等待PAUSE（0.1秒），这里按pause参数设置，默认不等待。
+    pyautogui.write只能输入键盘上有的字符，直接输入文本在Windows下使用SendInput，在macOS下使用Quartz
+    """
+    name = "pyautogui"
+
+    def __init__(self, failsafe=False, pause=0.0):
+        import pyautogui
+        pyautogui.FAILSAFE = failsafe
+        pyautogui.PAUSE = pause
+        self._gui = pyautogui
+        self._clipboard = None
+
+    @contextmanager
+    def batch(self):
+        # pyautogui每次调用立即执行，没有可合并的事件
+        yield self
+
+    def move_to(self, x, y, duration=0.0, pause=True):
+        if pause:
+            self._gui.moveTo(x, y, duration=duration)
+        else:
+            self._gui.moveTo(x, y, duration=duration, _pause=False)
+
+    def click(self):
+        self._gui.click()
+
+    def double_click(self):
+        self._gui.doubleClick()
+
+    def right_click(self):
+        self._gui.rightClick()
+
+    def mouse_down(self):
+        self._gui.mouseDown()
+
+    def mouse_up(self):
+        self._gui.mouseUp()
+
+    def drag_to(self, x, y, duration=0.0):
+        self._gui.dragTo(x, y, duration=duration)
+
+    def scroll(self, amount):
+        self._gui.scroll(amount)
+
+    def hotkey(self, *keys):
+        self._gui.hotkey(*keys)
+
+    def press(self, key):
+        self._gui.press(key)
+
+    def key_down(self, key):
+        self._gui.keyDown(key)
+
+    def key_up(self, key):
+        self._gui.keyUp(key)
+
+    def type_text(self, text):
+        if sys.platform == "win32":
+            send_unicode_input(text)
+        elif sys.platform == "darwin":
+            post_unicode_quartz(text)
+        else:
+            raise NotImplementedError("pyautogui执行器在当前平台不支持直接输入Unicode文本")
+
+    def copy_text(self, text):
+        if self._clipboard is None:
+            self._clipboard = create_clipboard()
+        self._clipboard.copy(text)
+
+    def pause(self, seconds):
+        time.sleep(seconds)
+
+    def sync(self):
+        # pyautogui的每次调用都是同步完成的
+        pass
+
+    def close(self):
+        if self._clipboard is not None and hasattr(self._clipboard, "close"):
+            self._clipboard.close()
+        self._clipboard = None
+
+
+# X11 按键名（pyautogui的写法）到keysym名称的映射，单个字母和数字直接使用字符本身
+X11_KEY_NAMES = {
+    "ctrl": "Control_L", "ctrlleft": "Control_L", "ctrlright": "Control_R",
+    "shift": "Shift_L", "shiftleft": "Shift_L", "shiftright": "Shift_R",
+    "alt": "Alt_L", "altleft": "Alt_L", "altright": "Alt_R", "option": "Alt_L",
+    "win": "Super_L", "winleft": "Super_L", "winright": "Super_R", "super": "Super_L",
+    "meta": "Super_L", "command": "Super_L", "cmd": "Super_L",
+    "enter": "Return", "return": "Return", "\n": "Return",
+    "esc": "Escape", "escape": "Escape",
+    "backspace": "BackSpace", "delete": "Delete", "del": "Delete", "insert": "Insert",
+    "tab": "Tab", "\t": "Tab", "space": "space", " ": "space",
+    "up": "Up", "down": "Down", "left": "Left", "right": "Right",
+    "home": "Home", "end": "End", "pageup": "Prior", "pgup": "Prior", "pagedown": "Next", "pgdn": "Next",
+    "capslock": "Caps_Lock", "numlock": "Num_Lock", "printscreen": "Print", "prtsc": "Print",
+    "volumeup": "XF86AudioRaiseVolume", "volumedown": "XF86AudioLowerVolume", "volumemute": "XF86AudioMute",
+    ",": "comma", ".": "period", "/": "slash", ";": "semicolon", "'": "apostrophe", "[": "bracketleft",
+    "]": "bracketright", "\\": "backslash", "-": "minus", "=": "equal", "`": "grave",
+    **{f"f{number}": f"F{number}" for number in range(1, 25)},
+}
+
+# X11鼠标按键编号
+X11_BUTTONS = {"left": 1, "middle": 2, "right": 3, "scroll_up": 4, "scroll_down": 5}
+
+# 临时映射的keycode在恢复前等待的时间（秒），留给按自己的节奏重新读取键盘映射的程序
+XTEST_REMAP_DELAY = 0.02
+
+
+def char_keysym(char):
+    """字符转为keysym：Latin-1字符的keysym等于码位，其他字符为0x01000000加码位"""
+    code = ord(char)
+    if char == "\t":
+        return 0xff09
+    if char in "\r\n":
+        return 0xff0d
+    if 0x20 <= code <= 0x7e or 0xa0 <= code <= 0xff:
+        return code
+    return 0x01000000 | code
+
+
+class XTestExecutor:
+    """
+    通过XTest扩展直接注入输入事件（仅Linux X11）
+
+    使用ctypes调用libX11和libXtst，不经过pyautogui的Python Xlib实现，也没有隐式等待。
+    事件先写入Xlib的发送缓冲区，每个操作结束时统一XFlush；batch()内的多个操作合并为一次XFlush，
+    例如移动鼠标后点击、组合键的按下和抬起只产生一次往返。带duration的移动按约60Hz分段发送
+    """
+    name = "xtest"
+
+    def __init__(self, display=None):
+        """
+        参数:
+            display: X显示名，为None时使用DISPLAY环境变量
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError("XTest执行器仅支持Linux X11")
+        x11_path = ctypes.util.find_library("X11")
+        xtst_path = ctypes.util.find_library("Xtst")
+        if not x11_path or not xtst_path:
+            raise OSError("未找到libX11或libXtst")
+        self._x11 = ctypes.cdll.LoadLibrary(x11_path)
+        self._xtst = ctypes.cdll.LoadLibrary(xtst_path)
+        self._x11.XOpenDisplay.restype = ctypes.c_void_p
+        self._x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        self._x11.XFlush.argtypes = [ctypes.c_void_p]
+        self._x11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self._x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self._x11.XStringToKeysym.restype = ctypes.c_ulong
+        self._x11.XStringToKeysym.argtypes = [ctypes.c_char_p]
+        self._x11.XKeysymToKeycode.restype = ctypes.c_ubyte
+        self._x11.XKeysymToKeycode.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        self._x11.XKeycodeToKeysym.restype = ctypes.c_ulong
+        self._x11.XKeycodeToKeysym.argtypes = [ctypes.c_void_p, ctypes.c_ubyte, ctypes.c_int]
+        self._x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        self._x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        self._x11.XQueryPointer.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(ctypes.c_ulong),
+                                            ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_int),
+                                            ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int),
+                                            ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_uint)]
+        self._xtst.XTestFakeMotionEvent.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                                    ctypes.c_ulong]
+        self._xtst.XTestFakeButtonEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_ulong]
+        self._xtst.XTestFakeKeyEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_ulong]
+        self._x11.XDisplayKeycodes.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_int),
+                                               ctypes.POINTER(ctypes.c_int)]
+        self._x11.XGetKeyboardMapping.restype = ctypes.POINTER(ctypes.c_ulong)
+        self._x11.XGetKeyboardMapping.argtypes = [ctypes.c_void_p, ctypes.c_ubyte, ctypes.c_int,
+                                                  ctypes.POINTER(ctypes.c_int)]
+        self._x11.XChangeKeyboardMapping.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int,
+                                                     ctypes.POINTER(ctypes.c_ulong), ctypes.c_int]
+        self._x11.XFree.argtypes = [ctypes.c_void_p]
+        name = display if display is not None else os.environ.get("DISPLAY")
+        self._display = self._x11.XOpenDisplay(name.encode() if name else None)
+        if not self._display:
+            raise OSError(f"无法连接X显示: {name}")
+        # 主循环在事件循环线程（流式提前移动）和工作线程（执行操作）中都会调用执行器，
+        # 同一个Display连接不能并发使用
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        self._keycodes = {}
+        self._clipboard = None
+        self._root = self._x11.XDefaultRootWindow(self._display)
+        self.position = self._query_pointer() or (0, 0)
+
+    def _flush(self):
+        if self._batch_depth == 0:
+            self._x11.XFlush(self._display)
+
+    @contextmanager
+    def batch(self):
+        """合并多个操作的事件，退出时一次发送"""
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                self._flush()
+
+    def _key_info(self, key):
+        """按键名转为 (keycode, 是否需要按住shift)，无法映射时抛出ValueError"""
+        if key in self._keycodes:
+            return self._keycodes[key]
+        name = X11_KEY_NAMES.get(key.lower() if len(key) > 1 else key, key)
+        if len(name) == 1:
+            # 单个字符（如 "!"、"+"）没有同名的keysym名称，按码位换算
+            keysym = char_keysym(name)
+        else:
+            keysym = self._x11.XStringToKeysym(name.encode("utf-8"))
+        keycode = self._x11.XKeysymToKeycode(self._display, keysym) if keysym else 0
+        if not keycode:
+            raise ValueError(f"无法映射按键: {key}")
+        # 大写字母和需要shift的符号（如 "A"、"!"、"+"）在该键的第二级
+        shifted = (self._x11.XKeycodeToKeysym(self._display, keycode, 0) != keysym
+                   and self._x11.XKeycodeToKeysym(self._display, keycode, 1) == keysym)
+        self._keycodes[key] = (keycode, shifted)
+        return keycode, shifted
+
+    def keycode(self, key):
+        """按键名转为当前键盘映射中的keycode，无法映射时抛出ValueError"""
+        return self._key_info(key)[0]
+
+    def _query_pointer(self):
+        """读取指针的实际位置，指针不在本屏幕上时返回None"""
+        root, child = ctypes.c_ulong(), ctypes.c_ulong()
+        root_x, root_y, win_x, win_y = ctypes.c_int(), ctypes.c_int(), ctypes.c_int(), ctypes.c_int()
+        mask = ctypes.c_uint()
+        if not self._x11.XQueryPointer(self._display, self._root, ctypes.byref(root), ctypes.byref(child),
+                                       ctypes.byref(root_x), ctypes.byref(root_y), ctypes.byref(win_x),
+                                       ctypes.byref(win_y), ctypes.byref(mask)):
+            return None
+        return root_x.value, root_y.value
+
+    def _motion(self, x, y):
+        self._xtst.XTestFakeMotionEvent(self._display, -1, int(round(x)), int(round(y)), 0)
+        self.position = (x, y)
+
+    def _button(self, button, press):
+        self._xtst.XTestFakeButtonEvent(self._display, X11_BUTTONS[button], 1 if press else 0, 0)
+
+    def _key(self, key, press):
+        keycode, shifted = self._key_info(key)
+        # 第二级的按键在按下前按住shift，抬起后松开
+        if shifted and press:
+            self._xtst.XTestFakeKeyEvent(self._display, self.keycode("shift"), 1, 0)
+        self._xtst.XTestFakeKeyEvent(self._display, keycode, 1 if press else 0, 0)
+        if shifted and not press:
+            self._xtst.XTestFakeKeyEvent(self._display, self.keycode("shift"), 0, 0)
+
+    def _glide(self, x, y, duration):
+        """带duration时按约60Hz分段移动，每段立即发送以保留移动轨迹"""
+        steps = max(1, int(duration * 60))
+        # 用户或其他程序可能移动过鼠标，从指针的实际位置开始
+        start_x, start_y = self._query_pointer() or self.position
+        for step in range(1, steps + 1):
+            ratio = step / steps
+            self._motion(start_x + (x - start_x) * ratio, start_y + (y - start_y) * ratio)
+            if step < steps:
+                self._x11.XFlush(self._display)
+                time.sleep(duration / steps)
+
+    def move_to(self, x, y, duration=0.0, pause=True):
+        with self._lock:
+            if duration > 0:
+                self._glide(x, y, duration)
+            else:
+                self._motion(x, y)
+            self._flush()
+
+    def _click(self, button, count=1):
+        with self._lock:
+            for _ in range(count):
+                self._button(button, True)
+                self._button(button, False)
+            self._flush()
+
+    def click(self):
+        self._click("left")
+
+    def double_click(self):
+        self._click("left", 2)
+
+    def right_click(self):
+        self._click("right")
+
+    def mouse_down(self):
+        with self._lock:
+            self._button("left", True)
+            self._flush()
+
+    def mouse_up(self):
+        with self._lock:
+            self._button("left", False)
+            self._flush()
+
+    def drag_to(self, x, y, duration=0.0):
+        with self._lock:
+            self._button("left", True)
+            self._x11.XFlush(self._display)
+            self._glide(x, y, duration)
+            self._button("left", False)
+            self._flush()
+
+    def scroll(self, amount):
+        # 与pyautogui在X11下的行为一致：amount为滚轮点击次数，正数向上
+        with self._lock:
+            button = "scroll_up" if amount > 0 else "scroll_down"
+            for _ in range(abs(int(amount))):
+                self._button(button, True)
+                self._button(button, False)
+            self._flush()
+
+    def hotkey(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._key(key, True)
+            for key in reversed(keys):
+                self._key(key, False)
+            self._flush()
+
+    def press(self, key):
+        with self._lock:
+            self._key(key, True)
+            self._key(key, False)
+            self._flush()
+
+    def key_down(self, key):
+        with self._lock:
+            self._key(key, True)
+            self._flush()
+
+    def key_up(self, key):
+        with self._lock:
+            self._key(key, False)
+            self._flush()
+
+    def _keyboard_mapping(self):
+        """
+        读取当前键盘映射
+
+        返回:
+            tuple: (每个keycode的keysym数, {keysym: (keycode, 是否需要shift)}, 没有任何keysym的空闲keycode列表)
+        """
+        first, last = ctypes.c_int(), ctypes.c_int()
+        self._x11.XDisplayKeycodes(self._display, ctypes.byref(first), ctypes.byref(last))
+        per_keycode = ctypes.c_int()
+        count = last.value - first.value + 1
+        table = self._x11.XGetKeyboardMapping(self._display, first.value, count, ctypes.byref(per_keycode))
+        per = per_keycode.value
+        keysyms = {}
+        spare = []
+        try:
+            for index in range(count):
+                keycode = first.value + index
+                row = [table[index * per + level] for level in range(per)]
+                if not any(row):
+                    spare.append(keycode)
+                    continue
+                # 只使用不需要AltGr的前两级（无修饰、shift）
+                for level in range(min(2, per)):
+                    if row[level] and row[level] not in keysyms:
+                        keysyms[row[level]] = (keycode, level == 1)
+        finally:
+            self._x11.XFree(table)
+        return per, keysyms, spare
+
+    def _remap(self, keycode, keysym, per):
+        """把keycode的前两级都映射为keysym，keysym为0时恢复为空"""
+        row = (ctypes.c_ulong * per)(*([keysym] * min(2, per)))
+        self._x11.XChangeKeyboardMapping(self._display, keycode, per, row, 1)
+
+    def type_text(self, text):
+        """
+        直接输入Unicode文本
+
+        键盘映射中已有的字符直接按对应的键（需要时按住shift）；没有的字符（如中文）临时映射到空闲的keycode上，
+        全部发送后等待X服务器处理完再恢复映射。空闲keycode不够用时分批映射。没有空闲keycode时抛出ValueError
+        """
+        if not text:
+            return
+        with self._lock:
+            per, keysyms, spare = self._keyboard_mapping()
+            if not spare and any(char_keysym(char) not in keysyms for char in text):
+                raise ValueError("键盘映射中没有空闲的keycode，无法输入不在键盘上的字符")
+            shift = self.keycode("shift")
+            remapped = {}
+            free = list(spare)
+
+            def restore():
+                self._x11.XSync(self._display, 0)
+                time.sleep(XTEST_REMAP_DELAY)
+                for keycode in remapped.values():
+                    self._remap(keycode, 0, per)
+                remapped.clear()
+                free[:] = spare
+
+            try:
+                for char in text:
+                    keysym = char_keysym(char)
+                    if keysym in keysyms:
+                        keycode, shifted = keysyms[keysym]
+                    else:
+                        if keysym not in remapped:
+                            if not free:
+                                restore()
+                            remapped[keysym] = free.pop()
+                            self._remap(remapped[keysym], keysym, per)
+                        keycode, shifted = remapped[keysym], False
+                    if shifted:
+                        self._xtst.XTestFakeKeyEvent(self._display, shift, 1, 0)
+                    self._xtst.XTestFakeKeyEvent(self._display, keycode, 1, 0)
+                    self._xtst.XTestFakeKeyEvent(self._display, keycode, 0, 0)
+                    if shifted:
+                        self._xtst.XTestFakeKeyEvent(self._display, shift, 0, 0)
+            finally:
+                if remapped:
+                    restore()
+                self._flush()
+
+    def copy_text(self, text):
+        # XTest不涉及剪贴板，使用进程内常驻的剪贴板所有者
+        if self._clipboard is None:
+            self._clipboard = create_clipboard()
+        self._clipboard.copy(text)
+
+    def pause(self, seconds):
+        time.sleep(seconds)
+
+    def sync(self):
+        """等待X服务器处理完已发送的全部事件"""
+        with self._lock:
+            self._x11.XSync(self._display, 0)
+
+    def close(self):
+        """关闭X显示连接和剪贴板"""
+        with self._lock:
+            if self._display:
+                self._x11.XCloseDisplay(self._display)
+                self._display = None
+            if self._clipboard is not None and hasattr(self._clipboard, "close"):
+                self._clipboard.close()
+            self._clipboard = None
+
+
+class DryRunExecutor:
+    """
+    只记录不执行的执行器
+
+    每次操作记录为 (操作名, 参数, 时间戳)，用于基准测试和在无桌面环境下检查主循环的行为。
+    simulate_pauses为False时操作之间的固定等待直接跳过
+    """
+    name = "dry_run"
+
+    def __init__(self, simulate_pauses=False):
+        self.simulate_pauses = simulate_pauses
+        self.actions = []
+        self.position = (0, 0)
+        self.clipboard = ""
+
+    def _record(self, name, *args):
+        self.actions.append((name, args, time.time()))
+
+    def move_to(self, x, y, duration=0.0, pause=True):
+        self.position = (x, y)
+        self._record("move_to", x, y)
+
+    def click(self):
+        self._record("click", *self.position)
+
+    def double_click(self):
+        self._record("double_click", *self.position)
+
+    def right_click(self):
+        self._record("right_click", *self.position)
+
+    def mouse_down(self):
+        self._record("mouse_down", *self.position)
+
+    def mouse_up(self):
+        self._record("mouse_up", *self.position)
+
+    def drag_to(self, x, y, duration=0.0):
+        self._record("drag_to", self.position, (x, y))
+        self.position = (x, y)
+
+    def scroll(self, amount):
+        self._record("scroll", amount)
+
+    def hotkey(self, *keys):
+        self._record("hotkey", *keys)
+
+    def press(self, key):
+        self._record("press", key)
+
+    def key_down(self, key):
+        self._record("key_down", key)
+
+    def key_up(self, key):
+        self._record("key_up", key)
+
+    def type_text(self, text):
+        self._record("type_text", text)
+
+    def copy_text(self, text):
+        self.clipboard = text
+        self._record("copy_text", text)
+
+    @contextmanager
+    def batch(self):
+        yield self
+
+    def pause(self, seconds):
+        if self.simulate_pauses:
+            time.sleep(seconds)
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# 可选的执行器
+EXECUTORS = {
+    "xtest": XTestExecutor,
+    "pyautogui": PyAutoGUIExecutor,
+    "dry_run": DryRunExecutor,
+}
+
+
+def create_executor(name="pyautogui", failsafe=False, pause=0.0):
+    """
+    按名称创建执行器
+
+    参数:
+        name: "auto"、"xtest"、"pyautogui" 或 "dry_run"；auto在Linux X11下优先使用xtest，
+              加载失败（缺少libXtst、不是X11会话）或其他平台时使用pyautogui
+        failsafe: pyautogui的安全模式（鼠标移到屏幕角落时中止）
+        pause: pyautogui每次调用后的隐式等待（秒）
+    """
+    if name == "auto":
+        if sys.platform.startswith("linux") and os.environ.get("DISPLAY"):
+            try:
+                return XTestExecutor()
+            except OSError as e:
+                print(f"XTest执行器不可用，使用pyautogui: {e}")
+        return PyAutoGUIExecutor(failsafe=failsafe, pause=pause)
+    if name not in EXECUTORS:
+        raise ValueError(f"不支持的输入执行器: {name}，可选: auto, {', '.join(EXECUTORS)}")
+    if name == "pyautogui":
+        return PyAutoGUIExecutor(failsafe=failsafe, pause=pause)
+    return EXECUTORS[name]()
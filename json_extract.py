@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+JSON提取模块
+从模型输出的文本中提取JSON对象：单次扫描记录括号深度和字符串状态，找出所有顶层的 {...} 片段，
+只对这些互不重叠的片段调用json.loads，总耗时与文本长度成线性关系，不会出现正则回溯。
+可以处理代码块标记、JSON前后的说明文字（包括其中的括号）和双层大括号 {{...}}；
+被截断的输出不做补全，直接返回None
+"""
+import json
+
+
+# 双层大括号最多剥离的层数
+MAX_BRACE_LAYERS = 2
+
+
+def strip_code_fence(text):
+    """去掉 ```json ... ``` 代码块标记，只保留代码块内的内容"""
+    start = text.find("```")
+    if start == -1:
+        return text
+    # 跳过语言标记（如json），标记后的换行也一并跳过；内容可能与标记在同一行，如 ```json{...}```
+    body_start = start + 3
+    while body_start < len(text) and text[body_start].isalpha():
+        body_start += 1
+    if text.startswith("\r\n", body_start):
+        body_start += 2
+    elif text.startswith("\n", body_start):
+        body_start += 1
+    end = text.find("```", body_start)
+    return text[body_start:end] if end != -1 else text[body_start:]
+
+
+def _opens_object(text, index):
+    """index处的 { 之后（跳过空白）是引号、大括号或空对象时才可能是JSON对象，说明文字中的 { 不作为候选"""
+    index += 1
+    while index < len(text) and text[index].isspace():
+        index += 1
+    return index < len(text) and text[index] in '"{}'
+
+
+def scan_objects(text):
+    """
+    单次扫描，返回所有顶层对象片段
+
+    返回:
+        tuple: ([(起始位置, 结束位置)], 是否有未闭合的对象)，结束位置不含；
+               文本在对象中间结束（输出被截断）时第二项为True
+    """
+    spans = []
+    stack = []
+    start = None
+    in_string = False
+    escape = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            if stack:
+                in_string = True
+        elif char == "{" or char == "[":
+            if not stack:
+                # 只提取对象，顶层的数组（如说明文字中的 [x, y]）和说明文字中的 { 跳过
+                if char == "[" or not _opens_object(text, index):
+                    continue
+                start = index
+            stack.append("}" if char == "{" else "]")
+        elif char == "}" or char == "]":
+            if not stack:
+                continue
+            stack.pop()
+            if not stack:
+                spans.append((start, index + 1))
+                start = None
+    return spans, bool(stack)
+
+
+def _loads_object(candidate):
+    """解析一个片段，双层大括号时剥离外层后重试，不是对象时返回None"""
+    for _ in range(MAX_BRACE_LAYERS + 1):
+        try:
+            value = json.loads(candidate)
+        except ValueError:
+            stripped = candidate.strip()
+            if not (stripped.startswith("{{") and stripped.endswith("}}")):
+                return None
+            candidate = stripped[1:-1]
+            continue
+        return value if isinstance(value, dict) else None
+    return None
+
+
+def extract_json(text):
+    """
+    从模型输出中提取JSON对象
+
+    参数:
+        text: 模型输出的文本，或已经解析好的字典
+
+    返回:
+        dict: 能解析的最长的顶层对象；没有可解析的对象或输出被截断时返回None
+    """
+    if isinstance(text, dict):
+        return text
+    if not text:
+        return None
+    text = strip_code_fence(text)
+    spans, truncated = scan_objects(text)
+    if truncated:
+        # 不补全被截断的输出，返回None由调用方重新请求
+        return None
+    best = None
+    best_length = -1
+    for start, end in spans:
+        length = end - start
+        if length <= best_length:
+            continue
+        value = _loads_object(text[start:end])
+        if value is not None:
+            best, best_length = value, length
+    return best
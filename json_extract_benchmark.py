@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+JSON提取模糊测试与基准测试
+生成模型输出的模糊测试语料（代码块、说明文字、双层大括号、截断、字符串中的括号、随机噪声等），
+检查extract_json不抛异常、能还原的输出全部还原、被截断的输出返回None；再用构造的最坏情况输入测量解析耗时随长度的变化，
+确认耗时与输出长度成线性关系，并与原来的正则提取对比
+
+用法:
+    python json_extract_benchmark.py
+    python json_extract_benchmark.py --save-corpus imgs/json_corpus.jsonl --legacy
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import multiprocessing
+
+from json_extract import extract_json
+
+
+# 原parse_json使用的正则，仅用于对比
+LEGACY_PATTERN = r'\{\s*"(?:[^"\\]|\\.)*"\s*:\s*(?:"(?:[^"\\]|\\.)*"|\d+\.?\d*|true|false|null|\[.*?\]|\{.*?\})\s*(?:,\s*"(?:[^"\\]|\\.)*"\s*:\s*(?:"(?:[^"\\]|\\.)*"|\d+\.?\d*|true|false|null|\[.*?\]|\{.*?\})\s*)*\}'
+
+ACTIONS = ["click", "double_click", "long_press", "right_click", "drag", "scroll_up", "scroll_down", "hotkey",
+           "page_loading"]
+TEXTS = ["", "张三\n", "ctrl a", "含有\"引号\"和{括号}的文本", "路径 C:\\\\Users\\\\test", "emoji 😀 [x, y]", "}}{{"]
+
+
+def random_response(rng):
+    """随机生成一个符合输出格式的模型响应"""
+    action = rng.choice(ACTIONS)
+    if action == "drag":
+        coordinates = [[rng.randint(0, 1000), rng.randint(0, 1000)], [rng.randint(0, 1000), rng.randint(0, 1000)]]
+    else:
+        coordinates = [rng.randint(0, 1000), rng.randint(0, 1000)]
+    response = {
+        "current_status": rng.choice(["对话中", "联系人缺失", "页面加载中 {loading}"]),
+        "whether_completed": rng.choice(["True", "False", "difficult"]),
+        "element_info": rng.choice(["微信搜索框", "“发送”按钮", "列表 [第3项]"]),
+        "coordinates": coordinates,
+        "action": action,
+        "type_information": rng.choice(TEXTS)
+    }
+    if rng.random() < 0.3:
+        response["next_actions"] = [{"element_info": "输入框", "coordinates": [rng.randint(0, 1000), rng.randint(0, 1000)],
+                                     "action": "click", "type_information": rng.choice(TEXTS),
+                                     "expected_region": [0, 0, 500, 500]} for _ in range(rng.randint(1, 3))]
+    return response
+
+
+def build_corpus(count=2000, seed=0):
+    """
+    生成模糊测试语料
+
+    返回:
+        list: [{"kind": 变形方式, "text": 模型输出, "expected": 应还原的字典或None（只要求不抛异常）,
+                "truncated": 是否被截断（必须返回None）}]
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        response = random_response(rng)
+        text = json.dumps(response, ensure_ascii=rng.random() < 0.3, indent=rng.choice([None, 2]))
+        kind = rng.choice(["plain", "fence", "fence_inline", "prose", "double_brace", "truncated", "noise",
+                           "trailing_object"])
+        expected = response
+        truncated = False
+        if kind == "fence":
+            text = "```json\n" + text + "\n```"
+        elif kind == "fence_inline":
+            text = "```json" + text + "```"
+        elif kind == "prose":
+            text = "根据截图，下一步操作如下（坐标为[x, y]）：\n" + text + "\n以上。\"注意\"{不要}点击支付"
+        elif kind == "double_brace":
+            text = "{" + text + "}"
+        elif kind == "trailing_object":
+            # 说明文字中较短的对象不应覆盖完整的响应
+            text = text + '\n示例: {"a": 1}'
+        elif kind == "truncated":
+            cut = rng.randint(0, len(text))
+            truncated = cut < len(text)
+            text = text[:cut]
+            expected = None
+        elif kind == "noise":
+            chars = list(text)
+            for _ in range(rng.randint(1, 5)):
+                chars.insert(rng.randint(0, len(chars)), rng.choice('{}[]",:\\'))
+            text = "".join(chars)
+            expected = None
+        corpus.append({"kind": kind, "text": text, "expected": expected, "truncated": truncated})
+    return corpus
+
+
+def run_fuzz(corpus):
+    """运行模糊测试，返回 (按变形方式统计的结果, 失败用例)"""
+    stats = {}
+    failures = []
+    for case in corpus:
+        kind_stats = stats.setdefault(case["kind"], {"total": 0, "recovered": 0, "errors": 0})
+        kind_stats["total"] += 1
+        try:
+            result = extract_json(case["text"])
+        except Exception as e:
+            kind_stats["errors"] += 1
+            failures.append((case, repr(e)))
+            continue
+        if case.get("truncated"):
+            # 被截断的输出不应被补全
+            if result is None:
+                kind_stats["recovered"] += 1
+            else:
+                failures.append((case, repr(result)))
+        elif result is not None and (case["expected"] is None or result == case["expected"]):
+            kind_stats["recovered"] += 1
+        elif case["expected"] is not None:
+            failures.append((case, repr(result)))
+    return stats, failures
+
+
+def worst_case_inputs(size):
+    """构造长度约为size的最坏情况输入"""
+    unit = '"a":[1],'
+    return {
+        # 原正则在未闭合的对象上回溯次数随字段数指数增长
+        "unclosed_fields": "{" + unit * (size // len(unit)),
+        "deep_nesting": "[{" * (size // 4) + "}]" * (size // 4),
+        "open_braces": "{" * size,
+        "long_string": '{"type_information": "' + "\\\"}{[" * (size // 5) + '"}',
+        "prose_brackets": "[x, y] {不是JSON} " * (size // 18),
+        "valid_long": json.dumps({"current_status": "x" * size, "coordinates": [1, 2]})
+    }
+
+
+def _best_time(function, text, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_scaling(sizes):
+    """
+    测量各类最坏情况输入的解析耗时
+
+    返回:
+        dict: {输入类型: [(长度, 秒)]}
+    """
+    results = {}
+    for size in sizes:
+        for name, text in worst_case_inputs(size).items():
+            results.setdefault(name, []).append((len(text), _best_time(extract_json, text)))
+    return results
+
+
+def _legacy_worker(text, queue):
+    import re
+    start = time.perf_counter()
+    re.findall(LEGACY_PATTERN, text, re.DOTALL)
+    queue.put(time.perf_counter() - start)
+
+
+def run_legacy(field_counts, timeout=5.0):
+    """测量原正则在未闭合对象上的耗时，超时的输入记为None"""
+    results = []
+    for count in field_counts:
+        text = "{" + '"a":[1],' * count
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_legacy_worker, args=(text, queue), daemon=True)
+        process.start()
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+            results.append((len(text), None, _best_time(extract_json, text)))
+        else:
+            results.append((len(text), queue.get(), _best_time(extract_json, text)))
+    return results
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="JSON提取模糊测试与基准测试")
+    parser.add_argument("--count", type=int, default=2000, help="模糊测试用例数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="最坏情况输入的长度，逗号分隔")
+    parser.add_argument("--save-corpus", default=None, help="将模糊测试语料写入JSONL文件")
+    parser.add_argument("--legacy", action="store_true", help="同时测量原正则提取的耗时（每个输入最多5秒）")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.count, args.seed)
+    if args.save_corpus:
+        with open(args.save_corpus, "w", encoding="utf-8") as f:
+            for case in corpus:
+                f.write(json.dumps(case, ensure_ascii=False) + "\n")
+    stats, failures = run_fuzz(corpus)
+    print(f"=== 模糊测试（{len(corpus)} 个用例）===")
+    for kind, kind_stats in sorted(stats.items()):
+        print(f"{kind:<16} 共 {kind_stats['total']:5d}  还原 {kind_stats['recovered']:5d}  异常 {kind_stats['errors']}")
+    for case, result in failures[:10]:
+        print(f"失败: {case['kind']} {case['text'][:120]!r} -> {result[:120]}")
+
+    sizes = [int(value) for value in args.sizes.split(",")]
+    print("\n=== 最坏情况解析耗时（每字符纳秒数基本不随长度增长即为线性）===")
+    linear = True
+    for name, points in run_scaling(sizes).items():
+        per_char = [seconds / length * 1e9 for length, seconds in points]
+        row = "  ".join(f"{length:>8}字符 {seconds * 1000:9.3f} ms ({ns:6.1f} ns/字符)"
+                        for (length, seconds), ns in zip(points, per_char))
+        print(f"{name:<16} {row}")
+        # 允许缓存和计时噪声带来的小幅波动
+        if per_char[-1] > per_char[0] * 4 and per_char[-1] > 50:
+            linear = False
+    print(f"线性: {'是' if linear else '否'}")
+
+    if args.legacy:
+        print("\n=== 未闭合对象：原正则 vs extract_json ===")
+        for length, legacy_seconds, seconds in run_legacy([8, 12, 16, 18, 20, 22]):
+            legacy = f"{legacy_seconds * 1000:9.2f} ms" if legacy_seconds is not None else "    >5 秒（超时）"
+            print(f"{length:>6}字符  原正则 {legacy}  extract_json {seconds * 1000:.3f} ms")
+    sys.stdout.flush()
+    return 1 if failures or not linear else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+主循环端到端基准测试
+启动本地模拟视觉模型服务，使用回放截图后端和dry_run输入执行器运行完整的auto_control_computer，
+从会话录制中读取每一步各阶段的耗时，输出p50/p95和每秒步数。无需真实桌面和模型服务
+
+用法:
+    python loop_benchmark.py --steps 20 --latency lognormal:0.5,0.4
+    python loop_benchmark.py --replay imgs/recordings_frames --script responses.json --stream
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+from mock_vlm_server import MockVLMServer, load_script, load_recording
+
+
+# 报告的阶段：截图（含变化检测）、模型请求、首次移动鼠标、执行操作（含画面稳定等待）
+PHASES = ("capture", "model", "first_move", "action")
+
+
+def _percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(ratio * (len(ordered) - 1))))]
+
+
+def _merge(base, overrides):
+    merged = dict(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def build_config(base_config_path, work_dir, base_url, replay_path, stream=False, change_detection=False):
+    """
+    在项目配置的基础上生成基准测试配置：连接模拟服务、回放截图、dry_run执行器，
+    录制和用量摘要写入临时目录，不修改项目的config.json
+    """
+    base = {}
+    if os.path.exists(base_config_path):
+        with open(base_config_path, "r", encoding="utf-8") as f:
+            base = json.load(f)
+    return _merge(base, {
+        "api_config": {"api_key": "mock", "base_url": base_url},
+        "ai_config": {"stream": stream},
+        "screenshot_config": {"capture_backend": "replay", "replay_path": replay_path, "save_debug_images": False},
+        "mouse_config": {"executor": "dry_run"},
+        # 回放单张图片时画面不会变化，默认关闭变化检测，避免每步等待max_wait
+        "change_detection_config": {"enabled": change_detection},
+        "recording_config": {"enabled": True, "directory": os.path.join(work_dir, "recordings")},
+        "accounting_config": {"summary_directory": os.path.join(work_dir, "summaries")},
+        "cache_config": {"context_cache": False},
+        "router_config": {"enabled": False}
+    })
+
+
+def collect_timings(recording_dir):
+    """从录制文件中读取每一步的各阶段耗时"""
+    from session_recorder import SessionReader
+    phases = {phase: [] for phase in PHASES}
+    steps = 0
+    for filename in sorted(os.listdir(recording_dir)):
+        if not filename.endswith(".vlrec"):
+            continue
+        with SessionReader(os.path.join(recording_dir, filename)) as reader:
+            for step in range(len(reader)):
+                timings = reader.get_info(step).get("timings") or {}
+                if "action" not in timings:
+                    continue
+                steps += 1
+                for phase in PHASES:
+                    if phase in timings:
+                        phases[phase].append(timings[phase])
+    return steps, phases
+
+
+def run_benchmark(steps=20, latency="0.2", responses=None, replay_path="imgs/screen.png", stream=False,
+                  stream_interval=0.0, change_detection=False, seed=0, config_path="config.json"):
+    """
+    运行一次端到端基准测试
+
+    返回:
+        dict: {"steps", "elapsed", "steps_per_second", "phases": {阶段: {"p50", "p95", "mean"}},
+               "requests", "connections", "actions"}
+    """
+    server = MockVLMServer(latency=latency, responses=responses, stream_interval=stream_interval, seed=seed).start()
+    work_dir = tempfile.mkdtemp(prefix="loop_benchmark_")
+    try:
+        config = build_config(config_path, work_dir, server.base_url, os.path.abspath(replay_path),
+                              stream=stream, change_detection=change_detection)
+        bench_config_path = os.path.join(work_dir, "config.json")
+        with open(bench_config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+        # 主模块在导入时读取配置，需要先设置配置路径
+        os.environ["VL_CONFIG_PATH"] = bench_config_path
+        import vl_model_test_doubao2 as agent
+
+        start_time = time.perf_counter()
+        agent.auto_control_computer("用户任务为:基准测试", max_visual_model_iterations=steps)
+        elapsed = time.perf_counter() - start_time
+
+        completed, phases = collect_timings(config["recording_config"]["directory"])
+        executor = agent.input_executor
+        return {
+            "steps": completed,
+            "elapsed": elapsed,
+            "steps_per_second": completed / elapsed if elapsed > 0 else 0.0,
+            "phases": {phase: {"p50": _percentile(values, 0.5), "p95": _percentile(values, 0.95),
+                               "mean": sum(values) / len(values)}
+                       for phase, values in phases.items() if values},
+            "requests": server.request_count,
+            "connections": server.connection_count,
+            "actions": len(executor.actions) if executor is not None and hasattr(executor, "actions") else 0,
+            "work_dir": work_dir
+        }
+    finally:
+        server.stop()
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="主循环端到端基准测试（模拟模型服务 + 回放截图 + dry_run执行器）")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--latency", default="0.2", help="模拟推理耗时：秒数，或 uniform:a,b / normal:均值,标准差 / lognormal:中位数,sigma")
+    parser.add_argument("--script", default=None, help="响应脚本（JSON数组或每行一个JSON）")
+    parser.add_argument("--recording", default=None, help="从会话录制文件（.vlrec）重放模型输出")
+    parser.add_argument("--replay", default="imgs/screen.png", help="回放截图：单张图片或图片文件夹")
+    parser.add_argument("--stream", action="store_true", help="使用流式输出")
+    parser.add_argument("--stream-interval", type=float, default=0.0, help="流式输出分片间隔（秒）")
+    parser.add_argument("--change-detection", action="store_true", help="保留画面变化检测")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    responses = None
+    if args.script:
+        responses = load_script(args.script)
+    elif args.recording:
+        responses = load_recording(args.recording)
+
+    result = run_benchmark(args.steps, args.latency, responses, args.replay, args.stream,
+                           args.stream_interval, args.change_detection, args.seed)
+
+    print(f"\n=== 主循环基准测试（{result['steps']} 步，模拟耗时 {args.latency}，"
+          f"{'流式' if args.stream else '非流式'}）===")
+    for phase, stats in result["phases"].items():
+        print(f"{phase:<12} p50: {stats['p50'] * 1000:8.1f} ms  p95: {stats['p95'] * 1000:8.1f} ms  "
+              f"平均: {stats['mean'] * 1000:8.1f} ms")
+    print(f"总耗时: {result['elapsed']:.2f} 秒，每秒 {result['steps_per_second']:.2f} 步")
+    print(f"模拟服务收到 {result['requests']} 个请求，建立 {result['connections']} 个连接；"
+          f"执行器记录 {result['actions']} 个操作")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+操作轨迹宏模块
+任务成功完成时保存每一步的操作和点击位置周围的小模板图；再次执行同一任务时在本地回放，
+每一步先用模板匹配确认目标仍在原处（允许小范围移动），确认通过直接执行，
+从第一个确认失败的步骤开始改为请求模型
+"""
+import os
+import json
+import time
+import hashlib
+
+import cv2
+import numpy as np
+
+
+# 不需要也无法用模板确认位置的操作
+NO_TEMPLATE_ACTIONS = ("hotkey", "page_loading")
+
+
+def task_digest(task):
+    """任务内容的摘要，作为宏的文件夹名"""
+    return hashlib.sha1(task.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def _first_point(coordinates):
+    if coordinates and isinstance(coordinates[0], (list, tuple)):
+        return coordinates[0]
+    return coordinates
+
+
+def _shift(coordinates, dx, dy):
+    if coordinates and isinstance(coordinates[0], (list, tuple)):
+        return [[point[0] + dx, point[1] + dy] for point in coordinates]
+    return [coordinates[0] + dx, coordinates[1] + dy]
+
+
+def _to_pixels(point, width, height):
+    return int(round(point[0] / 1000 * width)), int(round(point[1] / 1000 * height))
+
+
+class MacroRecorder:
+    """
+    记录一次任务的操作轨迹
+
+    每一步保存操作字典（坐标为整屏截图上的千分比坐标）和点击点周围的模板图
+    """
+
+    def __init__(self, template_size=48):
+        """
+        参数:
+            template_size: 模板图的半边长（截图像素），模板为以点击点为中心的正方形
+        """
+        self.template_size = template_size
+        self.steps = []
+        # 最近一次出现新坐标时已记录的步数，主循环因连续相同坐标清空记忆时丢弃之后的步骤
+        self._mark = 0
+
+    def add(self, image, element, coordinates):
+        """
+        记录一步已执行的操作
+
+        参数:
+            image: 做出决策时的整屏截图
+            element: 模型输出的操作字典
+            coordinates: 整屏截图上的千分比坐标
+        """
+        if element.get("action") == "page_loading":
+            # 等待加载不是操作，回放时匹配 [0, 0] 处的模板没有意义
+            return
+        height, width = image.shape[:2]
+        step = {
+            "action": element.get("action"),
+            "coordinates": coordinates,
+            "type_information": element.get("type_information", ""),
+            "submit": element.get("submit", True),
+            "element_info": element.get("element_info", ""),
+            "current_status": element.get("current_status", ""),
+            "frame_size": [width, height],
+            "template": None,
+            "anchor": None
+        }
+        if step["action"] not in NO_TEMPLATE_ACTIONS and coordinates:
+            x, y = _to_pixels(_first_point(coordinates), width, height)
+            left, top = max(0, x - self.template_size), max(0, y - self.template_size)
+            right, bottom = min(width, x + self.template_size), min(height, y + self.template_size)
+            if right - left > 4 and bottom - top > 4:
+                step["template"] = image[top:bottom, left:right].copy()
+                # 点击点在模板中的位置
+                step["anchor"] = [x - left, y - top]
+        self.steps.append(step)
+
+    def mark(self):
+        """记录当前步数，之后的步骤可以用discard_since_mark()丢弃"""
+        self._mark = len(self.steps)
+
+    def discard_since_mark(self):
+        """丢弃mark()之后记录的步骤（连续点击相同坐标没有推进任务的操作）"""
+        del self.steps[self._mark:]
+
+    def clear(self):
+        self.steps = []
+        self._mark = 0
+
+
+class MacroLibrary:
+    """
+    宏的保存和读取
+
+    每个任务一个文件夹：macro.json保存操作列表，step_N.png保存模板图
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _task_dir(self, task):
+        return os.path.join(self.directory, task_digest(task))
+
+    def save(self, task, steps):
+        """保存任务的操作轨迹，返回保存的文件夹"""
+        task_dir = self._task_dir(task)
+        os.makedirs(task_dir, exist_ok=True)
+        items = []
+        for index, step in enumerate(steps):
+            item = {key: value for key, value in step.items() if key != "template"}
+            if step.get("template") is not None:
+                item["template"] = f"step_{index}.png"
+                cv2.imwrite(os.path.join(task_dir, item["template"]), step["template"])
+            items.append(item)
+        with open(os.path.join(task_dir, "macro.json"), "w", encoding="utf-8") as f:
+            json.dump({"task": task, "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"), "steps": items},
+                      f, ensure_ascii=False, indent=2)
+        return task_dir
+
+    def load(self, task):
+        """读取任务的操作轨迹，不存在或损坏时返回None"""
+        task_dir = self._task_dir(task)
+        path = os.path.join(task_dir, "macro.json")
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            steps = []
+            for item in data["steps"]:
+                step = dict(item)
+                if item.get("template"):
+                    step["template"] = cv2.imread(os.path.join(task_dir, item["template"]))
+                    if step["template"] is None:
+                        return None
+                steps.append(step)
+            return steps
+        except (OSError, ValueError, KeyError) as e:
+            print(f"读取宏失败: {e}")
+            return None
+
+
+class MacroPlayer:
+    """
+    带模板确认的宏回放
+
+    next_element()按顺序返回下一步操作：有模板的步骤先在预期位置附近做模板匹配，
+    分数达到阈值时按匹配到的位置修正坐标；确认失败或宏已播放完时停止回放，后续步骤请求模型
+    """
+
+    def __init__(self, steps, search_radius=120, match_threshold=0.9):
+        """
+        参数:
+            steps: MacroLibrary.load返回的操作列表
+            search_radius: 在预期位置周围搜索的范围（截图像素）
+            match_threshold: 模板匹配的最低分数（TM_CCOEFF_NORMED）
+        """
+        self.steps = steps
+        self.search_radius = search_radius
+        self.match_threshold = match_threshold
+        self.index = 0
+        self.active = bool(steps)
+        self.replayed = 0
+        self.last_score = None
+
+    def _locate(self, image, step):
+        """在截图中确认模板位置，返回修正后的千分比坐标，确认失败返回None"""
+        template = step["template"]
+        height, width = image.shape[:2]
+        recorded_width, recorded_height = step["frame_size"]
+        if (recorded_width, recorded_height) != (width, height):
+            # 截图尺寸变化时按比例缩放模板
+            ratio_x, ratio_y = width / recorded_width, height / recorded_height
+            template = cv2.resize(template, None, fx=ratio_x, fy=ratio_y, interpolation=cv2.INTER_AREA)
+            anchor = [step["anchor"][0] * ratio_x, step["anchor"][1] * ratio_y]
+        else:
+            anchor = step["anchor"]
+        # 纯色区域的模板无法可靠匹配
+        if float(np.std(template)) < 4.0:
+            return None
+        expected_x, expected_y = _to_pixels(_first_point(step["coordinates"]), width, height)
+        template_height, template_width = template.shape[:2]
+        left = max(0, int(expected_x - anchor[0]) - self.search_radius)
+        top = max(0, int(expected_y - anchor[1]) - self.search_radius)
+        right = min(width, int(expected_x - anchor[0]) + template_width + self.search_radius)
+        bottom = min(height, int(expected_y - anchor[1]) + template_height + self.search_radius)
+        if right - left < template_width or bottom - top < template_height:
+            return None
+        result = cv2.matchTemplate(image[top:bottom, left:right], template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, location = cv2.minMaxLoc(result)
+        self.last_score = score
+        if score < self.match_threshold:
+            return None
+        found_x = left + location[0] + anchor[0]
+        found_y = top + location[1] + anchor[1]
+        dx = (found_x - expected_x) / width * 1000
+        dy = (found_y - expected_y) / height * 1000
+        shifted = _shift(step["coordinates"], dx, dy)
+        if isinstance(shifted[0], list):
+            return [[round(value) for value in point] for point in shifted]
+        return [round(value) for value in shifted]
+
+    def next_element(self, image):
+        """
+        返回下一步要执行的操作字典（格式与模型输出相同），确认失败或已播放完时返回None并停止回放
+        """
+        if not self.active or self.index >= len(self.steps):
+            self.active = False
+            return None
+        step = self.steps[self.index]
+        coordinates = step["coordinates"]
+        if step.get("template") is not None:
+            coordinates = self._locate(image, step)
+            if coordinates is None:
+                self.active = False
+                return None
+        self.index += 1
+        self.replayed += 1
+        return {
+            "current_status": step.get("current_status", ""),
+            "whether_completed": "False",
+            "element_info": step.get("element_info", ""),
+            "coordinates": coordinates,
+            "action": step["action"],
+            "type_information": step.get("type_information", ""),
+            "submit": step.get("submit", True)
+        }
+
+    def report(self):
+        """返回统计摘要文本"""
+        return f"宏回放: 共 {len(self.steps)} 步，本地回放 {self.replayed} 步"
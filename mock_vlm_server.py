@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+本地模拟视觉模型服务
+提供OpenAI兼容的 /chat/completions 接口（含结构化输出和SSE流式输出），以及方舟上下文缓存的
+/context/create、/context/chat/completions 接口。按脚本或会话录制文件依次返回操作JSON，
+推理耗时可按分布随机，支持HTTP keep-alive，用于在不访问真实模型的情况下测量客户端和主循环的耗时
+"""
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# 默认返回的模型输出
+DEFAULT_RESPONSE = {
+    "current_status": "模拟服务返回",
+    "whether_completed": "False",
+    "element_info": "屏幕中央",
+    "coordinates": [500, 500],
+    "action": "click",
+    "type_information": ""
+}
+
+# 每张图片按固定token数计算，文本按每2个字符1个token估算
+IMAGE_TOKENS = 1000
+
+# 流式输出时每个分片的字符数
+STREAM_CHUNK_CHARS = 8
+
+
+class LatencyModel:
+    """
+    推理耗时分布
+
+    支持的写法：
+        "0.5" 或 0.5       固定耗时（秒）
+        "uniform:0.2,0.8"  均匀分布
+        "normal:0.5,0.1"   正态分布（均值, 标准差），小于0时取0
+        "lognormal:0.5,0.4" 对数正态分布（中位数, sigma），用于模拟长尾延迟
+    """
+
+    def __init__(self, spec=0.0, seed=None):
+        self.spec = spec
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        if isinstance(spec, (int, float)):
+            self.kind, self.params = "fixed", (float(spec),)
+        else:
+            kind, _, params = str(spec).partition(":")
+            if not params:
+                self.kind, self.params = "fixed", (float(kind),)
+            else:
+                self.kind, self.params = kind, tuple(float(value) for value in params.split(","))
+        if self.kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"不支持的耗时分布: {spec}")
+
+    def sample(self):
+        """抽取一次耗时（秒）"""
+        with self._lock:
+            if self.kind == "fixed":
+                return self.params[0]
+            if self.kind == "uniform":
+                return self._rng.uniform(*self.params)
+            if self.kind == "normal":
+                return max(0.0, self._rng.gauss(*self.params))
+            median, sigma = self.params
+            return self._rng.lognormvariate(0.0, sigma) * median
+
+
+def load_script(path):
+    """
+    读取响应脚本
+
+    支持JSON数组或每行一个JSON对象，每项为一次模型输出（字典或已序列化的字符串）
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def load_recording(path):
+    """读取会话录制文件中每一步记录的模型原始输出，用于重放真实会话"""
+    from session_recorder import SessionReader
+    responses = []
+    with SessionReader(path) as reader:
+        for step in range(len(reader)):
+            response = reader.get_info(step).get("response")
+            if response:
+                responses.append(response)
+    return responses
+
+
+def _message_parts(messages):
+    """把消息展开为 (类型, 内容) 列表，图片按内容哈希表示，用于估算token和前缀缓存"""
+    parts = []
+    for message in messages or []:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(("text", content))
+            continue
+        for item in content or []:
+            if item.get("type") == "image_url":
+                url = item.get("image_url", {}).get("url", "")
+                parts.append(("image", hashlib.sha1(url.encode("utf-8")).hexdigest()))
+            elif item.get("type") == "text":
+                parts.append(("text", item.get("text", "")))
+    return parts
+
+
+def _part_tokens(part):
+    return IMAGE_TOKENS if part[0] == "image" else max(1, len(part[1]) // 2)
+
+
+class MockVLMHandler(BaseHTTPRequestHandler):
+    """处理模型请求的HTTP/1.1处理器"""
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分多次写出，关闭Nagle算法避免keep-alive连接上出现40ms的延迟确认等待
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        # 每个处理器实例对应一个TCP连接，keep-alive时同一连接上的多个请求共用一个实例
+        self.server.record_connection()
+
+    def log_message(self, format, *args):
+        # 基准测试时不输出每个请求的日志
+        pass
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+    def _send_stream(self, completion_id, model, content, usage, include_usage):
+        # 分块传输编码的SSE，连接在流结束后仍可复用
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        created = int(time.time())
+
+        def event(delta, finish_reason=None, chunk_usage=None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            if chunk_usage is not None:
+                chunk["choices"] = []
+                chunk["usage"] = chunk_usage
+            self._send_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+
+        event({"role": "assistant", "content": ""})
+        interval = self.server.stream_interval
+        for start in range(0, len(content), STREAM_CHUNK_CHARS):
+            if interval > 0:
+                time.sleep(interval)
+            event({"content": content[start:start + STREAM_CHUNK_CHARS]})
+        event({}, finish_reason="stop")
+        if include_usage:
+            event(None, chunk_usage=usage)
+        self._send_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        server.record_request()
+        path = self.path.rstrip("/")
+        if path.endswith("/context/create"):
+            self._send_json(server.create_context(body))
+            return
+        if not path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        context_messages = []
+        if path.endswith("/context/chat/completions"):
+            context_messages = server.get_context(body.get("context_id"))
+            if context_messages is None:
+                self._send_json({"error": {"message": "context not found", "code": "NotFound"}}, status=404)
+                return
+
+        latency = server.latency.sample()
+        if latency > 0:
+            time.sleep(latency)
+        content = server.next_response()
+        usage = server.estimate_usage(context_messages, body.get("messages"), content)
+        completion_id = f"mock-{server.request_count}"
+        model = body.get("model", "mock")
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            self._send_stream(completion_id, model, content, usage, include_usage)
+            return
+        self._send_json({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": usage
+        })
+
+
+class MockVLMServer(ThreadingHTTPServer):
+    """
+    模拟视觉模型服务
+
+    属性:
+        request_count: 收到的请求数
+        connection_count: 建立的TCP连接数（连接复用时远小于请求数）
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, response=None, latency=0.0, responses=None,
+                 stream_interval=0.0, seed=None):
+        """
+        参数:
+            host, port: 监听地址，port为0时自动分配
+            response: 固定返回的模型输出（responses为空时使用）
+            latency: 推理耗时，固定秒数或LatencyModel支持的分布写法
+            responses: 按顺序循环返回的模型输出列表（脚本或录制）
+            stream_interval: 流式输出时相邻分片之间的间隔（秒）
+            seed: 耗时分布的随机种子
+        """
+        super().__init__((host, port), MockVLMHandler)
+        self.response = response or DEFAULT_RESPONSE
+        self.responses = list(responses or [])
+        self.latency = latency if isinstance(latency, LatencyModel) else LatencyModel(latency, seed)
+        self.stream_interval = stream_interval
+        self.request_count = 0
+        self.connection_count = 0
+        self._response_index = 0
+        self._contexts = {}
+        self._previous_parts = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record_connection(self):
+        with self._lock:
+            self.connection_count += 1
+
+    def record_request(self):
+        with self._lock:
+            self.request_count += 1
+
+    def next_response(self):
+        """返回下一条模型输出文本，脚本播放完后从头开始"""
+        with self._lock:
+            if not self.responses:
+                response = self.response
+            else:
+                response = self.responses[self._response_index % len(self.responses)]
+                self._response_index += 1
+        return response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)
+
+    def create_context(self, body):
+        """创建上下文缓存，返回方舟格式的响应"""
+        with self._lock:
+            context_id = f"ctx-mock-{len(self._contexts) + 1}"
+            self._contexts[context_id] = body.get("messages") or []
+        return {"id": context_id, "model": body.get("model"), "mode": body.get("mode"), "ttl": body.get("ttl")}
+
+    def get_context(self, context_id):
+        with self._lock:
+            return self._contexts.get(context_id)
+
+    def estimate_usage(self, context_messages, messages, content):
+        """
+        估算usage：上下文缓存中的消息全部计为缓存命中；
+        普通请求与上一次请求相同的前缀部分计为缓存命中，模拟服务端的自动前缀缓存
+        """
+        context_parts = _message_parts(context_messages)
+        parts = _message_parts(messages)
+        with self._lock:
+            cached = 0
+            if not context_parts:
+                for part, previous in zip(parts, self._previous_parts):
+                    if part != previous:
+                        break
+                    cached += _part_tokens(part)
+                self._previous_parts = parts
+        cached += sum(_part_tokens(part) for part in context_parts)
+        prompt_tokens = sum(_part_tokens(part) for part in context_parts + parts)
+        completion_tokens = max(1, len(content) // 2)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached}}
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self.serve_forever, name="MockVLMServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    """命令行入口：python mock_vlm_server.py --port 8000 --latency lognormal:0.8,0.4 --script responses.json"""
+    parser = argparse.ArgumentParser(description="本地模拟视觉模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="0", help="推理耗时：秒数，或 uniform:a,b / normal:均值,标准差 / lognormal:中位数,sigma")
+    parser.add_argument("--script", default=None, help="响应脚本（JSON数组或每行一个JSON），按顺序循环返回")
+    parser.add_argument("--recording", default=None, help="会话录制文件（.vlrec），按顺序重放其中的模型输出")
+    parser.add_argument("--stream-interval", type=float, default=0.0, help="流式输出分片间隔（秒）")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    responses = None
+    if args.script:
+        responses = load_script(args.script)
+    elif args.recording:
+        responses = load_recording(args.recording)
+    server = MockVLMServer(args.host, args.port, latency=args.latency, responses=responses,
+                           stream_interval=args.stream_interval, seed=args.seed)
+    print(f"模拟视觉模型服务已启动: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
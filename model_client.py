@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+模型客户端模块
+长期复用OpenAI客户端及其keep-alive连接池，避免每一步重新建立TCP/TLS连接；
+配置文件和系统提示词按修改时间缓存，只有文件变化时才重新读取
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+
+# 连接池参数：单个任务同一时刻只有少量并发请求，保持少量长连接即可
+DEFAULT_POOL_CONFIG = {
+    "max_connections": 8,
+    "max_keepalive_connections": 4,
+    "keepalive_expiry": 120.0,
+    "timeout": 120.0
+}
+
+
+class FileCache:
+    """
+    按修改时间缓存的文件读取
+
+    每次get时只调用一次os.stat，文件的修改时间和大小都未变化时直接返回缓存的结果
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+
+    def get(self, path, loader):
+        """
+        读取文件，未变化时返回缓存
+
+        参数:
+            path: 文件路径
+            loader: 接收文件路径、返回解析结果的函数
+
+        返回:
+            tuple: (解析结果, 是否重新读取了文件)
+        """
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                return entry[1], False
+        value = loader(path)
+        with self._lock:
+            self._entries[path] = (signature, value)
+            self.loads += 1
+        return value, True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_file_cache = FileCache()
+
+
+def _load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _load_text(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def load_json_cached(path):
+    """读取JSON文件，返回 (内容, 是否重新读取)"""
+    return _file_cache.get(path, _load_json)
+
+
+def read_text_cached(path):
+    """读取文本文件（去掉首尾空白），返回 (内容, 是否重新读取)"""
+    return _file_cache.get(path, _load_text)
+
+
+def get_file_cache():
+    """获取全局文件缓存（用于查看命中统计）"""
+    return _file_cache
+
+
+def _pool_settings(pool_config):
+    settings = dict(DEFAULT_POOL_CONFIG)
+    settings.update(pool_config or {})
+    limits = httpx.Limits(
+        max_connections=settings["max_connections"],
+        max_keepalive_connections=settings["max_keepalive_connections"],
+        keepalive_expiry=settings["keepalive_expiry"]
+    )
+    return limits, settings["timeout"]
+
+
+def create_http_client(pool_config=None):
+    """按连接池配置创建keep-alive的HTTP客户端"""
+    limits, timeout = _pool_settings(pool_config)
+    return httpx.Client(limits=limits, timeout=timeout)
+
+
+def create_async_http_client(pool_config=None):
+    """按连接池配置创建keep-alive的异步HTTP客户端"""
+    limits, timeout = _pool_settings(pool_config)
+    return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+# 按 (api_key, base_url) 缓存的客户端
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_model_client(api_key, base_url, pool_config=None):
+    """
+    获取长期复用的模型客户端
+
+    同一个API Key和地址在多次循环、多次任务之间共用一个客户端和连接池；
+    API Key或地址变化时关闭旧客户端并创建新客户端
+
+    参数:
+        api_key: API密钥
+        base_url: 接口地址
+        pool_config: 连接池参数，见DEFAULT_POOL_CONFIG
+
+    返回:
+        OpenAI: 客户端实例
+    """
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client
+        # 配置变化后旧客户端不会再被使用，及时关闭其连接池
+        for old_client in _clients.values():
+            old_client.close()
+        _clients.clear()
+        client = OpenAI(api_key=api_key, base_url=base_url, http_client=create_http_client(pool_config))
+        _clients[key] = client
+        return client
+
+
+# 异步客户端的连接池绑定在创建它的事件循环上，只在执行引擎的常驻事件循环中使用
+_async_clients = {}
+# 正在关闭的旧异步客户端的任务，保留引用以免任务在执行前被回收
+_closing_tasks = set()
+
+
+def _on_client_closed(task):
+    _closing_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"关闭旧的模型客户端时出错: {task.exception()}")
+
+
+def get_async_model_client(api_key, base_url, pool_config=None):
+    """
+    获取长期复用的异步模型客户端（需在执行引擎的事件循环中调用）
+
+    用法与get_model_client相同；取消等待中的请求时，底层HTTP请求随之中止
+    """
+    key = (api_key, base_url)
+    client = _async_clients.get(key)
+    if client is not None:
+        return client
+    loop = asyncio.get_running_loop()
+    for old_client in _async_clients.values():
+        task = loop.create_task(old_client.close())
+        _closing_tasks.add(task)
+        task.add_done_callback(_on_client_closed)
+    _async_clients.clear()
+    # 超时和重试由request_policy统一控制，客户端自身不再重试
+    client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                         http_client=create_async_http_client(pool_config))
+    _async_clients[key] = client
+    return client
+
+
+def close_model_clients():
+    """关闭所有缓存的客户端（程序退出时调用）"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def _benchmark_request(client, model, system_content, image_data_url):
+    return client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_content},
+            {"role": "user", "content": [{"type": "image_url", "image_url": {"url": image_data_url}},
+                                         {"type": "text", "text": "基准测试"}]}
+        ]
+    )
+
+
+def run_latency_benchmark(base_url, steps=30, config_path="config.json", prompt_path="get_next_action_AI_doubao.txt",
+                          image_path="imgs/screen.png", model="mock"):
+    """
+    对比每步新建客户端并重新读取配置、提示词（原先的做法）与复用客户端和缓存的单步耗时
+
+    返回:
+        dict: {"fresh": [...], "persistent": [...]}，每步耗时（秒）
+    """
+    from image_encoder import encode_image
+    import cv2
+    image = cv2.imread(image_path)
+    image_data_url = encode_image(image, "jpeg", quality=70).to_data_url() if image is not None else ""
+
+    results = {"fresh": [], "persistent": []}
+    for _ in range(steps):
+        start_time = time.perf_counter()
+        config = _load_json(config_path)
+        system_content = _load_text(prompt_path)
+        client = OpenAI(api_key=config.get("api_config", {}).get("api_key") or "mock", base_url=base_url)
+        _benchmark_request(client, model, system_content, image_data_url)
+        results["fresh"].append(time.perf_counter() - start_time)
+
+    _file_cache.clear()
+    for _ in range(steps):
+        start_time = time.perf_counter()
+        config, _ = load_json_cached(config_path)
+        system_content, _ = read_text_cached(prompt_path)
+        client = get_model_client(config.get("api_config", {}).get("api_key") or "mock", base_url)
+        _benchmark_request(client, model, system_content, image_data_url)
+        results["persistent"].append(time.perf_counter() - start_time)
+    close_model_clients()
+    return results
+
+
+def _percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(ratio * (len(ordered) - 1))))]
+
+
+def main():
+    """命令行入口：启动本地模拟服务（或使用--base-url指定的服务），对比单步请求耗时"""
+    parser = argparse.ArgumentParser(description="模型客户端复用基准测试")
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--base-url", default=None, help="测试使用的OpenAI兼容接口地址，默认启动本地模拟服务")
+    parser.add_argument("--latency", type=float, default=0.0, help="本地模拟服务的推理耗时（秒）")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        from mock_vlm_server import MockVLMServer
+        server = MockVLMServer(latency=args.latency).start()
+        base_url = server.base_url
+
+    try:
+        results = run_latency_benchmark(base_url, args.steps)
+    finally:
+        if server is not None:
+            server.stop()
+
+    print(f"=== 模型客户端基准测试（{args.steps} 步，{base_url}）===")
+    for name, times in results.items():
+        print(f"{name:<12} 平均: {sum(times) / len(times) * 1000:.1f} ms  "
+              f"p50: {_percentile(times, 0.5) * 1000:.1f} ms  p95: {_percentile(times, 0.95) * 1000:.1f} ms")
+    saved = (sum(results["fresh"]) - sum(results["persistent"])) / args.steps
+    print(f"每步节省: {saved * 1000:.1f} ms")
+    if server is not None:
+        print(f"模拟服务共收到 {server.request_count} 个请求，建立 {server.connection_count} 个连接")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+模型路由模块
+每一步默认使用快速档位（较小的模型或关闭深度思考），只有出现困难信号时才升级到更强的档位：
+连续点击相同坐标、模型输出无法解析、连续返回page_loading。按档位统计耗时和费用，便于调整策略
+"""
+
+
+# 默认路由配置：model_name为空时使用api_config中的模型，thinking_type为空时使用ai_config中的设置
+DEFAULT_ROUTER_CONFIG = {
+    "enabled": False,
+    "tiers": [
+        {"name": "fast", "model_name": "", "thinking_type": "disabled", "input_price": 0.0, "output_price": 0.0},
+        {"name": "strong", "model_name": "", "thinking_type": "enabled", "input_price": 0.0, "output_price": 0.0}
+    ],
+    "same_coordinate_streak": 2,
+    "parse_failures": 1,
+    "page_loading_streak": 2,
+    "hold_steps": 3
+}
+
+
+class TierStats:
+    """单个档位的调用次数、耗时、token和费用"""
+
+    def __init__(self, tier):
+        self.name = tier.get("name", "")
+        self.input_price = tier.get("input_price", 0.0) or 0.0
+        self.output_price = tier.get("output_price", 0.0) or 0.0
+        self.calls = 0
+        self.seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, seconds, usage):
+        self.calls += 1
+        self.seconds += seconds
+        if usage is not None:
+            self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    @property
+    def cost(self):
+        """费用（价格单位为每百万token）"""
+        return (self.prompt_tokens * self.input_price + self.completion_tokens * self.output_price) / 1e6
+
+
+class ModelRouter:
+    """
+    按困难信号在档位之间升级和回落
+
+    每一步调用observe()报告本步的信号：任一信号触发时升级一档；
+    在较高档位上连续hold_steps步没有信号时回落一档
+    """
+
+    def __init__(self, tiers, same_coordinate_streak=2, parse_failures=1, page_loading_streak=2, hold_steps=3):
+        """
+        参数:
+            tiers: 档位列表，从快到强排列，每项包含name、model_name、thinking_type和价格
+            same_coordinate_streak: 连续点击相同坐标达到该次数时升级
+            parse_failures: 连续解析失败达到该次数时升级
+            page_loading_streak: 连续返回page_loading达到该次数时升级
+            hold_steps: 升级后连续多少步无信号再回落一档
+        """
+        if not tiers:
+            raise ValueError("模型路由至少需要一个档位")
+        self.tiers = tiers
+        self.same_coordinate_streak = same_coordinate_streak
+        self.parse_failures = parse_failures
+        self.page_loading_streak = page_loading_streak
+        self.hold_steps = hold_steps
+        self.level = 0
+        self.escalations = 0
+        self.stats = [TierStats(tier) for tier in tiers]
+        self._parse_failure_count = 0
+        self._page_loading_count = 0
+        self._calm_steps = 0
+
+    @property
+    def current(self):
+        """本步使用的档位"""
+        return self.tiers[self.level]
+
+    def resolve(self, default_model, default_thinking):
+        """返回当前档位的 (模型名称, 深度思考设置)，未配置的项使用默认值"""
+        tier = self.current
+        return tier.get("model_name") or default_model, tier.get("thinking_type") or default_thinking
+
+    def record(self, level, seconds, usage):
+        """记录一次模型调用的耗时和usage"""
+        self.stats[level].add(seconds, usage)
+
+    def observe(self, same_coordinate_count=0, parse_failed=False, action=None):
+        """
+        报告本步的信号，按需升级或回落
+
+        返回:
+            str: 触发升级的原因，未升级时返回None
+        """
+        self._parse_failure_count = self._parse_failure_count + 1 if parse_failed else 0
+        self._page_loading_count = self._page_loading_count + 1 if action == "page_loading" else 0
+        reason = None
+        if self._parse_failure_count >= self.parse_failures:
+            reason = "模型输出解析失败"
+        elif self._page_loading_count >= self.page_loading_streak:
+            reason = "连续返回page_loading"
+        elif same_coordinate_count >= self.same_coordinate_streak:
+            reason = "连续点击相同坐标"
+
+        if reason is not None:
+            self._calm_steps = 0
+            if self.level < len(self.tiers) - 1:
+                self.level += 1
+                self.escalations += 1
+                self._parse_failure_count = 0
+                self._page_loading_count = 0
+                return reason
+            return None
+        if self.level > 0:
+            self._calm_steps += 1
+            if self._calm_steps >= self.hold_steps:
+                self.level -= 1
+                self._calm_steps = 0
+        return None
+
+    def report(self):
+        """返回统计摘要文本"""
+        lines = [f"模型路由: 升级 {self.escalations} 次"]
+        for stats in self.stats:
+            average = stats.seconds / stats.calls if stats.calls else 0.0
+            lines.append(f"  档位[{stats.name}]: 调用 {stats.calls} 次，平均耗时 {average:.2f}秒，"
+                         f"输入token {stats.prompt_tokens}，输出token {stats.completion_tokens}，费用 {stats.cost:.4f}")
+        return "\n".join(lines)
+
+
+def create_router(config):
+    """按配置创建模型路由，未启用时返回None"""
+    settings = dict(DEFAULT_ROUTER_CONFIG)
+    settings.update(config or {})
+    if not settings["enabled"]:
+        return None
+    return ModelRouter(
+        settings["tiers"],
+        same_coordinate_streak=settings["same_coordinate_streak"],
+        parse_failures=settings["parse_failures"],
+        page_loading_streak=settings["page_loading_streak"],
+        hold_steps=settings["hold_steps"]
+    )
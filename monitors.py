@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+多显示器模块
+检测各显示器的位置和尺寸，按显示器截图或把所有显示器拼接为一张图，
+并为每个显示器缓存截图像素到鼠标坐标的缩放比例（DPI），整个会话只检测一次
+"""
+import cv2
+import numpy as np
+
+
+class MonitorInfo:
+    """
+    单个显示器的几何信息
+
+    属性:
+        index: 显示器序号（从1开始，与mss一致）
+        left/top: 显示器左上角在鼠标坐标系中的位置
+        width/height: 显示器在鼠标坐标系中的尺寸
+        dpi_scale: 截图像素与鼠标坐标的比例（如Retina屏为2），首次截图时测得
+    """
+    def __init__(self, index, left, top, width, height):
+        self.index = index
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.dpi_scale = None
+
+    def contains(self, x, y):
+        """判断鼠标坐标(x, y)是否位于该显示器内，右、下边缘也算在内（千分比坐标1000映射到边缘上）"""
+        return self.left <= x <= self.left + self.width and self.top <= y <= self.top + self.height
+
+    def __repr__(self):
+        return (f"MonitorInfo({self.index}, left={self.left}, top={self.top}, "
+                f"size={self.width}x{self.height}, dpi_scale={self.dpi_scale})")
+
+
+def detect_monitors():
+    """
+    检测所有显示器
+
+    返回:
+        list: MonitorInfo列表，优先使用mss获取多显示器信息，失败时退回pyautogui的主屏尺寸
+    """
+    try:
+        import mss
+        with mss.mss() as sct:
+            return [MonitorInfo(i, m["left"], m["top"], m["width"], m["height"])
+                    for i, m in enumerate(sct.monitors) if i > 0]
+    except Exception:
+        pass
+    try:
+        import pyautogui
+        width, height = pyautogui.size()
+        return [MonitorInfo(1, 0, 0, width, height)]
+    except Exception:
+        return []
+
+
+class MonitorLayout:
+    """
+    显示器布局，负责按显示器截图并给出截图到鼠标坐标的变换
+
+    变换统一表示为 (像素缩放比例, x偏移, y偏移)：
+        鼠标坐标 = 截图像素坐标 / 像素缩放比例 + 偏移
+    """
+
+    def __init__(self, monitors):
+        if not monitors:
+            raise RuntimeError("未检测到显示器")
+        self.monitors = monitors
+        self.left = min(m.left for m in monitors)
+        self.top = min(m.top for m in monitors)
+        self.right = max(m.left + m.width for m in monitors)
+        self.bottom = max(m.top + m.height for m in monitors)
+
+    @property
+    def width(self):
+        return self.right - self.left
+
+    @property
+    def height(self):
+        return self.bottom - self.top
+
+    def get_monitor(self, index):
+        """按序号获取显示器，序号越界时抛出ValueError"""
+        for monitor in self.monitors:
+            if monitor.index == index:
+                return monitor
+        raise ValueError(f"不存在第 {index} 个显示器，共 {len(self.monitors)} 个")
+
+    def monitor_at(self, x, y):
+        """返回包含鼠标坐标(x, y)的显示器，不在任何显示器内时返回None"""
+        for monitor in self.monitors:
+            if monitor.contains(x, y):
+                return monitor
+        return None
+
+    def _grab_monitor(self, backend, monitor, pool=None):
+        image = backend.grab_monitor(monitor, (self.left, self.top), pool)
+        if monitor.dpi_scale is None:
+            # 每个显示器只在第一次截图时测量一次DPI比例，之后复用
+            monitor.dpi_scale = image.shape[1] / monitor.width
+        return image
+
+    def capture(self, backend, target, pool=None):
+        """
+        截取指定显示器或所有显示器
+
+        参数:
+            backend: 截图后端
+            target: 显示器序号；0表示所有显示器拼接
+            pool: 帧缓冲池，截图、缩放和拼接画布都复用其中的缓冲区
+
+        返回:
+            tuple: (BGR图像, 像素缩放比例, x偏移, y偏移, 鼠标坐标系下的宽, 高)
+        """
+        if target and target > 0:
+            monitor = self.get_monitor(target)
+            image = self._grab_monitor(backend, monitor, pool)
+            return image, monitor.dpi_scale, monitor.left, monitor.top, monitor.width, monitor.height
+
+        if len(self.monitors) == 1:
+            monitor = self.monitors[0]
+            image = self._grab_monitor(backend, monitor, pool)
+            return image, monitor.dpi_scale, monitor.left, monitor.top, monitor.width, monitor.height
+
+        # 多显示器拼接：各显示器先按自身DPI缩放到鼠标坐标尺寸，再放到虚拟屏幕中的对应位置，
+        # 这样整张图只有一个统一的变换，跨显示器的拖拽也能正确映射
+        if pool is not None:
+            canvas = pool.get((self.height, self.width, 3))
+            canvas.fill(0)
+        else:
+            canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        for monitor in self.monitors:
+            image = self._grab_monitor(backend, monitor, pool)
+            if image.shape[1] != monitor.width or image.shape[0] != monitor.height:
+                dst = pool.get((monitor.height, monitor.width, 3)) if pool is not None else None
+                image = cv2.resize(image, (monitor.width, monitor.height), dst=dst, interpolation=cv2.INTER_AREA)
+            x = monitor.left - self.left
+            y = monitor.top - self.top
+            canvas[y:y + monitor.height, x:x + monitor.width] = image
+        return canvas, 1, self.left, self.top, self.width, self.height
+
+
+# 会话级缓存的显示器布局
+_layout = None
+
+
+def get_monitor_layout():
+    """获取显示器布局，整个会话只检测一次"""
+    global _layout
+    if _layout is None:
+        _layout = MonitorLayout(detect_monitors())
+        for monitor in _layout.monitors:
+            print(f"检测到显示器: {monitor}")
+    return _layout
+
+
+def reset_monitor_layout():
+    """清空缓存的显示器布局，下次使用时重新检测（按显示器截图时每个任务开始前调用）"""
+    global _layout
+    _layout = None
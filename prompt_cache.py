@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+提示词前缀缓存模块
+请求按"不变的部分在前、变化的部分在后"排列：系统提示词、用户任务、截图、历史操作和当前时间，
+系统提示词在多次循环和多次任务之间逐字节相同，服务端的前缀缓存可以命中。
+支持火山方舟的上下文缓存接口：用 /context/create 创建 common_prefix 缓存，
+之后的请求通过 /context/chat/completions 只发送缓存之后的消息
+"""
+import time
+import hashlib
+import asyncio
+
+import openai
+from openai.types.chat import ChatCompletion
+
+
+# 默认缓存配置
+DEFAULT_CACHE_CONFIG = {
+    "context_cache": False,  # 是否使用方舟上下文缓存接口（其他服务保持False，仅依赖服务端自动前缀缓存）
+    "ttl": 3600              # 上下文缓存的有效期（秒）
+}
+
+
+def usage_cached_tokens(usage):
+    """从usage中读取命中缓存的输入token数，服务端未返回时为0"""
+    if usage is None:
+        return 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None:
+        return 0
+    if isinstance(details, dict):
+        return details.get("cached_tokens", 0) or 0
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+def format_cache_usage(usage):
+    """返回本次请求的输入token与缓存命中情况文本"""
+    if usage is None:
+        return "服务端未返回usage"
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    cached = usage_cached_tokens(usage)
+    ratio = cached / prompt_tokens * 100 if prompt_tokens else 0.0
+    return f"输入token {prompt_tokens}（缓存命中 {cached}，未命中 {prompt_tokens - cached}，命中率 {ratio:.0f}%）"
+
+
+class ContextCache:
+    """
+    方舟上下文缓存
+
+    按 (模型, 系统提示词) 缓存context_id，过期前复用；
+    提示词或模型变化时自动创建新的缓存。只在执行引擎的事件循环中使用
+    """
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        # 服务不提供上下文缓存接口时置为False，本次运行不再尝试
+        self.available = True
+        self.created = 0
+        self._entries = {}
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _key(model, system_content):
+        return model, hashlib.sha1(system_content.encode("utf-8")).hexdigest()
+
+    async def get_context_id(self, client, model, system_content):
+        """获取（必要时创建）系统提示词对应的context_id"""
+        key = self._key(model, system_content)
+        async with self._lock:
+            entry = self._entries.get(key)
+            # 提前一分钟视为过期，避免请求途中缓存失效
+            if entry is not None and entry[1] > time.time() + 60:
+                return entry[0]
+            try:
+                response = await client.post("/context/create", cast_to=object, body={
+                    "model": model,
+                    "mode": "common_prefix",
+                    "messages": [{"role": "system", "content": system_content}],
+                    "ttl": self.ttl
+                })
+            except openai.NotFoundError:
+                self.available = False
+                raise
+            context_id = response["id"]
+            self._entries[key] = (context_id, time.time() + self.ttl)
+            self.created += 1
+            return context_id
+
+    def invalidate(self, model, system_content):
+        """缓存在服务端失效时删除本地记录，下次请求重新创建"""
+        self._entries.pop(self._key(model, system_content), None)
+
+    async def create_completion(self, client, request):
+        """
+        通过上下文缓存发出请求
+
+        参数:
+            client: AsyncOpenAI客户端
+            request: build_model_request返回的参数，第一条消息为系统提示词
+
+        返回:
+            ChatCompletion
+        """
+        system_content = request["messages"][0]["content"]
+        context_id = await self.get_context_id(client, request["model"], system_content)
+        body = {
+            "context_id": context_id,
+            "model": request["model"],
+            # 系统提示词已在缓存中，只发送之后的消息
+            "messages": request["messages"][1:],
+        }
+        body.update(request.get("extra_body") or {})
+        return await client.post("/context/chat/completions", cast_to=ChatCompletion, body=body)
@@ -31,7 +31,7 @@ WINDOW_MOVE_DISTANCE = 600  # 窗口移动距离，超过500像素
 
 # 导入AI控制相关函数
 import vl_model_test_doubao2
-from vl_model_test_doubao2 import auto_control_computer, set_coordinate_callback
+from vl_model_test_doubao2 import auto_control_computer, set_coordinate_callback, set_usage_callback
 
 # 导入日志窗口模块
 from log_window import init_log_window
@@ -41,6 +41,7 @@ class AIWorker(QThread):
     finished = pyqtSignal(str)
     error = pyqtSignal(str)
     ai_coordinate = pyqtSignal(float, float)  # 发送AI输出的坐标信号，使用浮点数类型
+    usage_updated = pyqtSignal(dict)  # 每一步结束后发送任务用量汇总
     
     def __init__(self, user_content, parent=None):
         super().__init__(parent)
@@ -54,11 +55,11 @@ class AIWorker(QThread):
                 self.ai_coordinate.emit(coords[0], coords[1])
             
             set_coordinate_callback(coordinate_callback)
+            # 用量汇总通过信号发送给主线程更新界面
+            set_usage_callback(self.usage_updated.emit)
             
-            # 获取时间字符串，年月日时分
-            time_str = time.strftime("%Y-%m-%d %H:%M", time.localtime())
-            # 用户输入内容添加时间
-            user_content2 = "当前时间为:"+time_str + "\n" + "用户任务为:"+self.user_content
+            # 当前时间由每一步的请求附加在历史操作之后，任务内容保持不变以便前缀缓存命中
+            user_content2 = "用户任务为:"+self.user_content
             result = auto_control_computer(user_content2)
             self.finished.emit(result)
         except Exception as e:
@@ -453,10 +454,8 @@ class AIWindow(QWidget):
         # 重置退出标志
         vl_model_test_doubao2.should_exit = False
         
-        # 获取时间字符串，年月日时分
-        time_str = time.strftime("%Y-%m-%d %H:%M", time.localtime())
-        # 用户输入内容添加时间
-        user_content = "当前时间为:" + time_str + "\n" + "用户任务为:" + user_input
+        # 任务前缀和当前时间由AIWorker添加
+        user_content = user_input
         
         # 更新状态
         self.status_label.setText('🤖 AI正在执行中...')
@@ -490,10 +489,12 @@ class AIWindow(QWidget):
         
         # 连接AI坐标信号
         self.ai_thread.ai_coordinate.connect(self.handle_ai_coordinate)
+        # 连接用量信号
+        self.ai_thread.usage_updated.connect(self.handle_usage_updated)
         
     def stop_ai(self):
-        # 设置全局变量，停止AI执行
-        vl_model_test_doubao2.should_exit = True
+        # 设置全局变量并取消执行引擎中的任务，进行中的模型请求立即中止
+        vl_model_test_doubao2.request_stop()
         
         # 更新状态
         self.status_label.setText('⏹️ 正在停止AI执行...')
@@ -566,6 +567,16 @@ class AIWindow(QWidget):
         # 重置AI控制鼠标标志
         self.is_ai_controlling = False
         
+    def handle_usage_updated(self, totals):
+        # 执行过程中在状态栏显示步数、token和费用
+        if not self.is_ai_controlling:
+            return
+        self.status_label.setText(
+            f"🤖 AI正在执行中... 第 {totals['steps']} 步 · "
+            f"token {totals['prompt_tokens'] + totals['completion_tokens']}"
+            f"（缓存 {totals['cached_tokens']}） · 费用 {totals['cost']:.4f}"
+        )
+
     def handle_ai_coordinate(self, x, y):
         # 只有当AI控制鼠标时才处理
         if not self.is_ai_controlling:
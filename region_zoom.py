@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+区域放大定位模块
+大屏幕上整屏截图会被缩小到max_png，小图标损失大量像素。先用低分辨率整屏确定大致区域，
+再从原始分辨率截图中裁出该区域请求一次精确坐标
+"""
+import cv2
+
+from cv_shot_doubao import ScreenFrame
+from prompt_cache import usage_cached_tokens
+
+
+# 可以进行区域放大的单点操作
+ZOOM_ACTIONS = ("click", "double_click", "long_press", "right_click", "scroll_up", "scroll_down")
+
+
+def should_zoom(frame, action, coordinates):
+    """
+    判断本次操作是否需要区域放大
+
+    只有整屏截图被缩小过、保留了原始分辨率图像，且是单点操作时才放大
+    """
+    if frame.full_image is None or frame.scale >= frame.full_scale:
+        return False
+    if action not in ZOOM_ACTIONS:
+        return False
+    if not isinstance(coordinates, (list, tuple)) or len(coordinates) != 2:
+        return False
+    return all(isinstance(value, (int, float)) for value in coordinates)
+
+
+def compute_zoom_region(frame, coordinates, zoom_factor=3.0):
+    """
+    计算以粗定位点为中心的放大区域
+
+    参数:
+        frame: 整屏截图帧（需保留full_image）
+        coordinates: 粗定位的归一化坐标 [x, y]（0-1000）
+        zoom_factor: 区域边长为整屏的 1/zoom_factor
+
+    返回:
+        tuple: 原始分辨率下的区域 (left, top, width, height)
+    """
+    # 区域以full_image像素为单位
+    full_height, full_width = frame.full_image.shape[:2]
+    region_width = max(1, int(full_width / zoom_factor))
+    region_height = max(1, int(full_height / zoom_factor))
+    center_x = coordinates[0] / 1000 * full_width
+    center_y = coordinates[1] / 1000 * full_height
+    left = int(min(max(center_x - region_width / 2, 0), full_width - region_width))
+    top = int(min(max(center_y - region_height / 2, 0), full_height - region_height))
+    return left, top, region_width, region_height
+
+
+def crop_zoom_frame(frame, region, max_png=1280):
+    """
+    从原始分辨率截图中裁出放大区域，生成新的截图帧
+
+    返回的帧带有裁剪偏移，map_coordinates会依次还原区域内缩放和裁剪偏移，
+    得到整屏上的实际坐标
+
+    参数:
+        frame: 整屏截图帧
+        region: (left, top, width, height)
+        max_png: 放大图的最长边限制
+
+    返回:
+        ScreenFrame: 放大区域的截图帧
+    """
+    left, top, width, height = region
+    crop = frame.full_image[top:top + height, left:left + width]
+    scale = 1
+    max_edge = max(width, height)
+    if max_edge > max_png:
+        scale = max_png / max_edge
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    else:
+        crop = crop.copy()
+    # 裁剪偏移换算回鼠标坐标，缩放比例同时包含显示器DPI比例
+    return ScreenFrame(crop, scale * frame.full_scale, frame.screen_width, frame.screen_height, frame.timestamp,
+                       offset_x=frame.offset_x + left / frame.full_scale,
+                       offset_y=frame.offset_y + top / frame.full_scale)
+
+
+def build_zoom_prompt(element_info, action):
+    """生成第二阶段精确定位的提示文本"""
+    return (f"【区域放大定位】当前图片是上一步所选区域的放大截图，不是整个屏幕。"
+            f"请只在这张放大图中找到目标元素“{element_info}”，给出它中心点的精确坐标"
+            f"（坐标按这张放大图归一化至0-1000），action保持为“{action}”，"
+            f"whether_completed填写“False”。\n")
+
+
+def rebase_coordinates(coordinates, source_frame, target_frame):
+    """
+    把source_frame上的单点坐标（归一化至1000）换算为target_frame上的坐标
+    用于把放大图上的定位结果换回整屏截图坐标（如写入响应缓存）
+    """
+    screen_x = coordinates[0] / 1000 * source_frame.width / source_frame.scale + source_frame.offset_x
+    screen_y = coordinates[1] / 1000 * source_frame.height / source_frame.scale + source_frame.offset_y
+    return [round((screen_x - target_frame.offset_x) * target_frame.scale / target_frame.width * 1000),
+            round((screen_y - target_frame.offset_y) * target_frame.scale / target_frame.height * 1000)]
+
+
+class GroundingStats:
+    """
+    按定位模式统计一次任务的步数、模型调用次数和token用量，便于对比单次定位与区域放大定位
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.steps = 0
+        self.model_calls = 0
+        self.zoom_calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def add_call(self, usage, zoom=False):
+        """记录一次模型调用及其usage"""
+        self.model_calls += 1
+        if zoom:
+            self.zoom_calls += 1
+        if usage is not None:
+            self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            self.cached_tokens += usage_cached_tokens(usage)
+            self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    def report(self):
+        """返回统计摘要文本"""
+        return (f"定位模式[{self.mode}]: 步数 {self.steps}，模型调用 {self.model_calls} 次"
+                f"（放大定位 {self.zoom_calls} 次），输入token {self.prompt_tokens}"
+                f"（缓存命中 {self.cached_tokens}），"
+                f"输出token {self.completion_tokens}")
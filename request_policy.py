@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+模型请求策略模块
+为视觉模型请求提供单次超时、带抖动的指数退避重试，以及对冲请求：
+请求耗时超过历史p95时再发出一个相同的请求，采用先返回的结果，降低尾延迟
+"""
+import time
+import random
+import asyncio
+from collections import deque
+
+import openai
+
+
+# 默认请求策略
+DEFAULT_REQUEST_POLICY = {
+    "timeout": 30.0,           # 单次请求超时（秒）
+    "max_retries": 3,          # 临时性错误的最大重试次数
+    "backoff_base": 0.5,       # 第一次重试前的最长等待（秒），之后每次翻倍
+    "backoff_max": 8.0,        # 单次退避等待上限（秒）
+    "hedge": False,            # 是否启用对冲请求
+    "hedge_percentile": 0.95,  # 超过该分位的历史耗时后发出对冲请求
+    "hedge_min_samples": 10,   # 历史样本不足时不发出对冲请求
+    "hedge_min_delay": 1.0     # 对冲等待时间的下限（秒）
+}
+
+# 可以重试的临时性错误：超时、连接失败、限流和服务端错误
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+def is_retryable(error):
+    """判断错误是否为可重试的临时性错误"""
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def backoff_delay(attempt, base, maximum, rng=random):
+    """
+    计算第attempt次重试前的等待时间（完全抖动的指数退避）
+
+    在 [0, min(maximum, base * 2^attempt)] 内均匀随机，避免多个客户端同时重试
+    """
+    return rng.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """
+    请求耗时统计
+
+    保存最近window次成功请求的耗时，用于计算对冲请求的触发时间
+    """
+
+    def __init__(self, window=100):
+        self._samples = deque(maxlen=window)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, ratio):
+        """返回最近样本的分位耗时（秒），无样本时返回None"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(round(ratio * (len(ordered) - 1))))]
+
+
+class RequestPolicy:
+    """
+    按策略执行模型请求
+
+    request_factory每次调用返回一个新的协程（一次完整的模型请求），
+    重试和对冲时会多次调用。统计信息在多次任务之间累积
+    """
+
+    def __init__(self, config=None, tracker=None, rng=None):
+        self.config = dict(DEFAULT_REQUEST_POLICY)
+        self.update(config)
+        self.tracker = tracker or LatencyTracker()
+        self._rng = rng or random.Random()
+        self.requests = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def update(self, config):
+        """更新策略参数（配置文件修改后调用）"""
+        if config:
+            self.config.update(config)
+
+    def hedge_delay(self):
+        """对冲请求的等待时间，未启用或样本不足时返回None"""
+        if not self.config["hedge"] or len(self.tracker) < self.config["hedge_min_samples"]:
+            return None
+        return max(self.config["hedge_min_delay"], self.tracker.percentile(self.config["hedge_percentile"]))
+
+    async def _attempt(self, request_factory):
+        self.requests += 1
+        try:
+            return await asyncio.wait_for(request_factory(), self.config["timeout"])
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    async def _hedged(self, request_factory):
+        start_time = time.perf_counter()
+        primary = asyncio.ensure_future(self._attempt(request_factory))
+        tasks = [primary]
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    # 第一个请求已超过历史p95，发出一个相同的请求，先返回的胜出
+                    self.hedges += 1
+                    tasks.append(asyncio.ensure_future(self._attempt(request_factory)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        self.tracker.record(time.perf_counter() - start_time)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(self, request_factory, sleep=asyncio.sleep):
+        """
+        执行请求，临时性错误按退避策略重试
+
+        参数:
+            request_factory: 无参函数，每次调用返回一个发出模型请求的协程
+            sleep: 退避等待函数
+
+        返回:
+            请求结果；重试次数用完或遇到不可重试的错误时抛出最后一次的异常
+        """
+        max_retries = self.config["max_retries"]
+        for attempt in range(max_retries + 1):
+            try:
+                return await self._hedged(request_factory)
+            except Exception as e:
+                if attempt >= max_retries or not is_retryable(e):
+                    self.failures += 1
+                    raise
+                delay = backoff_delay(attempt, self.config["backoff_base"], self.config["backoff_max"], self._rng)
+                self.retries += 1
+                print(f"模型请求失败（{type(e).__name__}: {e}），{delay:.2f}秒后第 {attempt + 1} 次重试")
+                await sleep(delay)
+
+    def report(self):
+        """返回统计摘要文本"""
+        p95 = self.tracker.percentile(0.95)
+        p95_text = f"{p95:.2f}秒" if p95 is not None else "无"
+        return (f"模型请求: 共 {self.requests} 次，重试 {self.retries} 次，超时 {self.timeouts} 次，"
+                f"失败 {self.failures} 次，对冲 {self.hedges} 次（对冲胜出 {self.hedge_wins} 次），p95 {p95_text}")
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+画面响应缓存模块
+重复性的任务（如每天给同一个联系人发消息）会在相同的画面上重复请求模型。缓存以画面的感知哈希、
+任务内容和归一化的最近操作为键，保存解析后的操作；画面相似（哈希距离不超过阈值）时直接使用缓存，
+不再请求模型。按LRU淘汰，任务结束时写入磁盘
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import cv2
+
+
+def perceptual_hash(image):
+    """
+    计算截图的64位差值哈希（dHash）
+
+    缩小为9x8的灰度图，比较每行相邻像素的明暗。画面整体相同、只有光标闪烁或时钟变化时
+    哈希相同或只差几位
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming_distance(a, b):
+    """两个哈希之间不同的位数"""
+    return bin(a ^ b).count("1")
+
+
+def normalize_action(element, grid=20):
+    """
+    将一步操作归一化为历史键的一项：操作类型、量化后的坐标和输入内容
+
+    坐标按grid（千分比坐标）量化，模型每次给出的坐标有几个像素的偏差时仍然相同
+    """
+    coordinates = element.get("coordinates") or []
+    if coordinates and isinstance(coordinates[0], (list, tuple)):
+        points = [[int(value) // grid for value in point] for point in coordinates]
+    else:
+        points = [int(value) // grid for value in coordinates]
+    return f"{element.get('action', '')}|{points}|{element.get('type_information', '')}"
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    按画面感知哈希缓存模型输出
+
+    任务和历史键必须完全相同，画面哈希的距离不超过max_distance即视为命中
+    """
+
+    def __init__(self, path=None, max_entries=500, max_distance=4):
+        """
+        参数:
+            path: 缓存文件路径，为None时不持久化
+            max_entries: 最多保存的条目数，超出时淘汰最久未使用的条目
+            max_distance: 画面哈希的最大汉明距离（0-64）
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        if path and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def make_key(image, task, history):
+        """
+        生成缓存键
+
+        参数:
+            image: 发送给模型的截图
+            task: 任务内容
+            history: normalize_action归一化后的最近操作列表
+
+        返回:
+            tuple: (任务与历史摘要, 画面哈希)
+        """
+        return _digest(task + "\n" + "\n".join(history)), perceptual_hash(image)
+
+    def get(self, key):
+        """查找相似画面的缓存，命中时返回 (缓存键, 操作字典)，未命中返回None"""
+        context, image_hash = key
+        with self._lock:
+            best = None
+            for entry_key in self._entries:
+                if entry_key[0] != context:
+                    continue
+                distance = hamming_distance(entry_key[1], image_hash)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, entry_key)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best[1])
+            return best[1], dict(self._entries[best[1]])
+
+    def put(self, key, element):
+        """保存一次模型输出"""
+        with self._lock:
+            self._entries[key] = dict(element)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def invalidate(self, key):
+        """删除一条缓存（使用缓存后画面没有推进时调用）"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._dirty = True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        """从磁盘读取缓存，文件损坏时从空缓存开始"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+            with self._lock:
+                self._entries = OrderedDict(((item["context"], int(item["image_hash"], 16)), item["element"])
+                                            for item in items)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"读取响应缓存失败: {e}")
+
+    def save(self):
+        """写入磁盘（先写临时文件再替换，避免写入中断损坏缓存）"""
+        if not self.path or not self._dirty:
+            return False
+        with self._lock:
+            items = [{"context": context, "image_hash": f"{image_hash:016x}", "element": element}
+                     for (context, image_hash), element in self._entries.items()]
+            self._dirty = False
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        return True
+
+    def report(self):
+        """返回统计摘要文本"""
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0.0
+        return f"响应缓存: 命中 {self.hits} 次，未命中 {self.misses} 次（命中率 {ratio:.0f}%），共 {len(self)} 条"
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+模型输出校验与修复模块
+在解析JSON之后、执行操作之前严格检查模型输出：操作类型必须是约定的枚举值，坐标的形状要与操作匹配，
+坐标值要在0-1000的千分比范围内。只在本地修复格式问题（大小写、分隔符、数字字符串、轻微越界等），
+别名、边界框等需要猜测含义的问题交给调用方向模型追问，而不是执行一个猜测的操作
+"""
+import json
+
+
+# 提示词约定的操作类型
+VALID_ACTIONS = ("click", "double_click", "long_press", "right_click", "drag", "scroll_up", "scroll_down",
+                 "hotkey", "page_loading")
+
+# 不使用坐标的操作
+NO_COORDINATE_ACTIONS = ("hotkey", "page_loading")
+
+COMPLETION_VALUES = ("True", "False", "difficult")
+
+# 千分比坐标的上限
+COORDINATE_MAX = 1000
+
+
+def _to_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+def _normalize_action(action, repairs, problems):
+    if not isinstance(action, str):
+        problems.append(f"action 必须是字符串，实际为 {action!r}")
+        return action
+    # 只修复大小写和分隔符，别名和近义词交给模型确认
+    normalized = action.strip().lower().replace("-", "_").replace(" ", "_")
+    if normalized not in VALID_ACTIONS:
+        problems.append(f"action 取值 {action!r} 不在 {', '.join(VALID_ACTIONS)} 之中")
+        return action
+    if normalized != action:
+        repairs.append(f"action {action!r} -> {normalized!r}")
+    return normalized
+
+
+def _normalize_point(point, tolerance, repairs, problems, label):
+    """检查单个点 [x, y]，数字字符串转为数字，轻微越界时截断到范围内"""
+    if not isinstance(point, (list, tuple)) or len(point) != 2:
+        problems.append(f"{label} 应为 [x, y]，实际为 {point!r}")
+        return None
+    values = [_to_number(value) for value in point]
+    if any(value is None for value in values):
+        problems.append(f"{label} 含有非数字的值: {point!r}")
+        return None
+    result = []
+    for value in values:
+        if value < -tolerance or value > COORDINATE_MAX + tolerance:
+            problems.append(f"{label} 的值 {value:g} 超出0-{COORDINATE_MAX}的千分比坐标范围")
+            return None
+        clamped = min(COORDINATE_MAX, max(0, value))
+        result.append(int(round(clamped)))
+    if result != list(point):
+        repairs.append(f"{label} {list(point)!r} -> {result!r}")
+    return result
+
+
+def _normalize_coordinates(coordinates, action, tolerance, repairs, problems):
+    """按操作类型检查坐标形状：拖拽为两个点，其余为一个点"""
+    if isinstance(coordinates, str):
+        try:
+            parsed = json.loads(coordinates)
+        except ValueError:
+            problems.append(f"coordinates 不是有效的坐标: {coordinates!r}")
+            return coordinates
+        repairs.append("coordinates 由字符串解析为数组")
+        coordinates = parsed
+    if not isinstance(coordinates, list) or not coordinates:
+        problems.append(f"coordinates 应为数组，实际为 {coordinates!r}")
+        return coordinates
+
+    nested = isinstance(coordinates[0], (list, tuple))
+    if action == "drag":
+        if not nested or len(coordinates) != 2:
+            problems.append(f"drag 需要起点和终点 [[x1, y1], [x2, y2]]，实际为 {coordinates!r}")
+            return coordinates
+        start = _normalize_point(coordinates[0], tolerance, repairs, problems, "drag 起点")
+        end = _normalize_point(coordinates[1], tolerance, repairs, problems, "drag 终点")
+        return [start, end] if start is not None and end is not None else coordinates
+
+    if nested:
+        if len(coordinates) != 1:
+            problems.append(f"{action} 只需要一个点 [x, y]，实际给出了 {len(coordinates)} 个点")
+            return coordinates
+        repairs.append(f"{action} 坐标 [[x, y]] 展开为 [x, y]")
+        coordinates = coordinates[0]
+    point = _normalize_point(coordinates, tolerance, repairs, problems, f"{action} 坐标")
+    return point if point is not None else coordinates
+
+
+def validate_action(step, tolerance=10):
+    """
+    校验并修复一个操作（主操作或计划中的后续操作）
+
+    参数:
+        step: 操作字典，包含action、coordinates、type_information，以及可省略的submit（省略时为True）
+        tolerance: 坐标允许的越界量，越界不超过该值时截断到0-1000，否则视为无效
+
+    返回:
+        tuple: (修复后的操作字典, 修复说明列表, 无法修复的问题列表)
+    """
+    repairs = []
+    problems = []
+    element = dict(step)
+    action = _normalize_action(element.get("action"), repairs, problems)
+    element["action"] = action
+
+    type_information = element.get("type_information")
+    if type_information is None:
+        element["type_information"] = ""
+    elif not isinstance(type_information, str):
+        element["type_information"] = str(type_information)
+        repairs.append("type_information 转为字符串")
+
+    submit = element.get("submit", True)
+    if isinstance(submit, str) and submit.strip().lower() in ("true", "false"):
+        repairs.append(f"submit {submit!r} 转为布尔值")
+        submit = submit.strip().lower() == "true"
+    if not isinstance(submit, bool):
+        problems.append(f"submit 应为 true 或 false，实际为 {submit!r}")
+    else:
+        element["submit"] = submit
+
+    if action in NO_COORDINATE_ACTIONS:
+        if action == "hotkey" and not element["type_information"].strip():
+            problems.append("hotkey 操作没有给出按键（type_information 为空）")
+        coordinates = element.get("coordinates")
+        if not (isinstance(coordinates, list) and len(coordinates) == 2
+                and all(_to_number(value) is not None for value in coordinates)):
+            # 快捷键和页面加载不使用坐标，模型常给出 [] 等值，统一替换为 [0, 0]
+            element["coordinates"] = [0, 0]
+            if coordinates is not None:
+                repairs.append(f"{action} 的坐标 {coordinates!r} -> [0, 0]")
+        return element, repairs, problems
+    if action in VALID_ACTIONS:
+        element["coordinates"] = _normalize_coordinates(element.get("coordinates"), action, tolerance,
+                                                        repairs, problems)
+    return element, repairs, problems
+
+
+def validate_model_response(response, tolerance=10):
+    """
+    校验并修复一次完整的模型输出
+
+    whether_completed为True或difficult时不检查操作；计划中的后续操作逐个校验，
+    从第一个无法修复的操作开始丢弃（后续操作出错不影响当前操作）
+
+    返回:
+        tuple: (修复后的输出字典, 修复说明列表, 无法修复的问题列表)
+    """
+    repairs = []
+    problems = []
+    element = dict(response)
+
+    completed = element.get("whether_completed")
+    if isinstance(completed, bool):
+        completed = "True" if completed else "False"
+    elif isinstance(completed, str):
+        completed = {value.lower(): value for value in COMPLETION_VALUES}.get(completed.strip().lower(), completed)
+    if completed not in COMPLETION_VALUES:
+        problems.append(f"whether_completed 取值 {element.get('whether_completed')!r} 不在 True/False/difficult 之中")
+    elif completed != element.get("whether_completed"):
+        repairs.append(f"whether_completed {element.get('whether_completed')!r} -> {completed!r}")
+        element["whether_completed"] = completed
+    for key in ("current_status", "element_info"):
+        if not isinstance(element.get(key), str):
+            element[key] = "" if element.get(key) is None else str(element[key])
+    if completed in ("True", "difficult"):
+        return element, repairs, problems
+
+    element, step_repairs, step_problems = validate_action(element, tolerance)
+    repairs.extend(step_repairs)
+    problems.extend(step_problems)
+
+    if element.get("next_actions"):
+        planned = []
+        for index, step in enumerate(element["next_actions"]):
+            if not isinstance(step, dict):
+                repairs.append(f"丢弃第 {index + 1} 个及之后的后续操作: 格式不正确")
+                break
+            step, step_repairs, step_problems = validate_action(step, tolerance)
+            if step_problems:
+                repairs.append(f"丢弃第 {index + 1} 个及之后的后续操作: {'；'.join(step_problems)}")
+                break
+            repairs.extend(f"后续操作{index + 1}: {repair}" for repair in step_repairs)
+            planned.append(step)
+        element["next_actions"] = planned
+    return element, repairs, problems
+
+
+def build_reask_prompt(problems):
+    """生成追问内容：指出问题，要求只输出修正后的完整JSON"""
+    lines = "\n".join(f"- {problem}" for problem in problems)
+    return (f"你上一次的输出存在以下问题，无法执行：\n{lines}\n"
+            f"请基于同一张截图重新给出这一步操作，只输出修正后的完整JSON。action 只能是 "
+            f"{'、'.join(VALID_ACTIONS)} 之一；坐标为0-1000的千分比坐标，单点为 [x, y]，"
+            f"drag 为 [[x1, y1], [x2, y2]]。")
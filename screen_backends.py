@@ -0,0 +1,503 @@
+# -*- coding: utf-8 -*-
+"""
+截图后端模块
+提供统一的截图后端接口，以及pyautogui、mss、X11共享内存和录制回放等实现，
+并在启动时测速自动选择当前环境下最快的可用后端
+"""
+import os
+import time
+import ctypes
+import ctypes.util
+import platform
+import threading
+
+import cv2
+import numpy as np
+
+
+class CaptureBackend:
+    """
+    截图后端基类
+
+    子类需实现grab()，返回整屏的BGR像素数组（uint8，形状为 高 x 宽 x 3）。
+    传入pool（FrameBufferPool）时，结果写入池中预分配的缓冲区，不再每次分配新数组
+    """
+    name = "base"
+
+    def is_available(self):
+        """当前环境是否可以使用该后端"""
+        return False
+
+    def grab(self, pool=None):
+        """截取整个屏幕，返回BGR格式的numpy数组"""
+        raise NotImplementedError
+
+    def origin(self):
+        """grab()图像左上角对应的鼠标坐标，截图帧以此作为偏移"""
+        return 0, 0
+
+    def grab_monitor(self, monitor, origin=(0, 0), pool=None):
+        """
+        截取单个显示器
+
+        默认实现从grab()的整屏图像中裁出显示器区域；整屏图像只包含主屏
+        （如Windows下的pyautogui）时直接返回整屏图像
+
+        参数:
+            monitor: MonitorInfo
+            origin: grab()图像左上角对应的鼠标坐标（虚拟屏幕原点）
+            pool: 帧缓冲池
+        """
+        image = self.grab(pool)
+        x = monitor.left - origin[0]
+        y = monitor.top - origin[1]
+        height, width = image.shape[:2]
+        if x < 0 or y < 0 or x + monitor.width > width or y + monitor.height > height:
+            return image
+        return image[y:y + monitor.height, x:x + monitor.width]
+
+    def notify_action(self):
+        """执行完一次鼠标/键盘操作后调用，供回放后端切换到下一帧"""
+        pass
+
+    def close(self):
+        """释放后端持有的资源"""
+        pass
+
+
+class PyAutoGUIBackend(CaptureBackend):
+    """基于pyautogui的截图后端（PIL截图 -> numpy -> RGB转BGR），兼容性最好但速度最慢"""
+    name = "pyautogui"
+
+    def __init__(self):
+        self._pyautogui = None
+
+    def _load(self):
+        if self._pyautogui is None:
+            import pyautogui
+            self._pyautogui = pyautogui
+        return self._pyautogui
+
+    def is_available(self):
+        try:
+            self._load()
+            return True
+        except Exception:
+            return False
+
+    def grab(self, pool=None):
+        screenshot = self._load().screenshot()
+        # PIL图像本身的分配无法避免，这里只读取其数据，颜色转换结果写入缓冲池
+        screenshot_np = np.asarray(screenshot)
+        dst = pool.get(screenshot_np.shape[:2] + (3,)) if pool is not None else None
+        return cv2.cvtColor(screenshot_np, cv2.COLOR_RGB2BGR, dst=dst)
+
+
+class MssBackend(CaptureBackend):
+    """
+    基于mss的截图后端，直接读取BGRA原始数据，避免PIL中转
+
+    默认截取范围与pyautogui一致：Linux下为整个X屏幕（mss的0号虚拟屏幕），
+    Windows和macOS下为主显示器（左上角位于鼠标坐标原点的显示器）
+    """
+    name = "mss"
+
+    def __init__(self, monitor_index=None):
+        # 0表示所有显示器组成的虚拟屏幕，1及以后为单个显示器，None为与pyautogui一致的默认范围
+        self.monitor_index = monitor_index
+        # mss实例不能跨线程使用，每个线程各自持有一个；所有实例都记录下来，close()时一起关闭
+        self._local = threading.local()
+        self._instances = []
+        self._instances_lock = threading.Lock()
+
+    def _get_sct(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None or sct not in self._instances:
+            import mss
+            sct = mss.mss()
+            self._local.sct = sct
+            with self._instances_lock:
+                self._instances.append(sct)
+        return sct
+
+    def is_available(self):
+        try:
+            sct = self._get_sct()
+            return len(sct.monitors) > (self.monitor_index or 0)
+        except Exception:
+            return False
+
+    def _grab_rect(self, rect, pool=None):
+        shot = self._get_sct().grab(rect)
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        dst = pool.get((shot.height, shot.width, 3)) if pool is not None else None
+        return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=dst)
+
+    def _rect(self):
+        monitors = self._get_sct().monitors
+        if self.monitor_index is not None:
+            return monitors[self.monitor_index]
+        if platform.system() != "Linux":
+            for monitor in monitors[1:]:
+                if monitor["left"] == 0 and monitor["top"] == 0:
+                    return monitor
+        return monitors[0]
+
+    def grab(self, pool=None):
+        return self._grab_rect(self._rect(), pool)
+
+    def origin(self):
+        # 主显示器左侧或上方还有显示器时，虚拟屏幕的左上角为负坐标
+        rect = self._rect()
+        return rect["left"], rect["top"]
+
+    def grab_monitor(self, monitor, origin=(0, 0), pool=None):
+        # mss可以直接截取单个显示器，无需先截整屏再裁剪
+        return self._grab_rect(self._get_sct().monitors[monitor.index], pool)
+
+    def close(self):
+        # 工作线程（asyncio.to_thread、稳定等待）各自创建的实例也在这里关闭，之后再截图时重新创建
+        with self._instances_lock:
+            instances, self._instances = self._instances, []
+        for sct in instances:
+            sct.close()
+        self._local.sct = None
+
+
+class _XImage(ctypes.Structure):
+    """Xlib中XImage结构体（仅声明用到的字段及其之前的布局）"""
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+        ("red_mask", ctypes.c_ulong),
+        ("green_mask", ctypes.c_ulong),
+        ("blue_mask", ctypes.c_ulong),
+        ("obdata", ctypes.c_void_p),
+    ]
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    """XShm扩展中的共享内存段描述结构体"""
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+class XShmBackend(CaptureBackend):
+    """
+    基于X11共享内存扩展（MIT-SHM）的截图后端，仅适用于Linux的X11会话
+
+    X服务器直接把根窗口像素写入与本进程共享的内存段，省去通过socket传输整屏数据
+    """
+    name = "xshm"
+
+    _ZPIXMAP = 2
+    _IPC_PRIVATE = 0
+    _IPC_CREAT = 0o1000
+    _IPC_RMID = 0
+    _ALL_PLANES = 0xFFFFFFFF
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._display = None
+        self._image = None
+        self._shminfo = None
+        self._buffer = None
+        self._xlib = None
+        self._xext = None
+        self._libc = None
+
+    def is_available(self):
+        if platform.system() != "Linux" or not os.environ.get("DISPLAY"):
+            return False
+        try:
+            self._open()
+            return True
+        except Exception:
+            self.close()
+            return False
+
+    def _open(self):
+        if self._display is not None:
+            return
+        xlib = ctypes.CDLL(ctypes.util.find_library("X11"))
+        xext = ctypes.CDLL(ctypes.util.find_library("Xext"))
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        xlib.XRootWindow.restype = ctypes.c_ulong
+        xlib.XRootWindow.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDefaultVisual.restype = ctypes.c_void_p
+        xlib.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDisplayWidth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDisplayHeight.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.restype = ctypes.POINTER(_XImage)
+        xext.XShmCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                                         ctypes.c_char_p, ctypes.POINTER(_XShmSegmentInfo),
+                                         ctypes.c_uint, ctypes.c_uint]
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(_XImage),
+                                      ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+        display = xlib.XOpenDisplay(None)
+        if not display:
+            raise RuntimeError("无法连接X11显示服务")
+        self._xlib, self._xext, self._libc = xlib, xext, libc
+        self._display = display
+        if not xext.XShmQueryExtension(display):
+            raise RuntimeError("X服务器不支持MIT-SHM扩展")
+
+        screen = xlib.XDefaultScreen(display)
+        self._root = xlib.XRootWindow(display, screen)
+        width = xlib.XDisplayWidth(display, screen)
+        height = xlib.XDisplayHeight(display, screen)
+
+        shminfo = _XShmSegmentInfo()
+        image = xext.XShmCreateImage(display, xlib.XDefaultVisual(display, screen),
+                                     xlib.XDefaultDepth(display, screen), self._ZPIXMAP,
+                                     None, ctypes.byref(shminfo), width, height)
+        if not image:
+            raise RuntimeError("XShmCreateImage失败")
+        if image.contents.bits_per_pixel != 32:
+            raise RuntimeError(f"不支持的像素位深: {image.contents.bits_per_pixel}")
+
+        size = image.contents.bytes_per_line * image.contents.height
+        shmid = libc.shmget(self._IPC_PRIVATE, size, self._IPC_CREAT | 0o600)
+        if shmid < 0:
+            raise RuntimeError("shmget失败")
+        shmaddr = libc.shmat(shmid, None, 0)
+        if shmaddr in (None, ctypes.c_void_p(-1).value):
+            libc.shmctl(shmid, self._IPC_RMID, None)
+            raise RuntimeError("shmat失败")
+        shminfo.shmid = shmid
+        shminfo.shmaddr = shmaddr
+        shminfo.readOnly = 0
+        image.contents.data = shmaddr
+        self._image = image
+        self._shminfo = shminfo
+
+        if not xext.XShmAttach(display, ctypes.byref(shminfo)):
+            raise RuntimeError("XShmAttach失败")
+        xlib.XSync(display, 0)
+        # X服务器已挂载该段，标记删除后进程退出时系统会自动回收
+        libc.shmctl(shmid, self._IPC_RMID, None)
+
+        bytes_per_line = image.contents.bytes_per_line
+        raw = (ctypes.c_ubyte * size).from_address(shmaddr)
+        self._buffer = np.frombuffer(raw, dtype=np.uint8).reshape(height, bytes_per_line // 4, 4)[:, :width, :]
+
+    def grab(self, pool=None):
+        with self._lock:
+            self._open()
+            if not self._xext.XShmGetImage(self._display, self._root, self._image, 0, 0, self._ALL_PLANES):
+                raise RuntimeError("XShmGetImage失败")
+            # 共享内存在下一次截图时会被覆盖，这里转换出独立的BGR副本
+            dst = pool.get(self._buffer.shape[:2] + (3,)) if pool is not None else None
+            return cv2.cvtColor(self._buffer, cv2.COLOR_BGRA2BGR, dst=dst)
+
+    def close(self):
+        with self._lock:
+            if self._display is None:
+                return
+            if self._shminfo is not None and self._shminfo.shmaddr:
+                try:
+                    self._xext.XShmDetach(self._display, ctypes.byref(self._shminfo))
+                    self._libc.shmdt(self._shminfo.shmaddr)
+                except Exception:
+                    pass
+            self._xlib.XCloseDisplay(self._display)
+            self._display = None
+            self._image = None
+            self._shminfo = None
+            self._buffer = None
+
+
+class ReplayBackend(CaptureBackend):
+    """
+    回放后端：从图片文件或图片文件夹中依次提供录制好的画面，无需真实桌面
+
+    每次执行操作（notify_action）后切换到下一帧，循环播放
+    """
+    name = "replay"
+
+    IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+
+    def __init__(self, source, loop=True):
+        """
+        参数:
+            source: 单张图片路径或包含图片的文件夹路径（按文件名排序）
+            loop: 播放到最后一帧后是否从头开始
+        """
+        self.source = source
+        self.loop = loop
+        self.index = 0
+        self._frames = None
+
+    def _load(self):
+        if self._frames is not None:
+            return self._frames
+        if not self.source:
+            raise RuntimeError("回放后端未指定图片来源")
+        if os.path.isdir(self.source):
+            paths = [os.path.join(self.source, name) for name in sorted(os.listdir(self.source))
+                     if name.lower().endswith(self.IMAGE_EXTENSIONS)]
+        else:
+            paths = [self.source]
+        frames = []
+        for path in paths:
+            image = cv2.imread(path)
+            if image is not None:
+                frames.append(image)
+        if not frames:
+            raise RuntimeError(f"回放来源中没有可用的图片: {self.source}")
+        self._frames = frames
+        return frames
+
+    def is_available(self):
+        try:
+            self._load()
+            return True
+        except Exception:
+            return False
+
+    def grab(self, pool=None):
+        frame = self._load()[self.index]
+        if pool is None:
+            return frame.copy()
+        dst = pool.get(frame.shape, frame.dtype)
+        np.copyto(dst, frame)
+        return dst
+
+    def notify_action(self):
+        frames = self._load()
+        if self.index + 1 < len(frames):
+            self.index += 1
+        elif self.loop:
+            self.index = 0
+
+
+# 自动选择时参与测速的后端，按兼容性从高到低排列
+AUTO_BACKEND_NAMES = ("xshm", "mss", "pyautogui")
+
+
+def create_capture_backend(name, replay_path=None):
+    """
+    按名称创建截图后端
+
+    参数:
+        name: "pyautogui"、"mss"、"xshm"或"replay"
+        replay_path: 回放后端使用的图片文件或文件夹
+
+    返回:
+        CaptureBackend: 后端实例
+    """
+    if name == "pyautogui":
+        return PyAutoGUIBackend()
+    if name == "mss":
+        return MssBackend()
+    if name == "xshm":
+        return XShmBackend()
+    if name == "replay":
+        return ReplayBackend(replay_path)
+    raise ValueError(f"未知的截图后端: {name}")
+
+
+def probe_capture_backends(names=AUTO_BACKEND_NAMES, rounds=3):
+    """
+    对各截图后端测速
+
+    参数:
+        names: 参与测速的后端名称
+        rounds: 每个后端截图次数，取平均耗时
+
+    返回:
+        list: [(后端实例, 平均耗时秒)]，按耗时从小到大排序；不可用的后端不在结果中
+    """
+    results = []
+    for name in names:
+        backend = create_capture_backend(name)
+        try:
+            if not backend.is_available():
+                continue
+            # 第一次截图包含初始化开销，不计入耗时
+            backend.grab()
+            start_time = time.perf_counter()
+            for _ in range(rounds):
+                backend.grab()
+            results.append((backend, (time.perf_counter() - start_time) / rounds))
+        except Exception as e:
+            print(f"截图后端 {name} 测速失败: {e}")
+            backend.close()
+    results.sort(key=lambda item: item[1])
+    # 只保留最快的后端，其余释放资源
+    for backend, _ in results[1:]:
+        backend.close()
+    return results
+
+
+def select_capture_backend(name="auto", replay_path=None):
+    """
+    根据配置选择截图后端
+
+    参数:
+        name: 后端名称，"auto"表示测速后选择最快的可用后端
+        replay_path: 回放后端使用的图片文件或文件夹
+
+    返回:
+        CaptureBackend: 选中的后端；指定的后端不可用时退回自动选择
+    """
+    if name and name != "auto":
+        backend = create_capture_backend(name, replay_path)
+        if backend.is_available():
+            print(f"使用截图后端: {backend.name}")
+            return backend
+        print(f"截图后端 {name} 不可用，改为自动选择")
+
+    results = probe_capture_backends()
+    if not results:
+        raise RuntimeError("没有可用的截图后端")
+    backend, elapsed = results[0]
+    print(f"自动选择截图后端: {backend.name}（平均 {elapsed * 1000:.1f} ms/帧）")
+    return backend
+
+
+def main():
+    """打印当前环境下各截图后端的测速结果"""
+    print("=== 截图后端测速 ===")
+    for name in AUTO_BACKEND_NAMES:
+        results = probe_capture_backends(names=(name,), rounds=5)
+        if results:
+            backend, elapsed = results[0]
+            print(f"{name}: {elapsed * 1000:.1f} ms/帧")
+            backend.close()
+        else:
+            print(f"{name}: 不可用")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+画面稳定等待模块
+操作执行后轮询低分辨率截图，画面连续若干次不再变化即认为界面已稳定，
+替代固定时长的sleep，并按操作类型记录实际稳定耗时
+"""
+import time
+
+import cv2
+import numpy as np
+
+from frame_change import make_thumbnail
+from frame_pool import FrameBufferPool
+
+
+class ScreenSettleWaiter:
+    """
+    画面稳定等待器
+
+    每隔sample_interval秒截取一张缩略图，与上一张比较；连续stable_samples次
+    没有变化则返回，最长等待max_wait秒
+    """
+
+    def __init__(self, stable_samples=3, sample_interval=0.05, max_wait=3.0, min_wait=0.1,
+                 thumbnail_width=96, pixel_threshold=8, change_ratio=0.002):
+        """
+        参数:
+            stable_samples: 连续多少次采样无变化视为稳定
+            sample_interval: 采样间隔（秒）
+            max_wait: 最长等待时间（秒）
+            min_wait: 最短等待时间（秒），给界面响应操作留出时间
+            thumbnail_width: 采样缩略图宽度
+            pixel_threshold: 单个像素灰度差超过该值才算变化
+            change_ratio: 变化像素占比超过该值认为画面仍在变化
+        """
+        self.stable_samples = stable_samples
+        self.sample_interval = sample_interval
+        self.max_wait = max_wait
+        self.min_wait = min_wait
+        self.thumbnail_width = thumbnail_width
+        self.pixel_threshold = pixel_threshold
+        self.change_ratio = change_ratio
+        # 采样截图马上就被缩成缩略图，使用独立的缓冲池，不会覆盖截图流水线中仍在使用的帧
+        self._pool = FrameBufferPool(slots=1)
+        self.reset()
+
+    def reset(self):
+        """清空按操作类型记录的稳定耗时"""
+        self.settle_times = {}
+        self.timeouts = {}
+
+    def _is_same(self, thumb_a, thumb_b):
+        if thumb_a.shape != thumb_b.shape:
+            return False
+        diff = cv2.absdiff(thumb_a, thumb_b)
+        return np.count_nonzero(diff > self.pixel_threshold) / diff.size <= self.change_ratio
+
+    def wait(self, action_type, backend, should_stop=None, sleep=time.sleep):
+        """
+        等待画面稳定
+
+        参数:
+            action_type: 操作类型（如click、hotkey、page_loading），用于分类统计
+            backend: 截图后端
+            should_stop: 无参数函数，返回True时立即停止等待
+            sleep: 等待函数，可替换为能被停止打断的等待
+
+        返回:
+            float: 实际等待时间（秒）
+        """
+        start_time = time.time()
+        if self.min_wait > 0:
+            sleep(self.min_wait)
+
+        previous = None
+        stable_count = 0
+        settled = False
+        while time.time() - start_time < self.max_wait:
+            if should_stop is not None and should_stop():
+                break
+            try:
+                current = make_thumbnail(backend.grab(self._pool), self.thumbnail_width)
+            except Exception:
+                # 截图失败时退化为固定等待
+                sleep(self.sample_interval)
+                continue
+            if previous is not None and self._is_same(previous, current):
+                stable_count += 1
+                if stable_count >= self.stable_samples:
+                    settled = True
+                    break
+            else:
+                stable_count = 0
+            previous = current
+            sleep(self.sample_interval)
+
+        elapsed = time.time() - start_time
+        self.settle_times.setdefault(action_type, []).append(elapsed)
+        if not settled:
+            self.timeouts[action_type] = self.timeouts.get(action_type, 0) + 1
+        return elapsed
+
+    def summary(self):
+        """
+        按操作类型汇总稳定耗时
+
+        返回:
+            dict: {操作类型: {"count": 次数, "mean": 平均秒数, "max": 最大秒数, "timeouts": 超时次数}}
+        """
+        result = {}
+        for action_type, times in self.settle_times.items():
+            result[action_type] = {
+                "count": len(times),
+                "mean": sum(times) / len(times),
+                "max": max(times),
+                "timeouts": self.timeouts.get(action_type, 0)
+            }
+        return result
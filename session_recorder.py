@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+"""
+会话录制模块
+把一次任务每一步的截图、模型响应、实际坐标和耗时写入单个录制文件，替代每步一张的
+screen_labelN.png。截图按关键帧 + 差分存储（差分只保存变化区域与上一帧异或后的PNG），
+读取端使用mmap随机访问任意一步，并按时间和总大小清理旧录制文件
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import argparse
+import threading
+
+import cv2
+import numpy as np
+
+
+# 文件头、记录头和文件尾的格式
+FILE_MAGIC = b"VLREC01\n"
+RECORD_TAG = b"STEP"
+INDEX_TAG = b"INDX"
+TRAILER_MAGIC = b"VLRECEND"
+RECORD_HEADER = struct.Struct("<4sBII")  # 标记, 帧类型, 元数据长度, 图片数据长度
+TRAILER = struct.Struct("<Q8s")          # 索引位置, 结束标记
+
+# 帧类型
+FRAME_KEY = 0    # 完整截图
+FRAME_DELTA = 1  # 只保存变化矩形区域内与上一帧的异或值
+FRAME_SAME = 2   # 与上一帧完全相同
+FRAME_NONE = 3   # 本步没有截图
+
+RECORDING_EXTENSION = ".vlrec"
+
+
+def compute_delta_rect(previous, current):
+    """
+    计算两帧之间变化像素的外接矩形
+
+    返回:
+        tuple: (x, y, w, h)，两帧完全相同时返回None
+    """
+    height, width = current.shape[:2]
+    # 按行、按列取最大差值，比逐像素查找非零点快一个数量级
+    diff = cv2.absdiff(previous, current).reshape(height, -1)
+    rows = np.flatnonzero(cv2.reduce(diff, 1, cv2.REDUCE_MAX))
+    if rows.size == 0:
+        return None
+    columns = np.flatnonzero(cv2.reduce(diff, 0, cv2.REDUCE_MAX).reshape(width, -1).max(axis=1))
+    x, y = int(columns[0]), int(rows[0])
+    return x, y, int(columns[-1]) - x + 1, int(rows[-1]) - y + 1
+
+
+class SessionRecorder:
+    """
+    会话录制器
+
+    每一步写入一条记录：JSON元数据 + 截图数据。截图每keyframe_interval步或变化区域超过
+    keyframe_ratio时保存完整关键帧，其余只保存变化区域与上一帧的异或值（未变化的像素为0，
+    PNG几乎不占空间），读取时从最近的关键帧向后还原
+    """
+
+    def __init__(self, path, keyframe_interval=30, keyframe_ratio=0.8, png_level=1):
+        """
+        参数:
+            path: 录制文件路径
+            keyframe_interval: 关键帧间隔（步数），决定随机访问时最多需要还原的帧数
+            keyframe_ratio: 变化区域面积占比超过该值时直接保存关键帧
+            png_level: 截图PNG压缩级别
+        """
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.keyframe_ratio = keyframe_ratio
+        self.png_params = [int(cv2.IMWRITE_PNG_COMPRESSION), int(png_level)]
+        self.offsets = []
+        self.bytes_written = 0
+        self.write_time = 0.0
+        self._previous = None
+        self._since_keyframe = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "wb")
+        self._file.write(FILE_MAGIC)
+
+    def _encode(self, image):
+        success, buffer = cv2.imencode(".png", image, self.png_params)
+        if not success:
+            raise RuntimeError("录制帧编码失败")
+        return buffer.tobytes()
+
+    def _encode_frame(self, image, meta):
+        """按关键帧/差分编码截图，返回 (帧类型, 图片数据)"""
+        if image is None:
+            return FRAME_NONE, b""
+        previous = self._previous
+        if (previous is None or previous.shape != image.shape
+                or self._since_keyframe + 1 >= self.keyframe_interval):
+            kind, data = FRAME_KEY, self._encode(image)
+        else:
+            rect = compute_delta_rect(previous, image)
+            if rect is None:
+                kind, data = FRAME_SAME, b""
+            else:
+                x, y, w, h = rect
+                if w * h > self.keyframe_ratio * image.shape[0] * image.shape[1]:
+                    kind, data = FRAME_KEY, self._encode(image)
+                else:
+                    delta = cv2.bitwise_xor(image[y:y + h, x:x + w], previous[y:y + h, x:x + w])
+                    kind, data = FRAME_DELTA, self._encode(delta)
+                    meta["delta_rect"] = [x, y, w, h]
+        if kind == FRAME_KEY:
+            self._since_keyframe = 0
+        else:
+            self._since_keyframe += 1
+        self._previous = image
+        return kind, data
+
+    def add_step(self, image, info):
+        """
+        写入一步
+
+        参数:
+            image: 本步发送给模型的截图（BGR），调用方需保证之后不再修改
+            info: 可JSON序列化的字典，如模型响应、操作、坐标和耗时
+
+        返回:
+            bool: 写入成功返回True
+        """
+        start_time = time.perf_counter()
+        with self._lock:
+            if self._file is None:
+                return False
+            meta = dict(info)
+            if image is not None:
+                meta["frame_shape"] = list(image.shape)
+            kind, data = self._encode_frame(image, meta)
+            meta_bytes = json.dumps(meta, ensure_ascii=False, default=str).encode("utf-8")
+            offset = self._file.tell()
+            self._file.write(RECORD_HEADER.pack(RECORD_TAG, kind, len(meta_bytes), len(data)))
+            self._file.write(meta_bytes)
+            self._file.write(data)
+            # 每步刷新到操作系统，程序异常退出时已写入的步骤仍可读取
+            self._file.flush()
+            self.offsets.append(offset)
+            self.bytes_written = self._file.tell()
+        self.write_time += time.perf_counter() - start_time
+        return True
+
+    def close(self):
+        """写入索引并关闭文件"""
+        with self._lock:
+            if self._file is None:
+                return
+            index_offset = self._file.tell()
+            index_bytes = json.dumps(self.offsets).encode("utf-8")
+            self._file.write(RECORD_HEADER.pack(INDEX_TAG, 0, len(index_bytes), 0))
+            self._file.write(index_bytes)
+            self._file.write(TRAILER.pack(index_offset, TRAILER_MAGIC))
+            self.bytes_written = self._file.tell()
+            self._file.close()
+            self._file = None
+            self._previous = None
+
+    def report(self):
+        """返回统计摘要文本"""
+        return (f"会话录制: {len(self.offsets)} 步，文件 {self.bytes_written / 1024:.1f} KB，"
+                f"写入耗时 {self.write_time * 1000:.0f} ms，保存在 {self.path}")
+
+
+class SessionReader:
+    """
+    录制文件读取器
+
+    使用mmap打开录制文件，可随机读取任意一步的元数据和截图。文件没有索引（录制时程序异常退出）
+    时顺序扫描记录重建索引
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(FILE_MAGIC)] != FILE_MAGIC:
+            self.close()
+            raise ValueError(f"不是有效的录制文件: {path}")
+        self.offsets = self._read_index()
+        self._cache_step = None
+        self._cache_image = None
+
+    def _read_index(self):
+        size = len(self._mmap)
+        if size >= len(FILE_MAGIC) + TRAILER.size:
+            index_offset, magic = TRAILER.unpack_from(self._mmap, size - TRAILER.size)
+            if magic == TRAILER_MAGIC:
+                tag, _, meta_len, _ = RECORD_HEADER.unpack_from(self._mmap, index_offset)
+                if tag == INDEX_TAG:
+                    start = index_offset + RECORD_HEADER.size
+                    return json.loads(self._mmap[start:start + meta_len])
+        # 没有索引：顺序扫描，忽略末尾写了一半的记录
+        offsets = []
+        position = len(FILE_MAGIC)
+        while position + RECORD_HEADER.size <= size:
+            tag, _, meta_len, data_len = RECORD_HEADER.unpack_from(self._mmap, position)
+            end = position + RECORD_HEADER.size + meta_len + data_len
+            if tag != RECORD_TAG or end > size:
+                break
+            offsets.append(position)
+            position = end
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _read_record(self, step):
+        position = self.offsets[step]
+        tag, kind, meta_len, data_len = RECORD_HEADER.unpack_from(self._mmap, position)
+        if tag != RECORD_TAG:
+            raise ValueError(f"第 {step} 步记录损坏")
+        start = position + RECORD_HEADER.size
+        meta = json.loads(self._mmap[start:start + meta_len])
+        data_start = start + meta_len
+        # memoryview直接引用映射内存，解码前不复制
+        data = memoryview(self._mmap)[data_start:data_start + data_len]
+        return kind, meta, data
+
+    def get_info(self, step):
+        """读取第step步的元数据"""
+        return self._read_record(step)[1]
+
+    def _find_keyframe(self, step):
+        while step > 0:
+            kind = RECORD_HEADER.unpack_from(self._mmap, self.offsets[step])[1]
+            if kind == FRAME_KEY:
+                return step
+            step -= 1
+        return 0
+
+    def get_frame(self, step):
+        """
+        还原第step步的截图
+
+        返回:
+            numpy.ndarray: BGR截图，本步没有截图时返回None
+        """
+        if step < 0:
+            step += len(self)
+        kind = RECORD_HEADER.unpack_from(self._mmap, self.offsets[step])[1]
+        if kind == FRAME_NONE:
+            return None
+        # 顺序读取时从上一次还原的帧继续，否则从最近的关键帧开始
+        if self._cache_step is not None and self._cache_step < step and \
+                self._find_keyframe(step) <= self._cache_step:
+            begin, image = self._cache_step + 1, self._cache_image.copy()
+        else:
+            begin, image = self._find_keyframe(step), None
+        for index in range(begin, step + 1):
+            kind, meta, data = self._read_record(index)
+            if kind == FRAME_KEY:
+                image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+            elif kind == FRAME_DELTA and image is not None:
+                x, y, w, h = meta["delta_rect"]
+                delta = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+                region = image[y:y + h, x:x + w]
+                cv2.bitwise_xor(region, delta, dst=region)
+        self._cache_step, self._cache_image = step, image
+        return None if image is None else image.copy()
+
+    def get_annotated_frame(self, step, point_radius=10, point_color=(0, 0, 255)):
+        """还原第step步的截图并标记本步操作的坐标，效果与原先的screen_labelN.png相同"""
+        image = self.get_frame(step)
+        coordinates = self.get_info(step).get("image_coordinates")
+        if image is None or not coordinates:
+            return image
+        if not isinstance(coordinates[0], (list, tuple)):
+            coordinates = [coordinates]
+        for x, y in coordinates:
+            cv2.circle(image, (int(x), int(y)), point_radius, point_color, -1)
+            cv2.putText(image, f"({int(x)}, {int(y)})", (int(x) + 15, int(y) - 15),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, point_color, 2)
+        return image
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def apply_retention(directory, max_age_days=7, max_total_mb=500, keep=()):
+    """
+    按保留策略清理旧录制文件
+
+    参数:
+        directory: 录制文件夹
+        max_age_days: 超过该天数的录制文件被删除，None表示不按时间清理
+        max_total_mb: 录制文件总大小上限（MB），超出时从最旧的开始删除，None表示不限
+        keep: 不删除的文件路径（如当前正在写入的录制文件）
+
+    返回:
+        list: 被删除的文件路径
+    """
+    if not os.path.isdir(directory):
+        return []
+    keep = {os.path.abspath(path) for path in keep}
+    files = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith(RECORDING_EXTENSION) and os.path.isfile(path) and os.path.abspath(path) not in keep:
+            stat = os.stat(path)
+            files.append((stat.st_mtime, stat.st_size, path))
+    files.sort()
+
+    removed = []
+    now = time.time()
+    if max_age_days is not None:
+        for mtime, size, path in list(files):
+            if now - mtime > max_age_days * 86400:
+                os.remove(path)
+                removed.append(path)
+                files.remove((mtime, size, path))
+    if max_total_mb is not None:
+        total = sum(size for _, size, _ in files)
+        while files and total > max_total_mb * 1024 * 1024:
+            _, size, path = files.pop(0)
+            os.remove(path)
+            removed.append(path)
+            total -= size
+    return removed
+
+
+def new_recording_path(directory):
+    """生成按时间命名的录制文件路径"""
+    return os.path.join(directory, time.strftime("session_%Y%m%d_%H%M%S") + RECORDING_EXTENSION)
+
+
+def _simulate_steps(image, steps, seed=0):
+    """基准测试用：在示例截图上每步改变几个小区域，模拟界面操作后的局部变化"""
+    rng = np.random.default_rng(seed)
+    height, width = image.shape[:2]
+    current = image.copy()
+    for _ in range(steps):
+        for _ in range(3):
+            w, h = int(rng.integers(40, 240)), int(rng.integers(20, 120))
+            x, y = int(rng.integers(0, width - w)), int(rng.integers(0, height - h))
+            current[y:y + h, x:x + w] = rng.integers(0, 256, size=3, dtype=np.uint8)
+        yield current.copy(), [int(rng.integers(0, width)), int(rng.integers(0, height))]
+
+
+def run_benchmark(image, steps=100, output_dir="imgs/recording_benchmark"):
+    """
+    对比每步写一张标记PNG与写入录制文件的磁盘占用和写入耗时
+
+    返回:
+        dict: {"png": {...}, "recording": {...}}，每项包含总字节数和每步写入毫秒数
+    """
+    from cv_shot_doubao import mark_coordinate_on_image
+    os.makedirs(output_dir, exist_ok=True)
+    frames = list(_simulate_steps(image, steps))
+
+    png_bytes = 0
+    start_time = time.perf_counter()
+    for index, (frame, point) in enumerate(frames):
+        path = os.path.join(output_dir, f"screen_label{index + 1}.png")
+        mark_coordinate_on_image(point, output_path=path, image=frame)
+        png_bytes += os.path.getsize(path)
+    png_time = time.perf_counter() - start_time
+
+    path = os.path.join(output_dir, "benchmark" + RECORDING_EXTENSION)
+    start_time = time.perf_counter()
+    recorder = SessionRecorder(path)
+    for index, (frame, point) in enumerate(frames):
+        recorder.add_step(frame, {"step": index, "image_coordinates": point})
+    recorder.close()
+    recording_time = time.perf_counter() - start_time
+
+    # 校验随机访问还原的截图与原图一致
+    with SessionReader(path) as reader:
+        for index in (0, steps // 2, steps - 1):
+            assert np.array_equal(reader.get_frame(index), frames[index][0]), f"第 {index} 步还原失败"
+
+    return {
+        "png": {"bytes": png_bytes, "ms_per_step": png_time / steps * 1000},
+        "recording": {"bytes": recorder.bytes_written, "ms_per_step": recording_time / steps * 1000},
+    }
+
+
+def main():
+    """命令行入口：查看、导出录制文件，或运行磁盘占用基准测试"""
+    parser = argparse.ArgumentParser(description="会话录制文件工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    info_parser = subparsers.add_parser("info", help="列出录制文件中的每一步")
+    info_parser.add_argument("path")
+    export_parser = subparsers.add_parser("export", help="导出某一步的标记截图")
+    export_parser.add_argument("path")
+    export_parser.add_argument("step", type=int)
+    export_parser.add_argument("output")
+    bench_parser = subparsers.add_parser("bench", help="对比逐步PNG与录制文件")
+    bench_parser.add_argument("image", nargs="?", default="imgs/screen.png")
+    bench_parser.add_argument("--steps", type=int, default=100)
+    bench_parser.add_argument("--max-png", type=int, default=1280)
+    args = parser.parse_args()
+
+    if args.command == "info":
+        with SessionReader(args.path) as reader:
+            print(f"{args.path}: {len(reader)} 步")
+            for step in range(len(reader)):
+                info = reader.get_info(step)
+                print(f"[{step}] {info.get('action', '')} {info.get('mapped_coordinates', '')} "
+                      f"{info.get('element_info', '')} {info.get('timings', '')}")
+    elif args.command == "export":
+        with SessionReader(args.path) as reader:
+            image = reader.get_annotated_frame(args.step)
+        if image is None:
+            print(f"第 {args.step} 步没有截图")
+            sys.exit(1)
+        cv2.imwrite(args.output, image)
+        print(f"已导出: {args.output}")
+    else:
+        image = cv2.imread(args.image)
+        if image is None:
+            print(f"无法读取图片: {args.image}")
+            sys.exit(1)
+        scale = min(1.0, args.max_png / max(image.shape[:2]))
+        if scale < 1.0:
+            image = cv2.resize(image, None, fx=scale, fy=scale)
+        result = run_benchmark(image, args.steps)
+        print(f"=== 会话录制基准测试（{args.steps} 步）===")
+        for name, row in result.items():
+            print(f"{name:<10} 磁盘占用: {row['bytes'] / 1024 / 1024:.2f} MB  写入: {row['ms_per_step']:.1f} ms/步")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+流式JSON解析模块
+模型以流式返回时逐块输入文本，每当顶层对象中的某个字段的值完整生成后立即解析出来，
+不必等待整个JSON结束，供主循环提前移动鼠标
+"""
+import json
+
+
+class IncrementalJSONParser:
+    """
+    增量JSON解析器
+
+    只跟踪顶层对象：记录括号深度和字符串状态，顶层字段的值结束时（字符串/数组/对象闭合，
+    或数字、布尔值后遇到逗号或右括号）用json.loads解析该值。每个字符只扫描一次，
+    JSON之前的说明文字和代码块标记会被跳过
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.complete = False
+        self._buffer = ""
+        self._position = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._string_is_key = False
+        self._expect = "key"
+        self._key = None
+        self._value_start = None
+
+    @property
+    def text(self):
+        """已接收的全部文本"""
+        return self._buffer
+
+    def _finish_value(self, end, completed):
+        if self._key is not None and self._value_start is not None:
+            try:
+                self.fields[self._key] = json.loads(self._buffer[self._value_start:end])
+                completed.append(self._key)
+            except ValueError:
+                pass
+        self._key = None
+        self._value_start = None
+
+    def feed(self, chunk):
+        """
+        输入一段新文本
+
+        参数:
+            chunk: 流式返回的增量文本
+
+        返回:
+            list: 本次输入后新完成的字段名
+        """
+        completed = []
+        if not chunk or self.complete:
+            self._buffer += chunk or ""
+            return completed
+        self._buffer += chunk
+        buffer = self._buffer
+        for index in range(self._position, len(buffer)):
+            char = buffer[index]
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        if self._string_is_key:
+                            try:
+                                self._key = json.loads(buffer[self._string_start:index + 1])
+                            except ValueError:
+                                self._key = None
+                        elif self._value_start == self._string_start:
+                            self._finish_value(index + 1, completed)
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string_start = index
+                self._string_is_key = self._depth == 1 and self._expect == "key"
+                if self._depth == 1 and self._expect == "value":
+                    self._value_start = index
+                    self._expect = "comma"
+                continue
+            if char.isspace():
+                continue
+            if self._depth == 1 and self._expect == "value":
+                # 数组、对象、数字或布尔值开始
+                self._value_start = index
+                self._expect = "comma"
+            if char in "[{":
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_value(index, completed)
+                    self.complete = True
+                    self._position = index + 1
+                    return completed
+                if self._depth == 1 and self._value_start is not None:
+                    self._finish_value(index + 1, completed)
+            elif self._depth == 1 and char == ",":
+                self._finish_value(index, completed)
+                self._expect = "key"
+            elif self._depth == 1 and char == ":":
+                self._expect = "value"
+        self._position = len(buffer)
+        return completed
+
+    def has_fields(self, *names):
+        """判断指定字段是否都已完整解析"""
+        return all(name in self.fields for name in names)
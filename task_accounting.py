@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+任务用量统计模块
+记录每一次模型调用的输入/输出/缓存token、截图编码后的字节数和尺寸、请求耗时，
+按步和按任务汇总费用，任务结束时写出JSON摘要，便于比较分辨率、历史长度等调整的效果
+"""
+import os
+import json
+import time
+
+from prompt_cache import usage_cached_tokens
+
+
+# 默认统计配置，价格为每百万token的价格；summary_directory为空时不写出JSON摘要
+DEFAULT_ACCOUNTING_CONFIG = {
+    "input_price": 0.0,
+    "cached_price": 0.0,
+    "output_price": 0.0,
+    "summary_directory": ""
+}
+
+
+class TaskAccounting:
+    """
+    一次任务的用量统计
+
+    每次模型调用一条记录（放大定位的调用单独记录），totals()返回汇总，
+    summary()返回可写入JSON的完整摘要
+    """
+
+    def __init__(self, task, input_price=0.0, cached_price=0.0, output_price=0.0):
+        """
+        参数:
+            task: 任务内容
+            input_price: 未命中缓存的输入token价格（每百万token）
+            cached_price: 命中缓存的输入token价格（每百万token）
+            output_price: 输出token价格（每百万token）
+        """
+        self.task = task
+        self.input_price = input_price
+        self.cached_price = cached_price
+        self.output_price = output_price
+        self.started_at = time.time()
+        self.finished_at = None
+        self.result = None
+        self.calls = []
+
+    def add_call(self, step, usage, image=None, seconds=0.0, model=None, kind="main"):
+        """
+        记录一次模型调用
+
+        参数:
+            step: 循环序号
+            usage: completion的usage，可为None
+            image: 编码后的截图信息 {"bytes", "payload_bytes", "width", "height", "format"}
+            seconds: 请求耗时（秒）
+            model: 使用的模型
+            kind: "main"整屏定位，"zoom"区域放大定位
+
+        返回:
+            dict: 本次调用的记录
+        """
+        image = image or {}
+        record = {
+            "step": step,
+            "kind": kind,
+            "model": model,
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "cached_tokens": usage_cached_tokens(usage),
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "image_bytes": image.get("bytes", 0),
+            "payload_bytes": image.get("payload_bytes", 0),
+            "image_width": image.get("width", 0),
+            "image_height": image.get("height", 0),
+            "image_format": image.get("format"),
+            "seconds": round(seconds, 3),
+            "usage_reported": usage is not None
+        }
+        record["cost"] = self.cost_of(record)
+        self.calls.append(record)
+        return record
+
+    def cost_of(self, record):
+        """按价格计算一条记录（或汇总）的费用"""
+        uncached = record["prompt_tokens"] - record["cached_tokens"]
+        return (uncached * self.input_price + record["cached_tokens"] * self.cached_price
+                + record["completion_tokens"] * self.output_price) / 1e6
+
+    def totals(self):
+        """返回任务到目前为止的汇总"""
+        totals = {
+            "steps": len({call["step"] for call in self.calls}),
+            "model_calls": len(self.calls),
+            "prompt_tokens": sum(call["prompt_tokens"] for call in self.calls),
+            "cached_tokens": sum(call["cached_tokens"] for call in self.calls),
+            "completion_tokens": sum(call["completion_tokens"] for call in self.calls),
+            "image_bytes": sum(call["image_bytes"] for call in self.calls),
+            "payload_bytes": sum(call["payload_bytes"] for call in self.calls),
+            "model_seconds": round(sum(call["seconds"] for call in self.calls), 3),
+            "elapsed": round((self.finished_at or time.time()) - self.started_at, 3)
+        }
+        totals["cost"] = self.cost_of(totals)
+        return totals
+
+    def finish(self, result):
+        """记录任务结果和结束时间"""
+        self.result = result
+        self.finished_at = time.time()
+
+    def summary(self):
+        """返回可写入JSON的完整摘要"""
+        return {
+            "task": self.task,
+            "result": self.result,
+            "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+            "prices": {"input": self.input_price, "cached": self.cached_price, "output": self.output_price},
+            "totals": self.totals(),
+            "calls": self.calls
+        }
+
+    def write_summary(self, directory):
+        """
+        将摘要写入 directory/task_时间.json
+
+        返回:
+            str: 写入的文件路径
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, time.strftime("task_%Y%m%d_%H%M%S.json", time.localtime(self.started_at)))
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        return path
+
+    def report(self):
+        """返回统计摘要文本"""
+        totals = self.totals()
+        return (f"任务用量: {totals['steps']} 步，模型调用 {totals['model_calls']} 次，"
+                f"输入token {totals['prompt_tokens']}（缓存命中 {totals['cached_tokens']}），"
+                f"输出token {totals['completion_tokens']}，截图 {totals['image_bytes'] / 1024:.1f} KB，"
+                f"模型耗时 {totals['model_seconds']:.1f}秒，费用 {totals['cost']:.4f}")
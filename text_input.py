@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+文本输入模块
+点击输入框后输入模型给出的type_information：优先通过输入执行器直接注入Unicode文本（不经过剪贴板，
+按键事件与之后的回车按顺序到达，不需要固定等待），执行器在当前平台不支持时改为复制到剪贴板后粘贴。
+文本中的换行符处按回车，末尾是否再按回车由模型输出的submit字段决定（省略时按回车）
+"""
+import platform
+
+
+# 可选的输入方式
+METHODS = ("auto", "direct", "clipboard")
+
+# 执行器不支持直接输入时抛出的异常
+DIRECT_ERRORS = (NotImplementedError, ValueError, OSError)
+
+
+class TextInput:
+    """
+    文本输入引擎
+
+    enter()把文本按换行符分段，每段直接输入或粘贴，段与段之间按回车
+    """
+
+    def __init__(self, executor, method="auto", focus_delay=0.05, paste_delay=0.05):
+        """
+        参数:
+            executor: 输入执行器
+            method: "auto"（优先直接输入，不支持时粘贴）、"direct"（只直接输入）或 "clipboard"（只粘贴）
+            focus_delay: 输入前等待点击的输入框获得焦点的时间（秒）
+            paste_delay: 每次粘贴后等待目标程序读取剪贴板的时间（秒），X11下粘贴是异步的
+        """
+        if method not in METHODS:
+            raise ValueError(f"不支持的输入方式: {method}，可选: {', '.join(METHODS)}")
+        self.executor = executor
+        self.method = method
+        self.focus_delay = focus_delay
+        self.paste_delay = paste_delay
+        self.direct_available = method != "clipboard"
+        # 最近一次输入实际使用的方式，以及auto改用粘贴的原因
+        self.last_method = None
+        self.fallback_reason = None
+
+    def _paste(self, text):
+        self.executor.copy_text(text)
+        if platform.system() == "Darwin":
+            self.executor.key_down("command")
+            self.executor.press("v")
+            self.executor.key_up("command")
+        else:
+            self.executor.hotkey("ctrl", "v")
+        self.executor.pause(self.paste_delay)
+
+    def _insert(self, text):
+        if self.direct_available:
+            try:
+                self.executor.type_text(text)
+                self.last_method = "direct"
+                return
+            except DIRECT_ERRORS as e:
+                if self.method == "direct":
+                    raise
+                # 之后都使用粘贴，不再每次尝试
+                self.direct_available = False
+                self.fallback_reason = str(e)
+        self._paste(text)
+        self.last_method = "clipboard"
+
+    def enter(self, text, submit=True):
+        """
+        输入文本
+
+        参数:
+            text: 要输入的文本，其中的换行符表示回车
+            submit: 输入后是否按回车提交，文本已以换行符结尾时不再重复按
+
+        返回:
+            bool: 是否按了回车（提交）
+        """
+        self.last_method = None
+        text = text.replace("\r\n", "\n")
+        segments = text.split("\n")
+        presses = len(segments) - 1
+        if submit and not text.endswith("\n"):
+            presses += 1
+        self.executor.pause(self.focus_delay)
+        for index, segment in enumerate(segments):
+            if segment:
+                self._insert(segment)
+            if index < presses:
+                self.executor.press("enter")
+        return presses > 0
@@ -1,19 +1,41 @@
 """这个版本可以执行大部分的操作"""
 
 import os
-import base64
 import cv2
 import numpy as np
-from openai import OpenAI
 import json
-import re
-from cv_shot_doubao import mark_coordinate_on_image, capture_screen_and_save, map_coordinates
+import asyncio
+import concurrent.futures
+import openai
+from openai.types.chat import ChatCompletion
+from cv_shot_doubao import mark_coordinate_on_image, capture_screen_and_save, capture_screen_frame, map_coordinates, configure_capture_backend, get_capture_backend
+from frame_pool import get_capture_pool
 import time
-import pyautogui
-import pyperclip
 import signal
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
+from typing import List
 import platform
+from frame_change import FrameChangeDetector
+from screen_settle import ScreenSettleWaiter
+from image_encoder import DEFAULT_ENCODING, get_encoding_for_model, encode_with_settings
+from annotation_writer import AnnotationWriter, to_image_coordinates
+from session_recorder import SessionRecorder, apply_retention, new_recording_path
+from region_zoom import should_zoom, compute_zoom_region, crop_zoom_frame, build_zoom_prompt, rebase_coordinates, GroundingStats
+from stream_parser import IncrementalJSONParser
+from model_client import get_async_model_client, load_json_cached, read_text_cached
+from agent_engine import get_agent_engine
+from request_policy import RequestPolicy, DEFAULT_REQUEST_POLICY
+from model_router import create_router, DEFAULT_ROUTER_CONFIG
+from prompt_cache import ContextCache, DEFAULT_CACHE_CONFIG, format_cache_usage
+from task_accounting import TaskAccounting, DEFAULT_ACCOUNTING_CONFIG
+from input_executor import create_executor
+from monitors import get_monitor_layout, reset_monitor_layout
+from text_input import TextInput
+from response_cache import ResponseCache, normalize_action
+from macro_replay import MacroLibrary, MacroPlayer, MacroRecorder
+from action_plan import ActionPlan, PLAN_PROMPT
+from json_extract import extract_json
+from response_validator import validate_model_response, build_reask_prompt
 from mac_app_utils import is_mac_app, get_app_resource_path, get_resource_file_path, get_default_imgs_path
 
 # 全局退出标志
@@ -22,6 +44,30 @@ should_exit = False
 # 全局回调函数，用于通知主窗口AI输出的坐标
 coordinate_callback = None
 
+# 最近一次模型调用返回的usage信息
+last_completion_usage = None
+
+# 最近一次模型调用中结构化输出已解析的字典（上下文缓存等没有解析结果时为None）
+last_parsed_response = None
+
+# 最近一次发送的模型请求，输出未通过校验时在其后追加追问
+last_model_request = None
+
+# 最近一次发送给模型的截图信息（编码后字节数、尺寸和格式）
+last_image_info = None
+
+# 全局回调函数，每一步结束后通知主窗口任务用量汇总
+usage_callback = None
+
+# 最近一次任务的用量摘要，任务结束后可供界面读取
+last_task_summary = None
+
+# 模型请求的超时、重试和对冲策略，耗时统计在多次任务之间累积
+request_policy = None
+
+# 方舟上下文缓存，系统提示词的context_id在多次任务之间复用
+context_cache = None
+
 current_os = platform.system()
 
 # 尝试导入日志窗口模块
@@ -71,30 +117,48 @@ def set_coordinate_callback(callback):
     global coordinate_callback
     coordinate_callback = callback
 
+# 设置用量回调函数
+def set_usage_callback(callback):
+    global usage_callback
+    usage_callback = callback
+
 # 信号处理函数
 def signal_handler(sig, frame):
-    global should_exit
     log_print("\n收到中断信号，正在优雅退出...")
+    request_stop()
+
+# 请求停止当前任务
+def request_stop():
+    """
+    设置退出标志并取消执行引擎中的任务
+    进行中的模型请求立即中止，截图、操作后的等待也会立即返回
+    """
+    global should_exit
     should_exit = True
+    get_agent_engine().cancel()
 
 # 设置信号处理器
 # 所有系统都支持SIGINT信号（Ctrl+C）
 signal.signal(signal.SIGINT, signal_handler)
 
 # 加载配置文件
-def load_config(config_path="config.json"):
+# 配置文件路径，可通过环境变量VL_CONFIG_PATH指定（基准测试使用临时配置）
+CONFIG_PATH = os.environ.get("VL_CONFIG_PATH", "config.json")
+
+def load_config(config_path=None):
     """
     加载配置文件
+    按文件修改时间缓存，文件未变化时直接返回上次读取的内容
     """
+    config_path = config_path or CONFIG_PATH
     # 如果是Mac系统下的打包app状态，修改config_path为资源包路径
     if is_mac_app():
         config_path = get_resource_file_path(config_path)
-        log_print(f"检测到Mac App环境，使用资源包中的配置文件: {config_path}")
     
     try:
-        with open(config_path, "r", encoding="utf-8") as f:
-            config = json.load(f)
-        log_print(f"成功加载配置文件: {config_path}")
+        config, reloaded = load_json_cached(config_path)
+        if reloaded:
+            log_print(f"成功加载配置文件: {config_path}")
         return config
     except Exception as e:
         log_print(f"加载配置文件失败: {e}")
@@ -113,77 +177,426 @@ DEFAULT_CONFIG = {
     "ai_config": {
         "enable_thinking": False,
         "thinking_type": "disabled",
-        "vl_high_resolution_images": True
+        "vl_high_resolution_images": True,
+        "stream": False
     },
     "execution_config": {
         "max_visual_model_iterations": 80,
-        "default_max_iterations": 15
+        "default_max_iterations": 15,
+        "max_consecutive_errors": 3
     },
     "screenshot_config": {
         "optimize_for_speed": True,
         "max_png": 1280,
         "input_path": "imgs/screen.png",
-        "output_path": "imgs/screen_label.png"
+        "output_path": "imgs/screen_label.png",
+        "save_debug_images": False,
+        "capture_backend": "auto",
+        "replay_path": "",
+        "grounding_mode": "single",
+        "zoom_factor": 3.0,
+        "monitor": None,
+        "use_buffer_pool": True
     },
     "mouse_config": {
         "move_duration": 0.1,
-        "failsafe": False
+        "failsafe": False,
+        "executor": "auto",
+        "pyautogui_pause": 0.0
+    },
+    "change_detection_config": {
+        "enabled": True,
+        "thumbnail_width": 160,
+        "pixel_threshold": 10,
+        "change_ratio": 0.001,
+        "recheck_interval": 0.3,
+        "max_wait": 5.0
+    },
+    "settle_config": {
+        "enabled": True,
+        "stable_samples": 3,
+        "sample_interval": 0.05,
+        "min_wait": 0.1,
+        "max_wait": 3.0
+    },
+    "image_encoding_config": {
+        "default": DEFAULT_ENCODING,
+        "models": {}
+    },
+    "annotation_config": {
+        "async": True,
+        "max_queue": 8,
+        "backpressure": "drop_oldest",
+        "flush_timeout": 10.0
+    },
+    "recording_config": {
+        "enabled": False,
+        "directory": "imgs/recordings",
+        "keyframe_interval": 30,
+        "max_age_days": 7,
+        "max_total_mb": 500
+    },
+    "request_config": dict(DEFAULT_REQUEST_POLICY),
+    "router_config": dict(DEFAULT_ROUTER_CONFIG),
+    "cache_config": dict(DEFAULT_CACHE_CONFIG),
+    "accounting_config": dict(DEFAULT_ACCOUNTING_CONFIG),
+    "response_cache_config": {
+        "enabled": False,
+        "path": "imgs/response_cache.json",
+        "max_entries": 500,
+        "max_distance": 4,
+        "history_length": 3
+    },
+    "macro_config": {
+        "enabled": False,
+        "directory": "imgs/macros",
+        "template_size": 48,
+        "search_radius": 120,
+        "match_threshold": 0.9
+    },
+    "plan_config": {
+        "enabled": False,
+        "max_actions": 4,
+        "change_ratio": 0.01,
+        "frame_change_ratio": 0.001,
+        "pixel_threshold": 10
+    },
+    "validation_config": {
+        "enabled": True,
+        "coordinate_tolerance": 10,
+        "max_reasks": 1
+    },
+    "keyboard_config": {
+        "method": "auto",
+        "focus_delay": 0.05,
+        "paste_delay": 0.05
     }
 }
 
+def _apply_config(config, verbose=False):
+    """
+    按配置文件设置各配置节的全局变量，配置文件中缺少的配置节使用默认值
+
+    参数:
+        config: load_config()的结果，为None时全部使用默认值
+        verbose: 是否输出Mac App环境下的路径修改
+    """
+    global API_CONFIG, AI_CONFIG, EXECUTION_CONFIG, SCREENSHOT_CONFIG, MOUSE_CONFIG, CHANGE_DETECTION_CONFIG, SETTLE_CONFIG, IMAGE_ENCODING_CONFIG, ANNOTATION_CONFIG, RECORDING_CONFIG, REQUEST_CONFIG, ROUTER_CONFIG, CACHE_CONFIG, ACCOUNTING_CONFIG, RESPONSE_CACHE_CONFIG, MACRO_CONFIG, PLAN_CONFIG, VALIDATION_CONFIG, KEYBOARD_CONFIG
+    config = config or {}
+
+    def section(name):
+        return config.get(name, DEFAULT_CONFIG[name])
+
+    API_CONFIG = section("api_config")
+    AI_CONFIG = section("ai_config")
+    EXECUTION_CONFIG = section("execution_config")
+    SCREENSHOT_CONFIG = section("screenshot_config")
+    MOUSE_CONFIG = section("mouse_config")
+    CHANGE_DETECTION_CONFIG = section("change_detection_config")
+    SETTLE_CONFIG = section("settle_config")
+    IMAGE_ENCODING_CONFIG = section("image_encoding_config")
+    ANNOTATION_CONFIG = section("annotation_config")
+    RECORDING_CONFIG = section("recording_config")
+    REQUEST_CONFIG = section("request_config")
+    ROUTER_CONFIG = section("router_config")
+    CACHE_CONFIG = section("cache_config")
+    ACCOUNTING_CONFIG = section("accounting_config")
+    RESPONSE_CACHE_CONFIG = section("response_cache_config")
+    MACRO_CONFIG = section("macro_config")
+    PLAN_CONFIG = section("plan_config")
+    VALIDATION_CONFIG = section("validation_config")
+    KEYBOARD_CONFIG = section("keyboard_config")
+
+    # 如果是Mac系统下的打包app状态，修改SCREENSHOT_CONFIG中的路径
+    if is_mac_app():
+        # 修改输入路径
+        if "input_path" in SCREENSHOT_CONFIG and not os.path.isabs(SCREENSHOT_CONFIG["input_path"]):
+            SCREENSHOT_CONFIG["input_path"] = get_resource_file_path(SCREENSHOT_CONFIG["input_path"])
+            if verbose:
+                log_print(f"Mac App环境，修改输入路径为: {SCREENSHOT_CONFIG['input_path']}")
+        
+        # 修改输出路径
+        if "output_path" in SCREENSHOT_CONFIG and not os.path.isabs(SCREENSHOT_CONFIG["output_path"]):
+            SCREENSHOT_CONFIG["output_path"] = get_resource_file_path(SCREENSHOT_CONFIG["output_path"])
+            if verbose:
+                log_print(f"Mac App环境，修改输出路径为: {SCREENSHOT_CONFIG['output_path']}")
+
 # 使用配置文件或默认值
-if config:
-    API_CONFIG = config.get("api_config", DEFAULT_CONFIG["api_config"])
-    AI_CONFIG = config.get("ai_config", DEFAULT_CONFIG["ai_config"])
-    EXECUTION_CONFIG = config.get("execution_config", DEFAULT_CONFIG["execution_config"])
-    SCREENSHOT_CONFIG = config.get("screenshot_config", DEFAULT_CONFIG["screenshot_config"])
-    MOUSE_CONFIG = config.get("mouse_config", DEFAULT_CONFIG["mouse_config"])
-else:
-    API_CONFIG = DEFAULT_CONFIG["api_config"]
-    AI_CONFIG = DEFAULT_CONFIG["ai_config"]
-    EXECUTION_CONFIG = DEFAULT_CONFIG["execution_config"]
-    SCREENSHOT_CONFIG = DEFAULT_CONFIG["screenshot_config"]
-    MOUSE_CONFIG = DEFAULT_CONFIG["mouse_config"]
-
-# 如果是Mac系统下的打包app状态，修改SCREENSHOT_CONFIG中的路径
-if is_mac_app():
-    # 修改输入路径
-    if "input_path" in SCREENSHOT_CONFIG and not os.path.isabs(SCREENSHOT_CONFIG["input_path"]):
-        SCREENSHOT_CONFIG["input_path"] = get_resource_file_path(SCREENSHOT_CONFIG["input_path"])
-        log_print(f"Mac App环境，修改输入路径为: {SCREENSHOT_CONFIG['input_path']}")
+_apply_config(config, verbose=True)
+
+def create_change_detector():
+    """根据配置创建画面变化检测器，未启用时返回None"""
+    if not CHANGE_DETECTION_CONFIG.get("enabled", True):
+        return None
+    defaults = DEFAULT_CONFIG["change_detection_config"]
+    return FrameChangeDetector(
+        thumbnail_width=CHANGE_DETECTION_CONFIG.get("thumbnail_width", defaults["thumbnail_width"]),
+        pixel_threshold=CHANGE_DETECTION_CONFIG.get("pixel_threshold", defaults["pixel_threshold"]),
+        change_ratio=CHANGE_DETECTION_CONFIG.get("change_ratio", defaults["change_ratio"]),
+        recheck_interval=CHANGE_DETECTION_CONFIG.get("recheck_interval", defaults["recheck_interval"]),
+        max_wait=CHANGE_DETECTION_CONFIG.get("max_wait", defaults["max_wait"])
+    )
+
+# 当前任务使用的画面稳定等待器，由auto_control_computer创建
+settle_waiter = None
+
+def create_settle_waiter():
+    """根据配置创建画面稳定等待器，未启用时返回None（退回固定时长等待）"""
+    if not SETTLE_CONFIG.get("enabled", True):
+        return None
+    defaults = DEFAULT_CONFIG["settle_config"]
+    return ScreenSettleWaiter(
+        stable_samples=SETTLE_CONFIG.get("stable_samples", defaults["stable_samples"]),
+        sample_interval=SETTLE_CONFIG.get("sample_interval", defaults["sample_interval"]),
+        min_wait=SETTLE_CONFIG.get("min_wait", defaults["min_wait"]),
+        max_wait=SETTLE_CONFIG.get("max_wait", defaults["max_wait"])
+    )
+
+def create_annotation_writer():
+    """根据配置创建后台写入器，既不保存调试图片也不录制会话，或未启用异步写入时返回None（同步写入）"""
+    if not SCREENSHOT_CONFIG.get("save_debug_images", False) and not RECORDING_CONFIG.get("enabled", False):
+        return None
+    if not ANNOTATION_CONFIG.get("async", True):
+        return None
+    defaults = DEFAULT_CONFIG["annotation_config"]
+    return AnnotationWriter(
+        max_queue=ANNOTATION_CONFIG.get("max_queue", defaults["max_queue"]),
+        backpressure=ANNOTATION_CONFIG.get("backpressure", defaults["backpressure"])
+    )
+
+def get_label_dir():
+    """获取标记图片文件夹，output_path配置为文件路径时使用其所在文件夹"""
+    output_path = SCREENSHOT_CONFIG["output_path"]
+    if os.path.splitext(output_path)[1]:
+        return os.path.dirname(output_path) or "."
+    return output_path
+
+def get_recording_dir():
+    """获取会话录制文件夹（在Mac App环境下调整为资源包路径）"""
+    directory = RECORDING_CONFIG.get("directory", DEFAULT_CONFIG["recording_config"]["directory"])
+    if not os.path.isabs(directory) and is_mac_app():
+        directory = get_resource_file_path(directory)
+    return directory
+
+def create_session_recorder():
+    """根据配置清理旧录制文件并创建本次任务的会话录制器，未启用时返回None"""
+    if not RECORDING_CONFIG.get("enabled", False):
+        return None
+    defaults = DEFAULT_CONFIG["recording_config"]
+    directory = get_recording_dir()
+    try:
+        removed = apply_retention(
+            directory,
+            max_age_days=RECORDING_CONFIG.get("max_age_days", defaults["max_age_days"]),
+            max_total_mb=RECORDING_CONFIG.get("max_total_mb", defaults["max_total_mb"])
+        )
+        if removed:
+            log_print(f"已清理 {len(removed)} 个旧录制文件")
+        return SessionRecorder(
+            new_recording_path(directory),
+            keyframe_interval=RECORDING_CONFIG.get("keyframe_interval", defaults["keyframe_interval"])
+        )
+    except Exception as e:
+        log_print(f"创建会话录制失败: {e}")
+        return None
+
+def record_session_step(recorder, annotation_writer, frame, info):
+    """把一步的截图和元数据写入会话录制，有后台写入器时异步写入"""
+    if recorder is None:
+        return
+    if annotation_writer is not None:
+        annotation_writer.submit_step(recorder, frame, info)
+    else:
+        # 截图缓冲区会被复用，同步写入时同样需要复制
+        recorder.add_step(frame.image.copy() if frame is not None else None, info)
+
+# 响应缓存在多次任务之间复用，首次使用时从磁盘读取
+response_cache = None
+
+def get_response_cache():
+    """按response_cache_config获取响应缓存，未启用时返回None"""
+    global response_cache
+    if not RESPONSE_CACHE_CONFIG.get("enabled", False):
+        return None
+    defaults = DEFAULT_CONFIG["response_cache_config"]
+    path = RESPONSE_CACHE_CONFIG.get("path", defaults["path"])
+    if path and not os.path.isabs(path) and is_mac_app():
+        path = get_resource_file_path(path)
+    if response_cache is None or response_cache.path != path:
+        response_cache = ResponseCache(
+            path or None,
+            max_entries=RESPONSE_CACHE_CONFIG.get("max_entries", defaults["max_entries"]),
+            max_distance=RESPONSE_CACHE_CONFIG.get("max_distance", defaults["max_distance"])
+        )
+    return response_cache
+
+def get_macro_library():
+    """按macro_config获取宏库，未启用时返回None"""
+    if not MACRO_CONFIG.get("enabled", False):
+        return None
+    directory = MACRO_CONFIG.get("directory", DEFAULT_CONFIG["macro_config"]["directory"])
+    if not os.path.isabs(directory) and is_mac_app():
+        directory = get_resource_file_path(directory)
+    return MacroLibrary(directory)
+
+def create_action_plan():
+    """按plan_config创建多步操作计划，未启用时返回None"""
+    if not PLAN_CONFIG.get("enabled", False):
+        return None
+    defaults = DEFAULT_CONFIG["plan_config"]
+    return ActionPlan(
+        max_actions=PLAN_CONFIG.get("max_actions", defaults["max_actions"]),
+        change_ratio=PLAN_CONFIG.get("change_ratio", defaults["change_ratio"]),
+        frame_change_ratio=PLAN_CONFIG.get("frame_change_ratio", defaults["frame_change_ratio"]),
+        pixel_threshold=PLAN_CONFIG.get("pixel_threshold", defaults["pixel_threshold"])
+    )
+
+def create_task_accounting(user_content):
+    """按accounting_config创建本次任务的用量统计"""
+    defaults = DEFAULT_CONFIG["accounting_config"]
+    return TaskAccounting(
+        user_content,
+        input_price=ACCOUNTING_CONFIG.get("input_price", defaults["input_price"]),
+        cached_price=ACCOUNTING_CONFIG.get("cached_price", defaults["cached_price"]),
+        output_price=ACCOUNTING_CONFIG.get("output_price", defaults["output_price"])
+    )
+
+def record_model_call(accounting, step, seconds, model_name=None, kind="main"):
+    """记录一次模型调用的用量并通知界面"""
+    if accounting is None:
+        return
+    record = accounting.add_call(step, last_completion_usage, last_image_info, seconds,
+                                 model_name or API_CONFIG["model_name"], kind)
+    log_print(f"本次调用: 输入token {record['prompt_tokens']}（缓存命中 {record['cached_tokens']}），"
+              f"输出token {record['completion_tokens']}，截图 {record['image_width']} x {record['image_height']} "
+              f"{record['image_bytes'] / 1024:.1f} KB，耗时 {seconds:.2f}秒")
+    if usage_callback:
+        try:
+            usage_callback(accounting.totals())
+        except Exception as e:
+            log_print(f"用量回调出错: {e}")
+
+def finish_task_accounting(accounting, result):
+    """任务结束时写出JSON用量摘要"""
+    global last_task_summary
+    accounting.finish(result)
+    last_task_summary = accounting.summary()
+    log_print(accounting.report())
+    directory = ACCOUNTING_CONFIG.get("summary_directory", DEFAULT_CONFIG["accounting_config"]["summary_directory"])
+    if not directory:
+        return
+    if is_mac_app() and not os.path.isabs(directory):
+        directory = get_resource_file_path(directory)
+    try:
+        log_print(f"任务用量摘要已写入: {accounting.write_summary(directory)}")
+    except OSError as e:
+        log_print(f"写入任务用量摘要失败: {e}")
+
+# 流式模式下可以在完整输出前提前移动鼠标的操作
+PREMOVE_ACTIONS = ("click", "double_click", "long_press", "right_click", "scroll_up", "scroll_down", "drag")
+
+def get_action_point(coordinates, action, frame):
+    """
+    计算操作的鼠标落点（拖拽取起点）
+
+    返回:
+        tuple: 屏幕坐标 (x, y)，操作不需要移动鼠标或坐标无效时返回None
+    """
+    if action not in PREMOVE_ACTIONS or not isinstance(coordinates, list) or len(coordinates) != 2:
+        return None
+    point = coordinates[0] if isinstance(coordinates[0], list) else coordinates
+    if len(point) != 2 or not all(isinstance(value, (int, float)) for value in point):
+        return None
+    img_width, img_height = frame.size
+    return map_coordinates(point[0], point[1], frame.scale, img_width, img_height, frame.offset_x, frame.offset_y)
+
+def wait_for_screen_settle(action, fallback_delay):
+    """
+    操作执行后等待画面稳定
     
-    # 修改输出路径
-    if "output_path" in SCREENSHOT_CONFIG and not os.path.isabs(SCREENSHOT_CONFIG["output_path"]):
-        SCREENSHOT_CONFIG["output_path"] = get_resource_file_path(SCREENSHOT_CONFIG["output_path"])
-        log_print(f"Mac App环境，修改输出路径为: {SCREENSHOT_CONFIG['output_path']}")
+    参数:
+        action: 操作类型，用于按类型统计稳定耗时
+        fallback_delay: 未启用稳定等待时的固定等待时间（秒）
+    """
+    engine = get_agent_engine()
+    if settle_waiter is None:
+        engine.sleep(fallback_delay)
+        return fallback_delay
+    elapsed = settle_waiter.wait(action, get_capture_backend(), should_stop=lambda: should_exit, sleep=engine.sleep)
+    log_print(f"画面稳定用时: {elapsed:.2f}秒")
+    return elapsed
 
-# 在文件开头导入后添加
-pyautogui.FAILSAFE = MOUSE_CONFIG["failsafe"]  # 禁用安全机制
+def is_on_monitor(x, y):
+    """
+    判断鼠标坐标是否落在某个显示器上
 
-def read_local_image(image_path):
+    多显示器拼接截图中，尺寸或位置不一致的显示器之间有不属于任何显示器的空白区域，
+    坐标落在其中时不执行操作；未按显示器截图时不检查
     """
-    读取本地图片并转换为base64编码
+    if SCREENSHOT_CONFIG.get("monitor") is None:
+        return True
+    return get_monitor_layout().monitor_at(x, y) is not None
+
+# 当前使用的输入执行器，mouse_config.executor变化时重新创建
+input_executor = None
+input_executor_name = None
+
+def get_input_executor():
+    """
+    获取输入执行器：xtest在Linux X11下直接注入输入事件，pyautogui兼容所有平台，
+    auto优先使用xtest，dry_run只记录操作（配合回放截图后端使用）
+    """
+    global input_executor, input_executor_name
+    name = MOUSE_CONFIG.get("executor", "auto")
+    if input_executor is None or input_executor_name != name:
+        if input_executor is not None:
+            input_executor.close()
+        input_executor = create_executor(
+            name,
+            failsafe=MOUSE_CONFIG.get("failsafe", False),  # 禁用安全机制
+            pause=MOUSE_CONFIG.get("pyautogui_pause", DEFAULT_CONFIG["mouse_config"]["pyautogui_pause"])
+        )
+        input_executor_name = name
+        log_print(f"输入执行器: {input_executor.name}")
+    return input_executor
+
+# 当前使用的文本输入引擎，输入执行器或keyboard_config变化时重新创建
+text_input = None
+text_input_settings = None
+
+def get_text_input():
+    """
+    获取文本输入引擎：优先通过输入执行器直接输入Unicode文本，不支持时复制到剪贴板后粘贴
     """
+    global text_input, text_input_settings
+    executor = get_input_executor()
+    defaults = DEFAULT_CONFIG["keyboard_config"]
+    settings = {key: KEYBOARD_CONFIG.get(key, value) for key, value in defaults.items()}
+    if text_input is None or text_input.executor is not executor or text_input_settings != settings:
+        text_input = TextInput(executor, **settings)
+        text_input_settings = settings
+    return text_input
+
+def encode_frame_image(frame):
+    """
+    将内存中的截图帧编码为base64的data URL，无需经过磁盘
+    编码格式和质量按当前模型在image_encoding_config中的配置选择
+    """
+    global last_image_info
     try:
-        # 使用cv2读取图片
-        img = cv2.imread(image_path)
-        if img is None:
-            raise Exception(f"无法读取图片: {image_path}")
-        
-        # 获取图片信息
-        height, width, channels = img.shape
-        log_print(f"成功读取图片: {image_path}")
-        log_print(f"图片尺寸: {width} x {height} 像素")
-        log_print(f"图片通道数: {channels}")
-        
-        # 将图片编码为base64
-        _, buffer = cv2.imencode('.png', img)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
+        settings = get_encoding_for_model(IMAGE_ENCODING_CONFIG, API_CONFIG["model_name"])
+        encoded = encode_with_settings(frame.image, settings)
+        log_print(f"图片尺寸: {encoded.width} x {encoded.height} 像素，"
+                  f"编码: {settings['format']}，大小: {encoded.size / 1024:.1f} KB，"
+                  f"编码耗时: {encoded.encode_time * 1000:.0f} ms")
         
         # 返回data URL格式的图片数据
-        return f"data:image/png;base64,{img_base64}"
+        data_url = encoded.to_data_url()
+        last_image_info = {"bytes": encoded.size, "payload_bytes": len(data_url),
+                           "width": encoded.width, "height": encoded.height, "format": settings["format"]}
+        return data_url
     except Exception as e:
-        log_print(f"读取图片时出错: {e}")
+        log_print(f"编码图片时出错: {e}")
         return None
 
 class MathResponse(BaseModel):
@@ -193,47 +606,93 @@ class MathResponse(BaseModel):
     coordinates: list
     action: str
     type_information: str
+    # 输入文本后是否按回车，模型省略时按回车
+    submit: bool = True
+
+class PlannedAction(BaseModel):
+    element_info: str
+    coordinates: list
+    action: str
+    type_information: str
+    submit: bool = True
+    expected_region: list
+
+class PlanResponse(MathResponse):
+    # 开启多步计划时使用：当前操作的预期变化区域和之后可以在本地依次执行的操作
+    expected_region: list = []
+    next_actions: List[PlannedAction] = []
+
+async def stream_completion_async(client, request, on_fields=None):
+    """
+    以流式方式请求模型，边接收边增量解析JSON，任务被取消时流式连接随之关闭
+
+    参数:
+        client: 异步模型客户端
+        request: 传给completions接口的参数
+        on_fields: 每当有顶层字段完整生成时调用，参数为已完成字段的字典
+
+    返回:
+        tuple: (完整的输出文本, usage, 结构化输出的解析结果)
+    """
+    parser = IncrementalJSONParser()
+    try:
+        async with client.beta.chat.completions.stream(stream_options={"include_usage": True}, **request) as stream:
+            async for event in stream:
+                if event.type != "content.delta":
+                    continue
+                if parser.feed(event.delta) and on_fields is not None:
+                    on_fields(parser.fields)
+            completion = await stream.get_final_completion()
+    except ValidationError as e:
+        # 输出与格式不符时SDK解析失败，已接收的文本交给本地校验修复（此时拿不到usage）
+        log_print(f"结构化输出与格式不符（{e.error_count()} 处），使用已接收的输出文本")
+        return parser.text, None, None
+    content = completion.choices[0].message.content or parser.text
+    return content, getattr(completion, "usage", None), get_parsed_message(completion)
+
+def get_parsed_message(completion):
+    """返回结构化输出已解析的结果（字典），响应中没有解析结果时返回None"""
+    parsed = getattr(completion.choices[0].message, "parsed", None)
+    return parsed.model_dump() if isinstance(parsed, BaseModel) else None
+
+def validate_response(element):
+    """用MathResponse校验解析后的模型输出，字段齐全且类型正确时返回True"""
+    if not isinstance(element, dict):
+        return False
+    try:
+        MathResponse.model_validate(element)
+        return True
+    except Exception as e:
+        log_print(f"模型输出未通过校验: {e}")
+        return False
 
 # 读取本地图片
-def get_next_element(user_content):
+def build_model_request(user_content, frame, model_name=None, thinking_type=None, dynamic_content=""):
+    """
+    重新加载配置，编码截图并组装模型请求参数
+
+    消息按不变的部分在前排列：系统提示词、用户任务、截图、每步变化的历史操作和当前时间，
+    系统提示词和任务在各步之间逐字节相同，便于服务端前缀缓存命中
+
+    参数:
+        user_content: 用户任务（整个任务中不变）
+        frame: 内存中的截图帧
+        model_name: 模型路由选择的模型，为None时使用api_config中的模型
+        thinking_type: 模型路由选择的深度思考设置，为None时使用ai_config中的设置
+        dynamic_content: 每步变化的内容（历史操作、当前时间），放在截图之后
+
+    返回:
+        dict: completions接口的参数，截图编码失败或未设置API Key时返回None
+    """
     # 重新加载配置文件，确保使用最新的API密钥
-    global API_CONFIG, AI_CONFIG, EXECUTION_CONFIG, SCREENSHOT_CONFIG, MOUSE_CONFIG
-    config = load_config()
-    if config:
-        API_CONFIG = config.get("api_config", DEFAULT_CONFIG["api_config"])
-        AI_CONFIG = config.get("ai_config", DEFAULT_CONFIG["ai_config"])
-        EXECUTION_CONFIG = config.get("execution_config", DEFAULT_CONFIG["execution_config"])
-        SCREENSHOT_CONFIG = config.get("screenshot_config", DEFAULT_CONFIG["screenshot_config"])
-        MOUSE_CONFIG = config.get("mouse_config", DEFAULT_CONFIG["mouse_config"])
-    else:
-        API_CONFIG = DEFAULT_CONFIG["api_config"]
-        AI_CONFIG = DEFAULT_CONFIG["ai_config"]
-        EXECUTION_CONFIG = DEFAULT_CONFIG["execution_config"]
-        SCREENSHOT_CONFIG = DEFAULT_CONFIG["screenshot_config"]
-        MOUSE_CONFIG = DEFAULT_CONFIG["mouse_config"]
+    global last_image_info
+    last_image_info = None
+    _apply_config(load_config())
     
-    # 如果是Mac系统下的打包app状态，修改SCREENSHOT_CONFIG中的路径
-    if is_mac_app():
-        # 修改输入路径
-        if "input_path" in SCREENSHOT_CONFIG and not os.path.isabs(SCREENSHOT_CONFIG["input_path"]):
-            SCREENSHOT_CONFIG["input_path"] = get_resource_file_path(SCREENSHOT_CONFIG["input_path"])
-        
-        # 修改输出路径
-        if "output_path" in SCREENSHOT_CONFIG and not os.path.isabs(SCREENSHOT_CONFIG["output_path"]):
-            SCREENSHOT_CONFIG["output_path"] = get_resource_file_path(SCREENSHOT_CONFIG["output_path"])
-    
-    # 本地图片路径
-    image_path = SCREENSHOT_CONFIG["input_path"]
-    
-    # 检查图片是否存在
-    if not os.path.exists(image_path):
-        log_print(f"错误：图片文件不存在 - {os.path.abspath(image_path)}")
-        return
-    
-    # 读取并转换图片
-    image_data_url = read_local_image(image_path)
+    # 直接编码内存中的截图帧
+    image_data_url = encode_frame_image(frame)
     if not image_data_url:
-        log_print("无法继续，图片读取失败")
+        log_print("无法继续，截图编码失败")
         return
     
     # 尝试获取API Key
@@ -244,120 +703,170 @@ def get_next_element(user_content):
         # 可以选择保存处理后的图片信息到文件
         return
     
-    log_print("\n正在初始化OpenAI客户端并调用多模态模型分析图片...")
-    
-    client = OpenAI(
-    # 若没有配置环境变量，请用百炼API Key将下行替换为：api_key="sk-xxx"
-    # 新加坡和北京地域的API Key不同。获取API Key：https://help.aliyun.com/zh/model-studio/get-api-key
-    api_key=api_key,
-    
-    # 以下为北京地域url，若使用新加坡地域的模型，需将url替换为：https://dashscope-intl.aliyuncs.com/api/v1/services/aigc/text-generation/generation
-    base_url=API_CONFIG["base_url"],
-    )
-
-    # 读取get_next_action_AI_doubao.txt文件
+    # 读取get_next_action_AI_doubao.txt文件（按修改时间缓存）
     if current_os == "Darwin":  # macOS
         txt_path = "get_next_action_AI_doubao_mac.txt"
         if is_mac_app():
             txt_path = get_resource_file_path(txt_path)
-        with open(txt_path, "r", encoding="utf-8") as file:
-            system_content = file.read().strip()
+        system_content, _ = read_text_cached(txt_path)
     else:
-        with open("get_next_action_AI_doubao.txt", "r", encoding="utf-8") as file:
-            system_content = file.read().strip()
+        system_content, _ = read_text_cached("get_next_action_AI_doubao.txt")
     #log_print(f"系统内容：{system_content}")
+    # 多步计划：系统提示词追加计划说明，输出格式增加预期变化区域和后续操作
+    plan_enabled = PLAN_CONFIG.get("enabled", False)
+    if plan_enabled:
+        system_content += PLAN_PROMPT.format(
+            max_actions=PLAN_CONFIG.get("max_actions", DEFAULT_CONFIG["plan_config"]["max_actions"]))
 
-    completion = client.beta.chat.completions.parse(
-        model=API_CONFIG["model_name"],  # 此处以doubao-1-5-ui-tars-250428为例，可按需更换模型名称。模型列表：https://help.aliyun.com/zh/model-studio/models
+    request = dict(
+        model=model_name or API_CONFIG["model_name"],  # 此处以doubao-1-5-ui-tars-250428为例，可按需更换模型名称。模型列表：https://help.aliyun.com/zh/model-studio/models
         messages=[
             {"role": "system",
             "content": system_content},
             {"role": "user",
-            "content": [{"type": "image_url",
-                        "image_url": {"url": image_data_url},},
-                        {"type": "text", "text": user_content}]}],
+            "content": [{"type": "text", "text": user_content},
+                        {"type": "image_url",
+                        "image_url": {"url": image_data_url},}]
+                       + ([{"type": "text", "text": dynamic_content}] if dynamic_content else [])}],
         #stream=True,
         # extra_body={'enable_thinking': False,
         #             "vl_high_resolution_images":True},
         # response_format={"type": "json_object"}
-        response_format=MathResponse,
+        response_format=PlanResponse if plan_enabled else MathResponse,
         extra_body={
         "thinking": {
-            "type": AI_CONFIG["thinking_type"]  # 从配置文件获取深度思考设置
+            "type": thinking_type or AI_CONFIG["thinking_type"]  # 从配置文件获取深度思考设置
         },
     },
     )
+    return request
+
+def get_request_policy():
+    """获取模型请求策略，每次调用时应用配置文件中的最新参数"""
+    global request_policy
+    if request_policy is None:
+        request_policy = RequestPolicy()
+    request_policy.update(REQUEST_CONFIG)
+    return request_policy
+
+def get_context_cache():
+    """获取方舟上下文缓存，未启用时返回None"""
+    global context_cache
+    if not CACHE_CONFIG.get("context_cache", False):
+        return None
+    if context_cache is None:
+        context_cache = ContextCache(CACHE_CONFIG.get("ttl", DEFAULT_CACHE_CONFIG["ttl"]))
+    return context_cache
+
+async def send_model_request(client, request, on_fields=None):
+    """发出一次模型请求，返回 (输出文本, usage, 结构化输出的解析结果)"""
+    cache = get_context_cache()
+    if cache is not None and cache.available:
+        # 上下文缓存接口不支持流式和结构化输出，返回的文本由parse_json解析
+        try:
+            completion = await cache.create_completion(client, request)
+            return completion.choices[0].message.content, getattr(completion, "usage", None), None
+        except openai.APIStatusError as e:
+            if e.status_code not in (400, 404):
+                raise
+            # 缓存已过期或服务不支持上下文缓存，删除记录并改用普通请求
+            log_print(f"上下文缓存请求失败（{e.status_code}），改用普通请求")
+            cache.invalidate(request["model"], request["messages"][0]["content"])
+    if AI_CONFIG.get("stream", False):
+        return await stream_completion_async(client, request, on_fields)
+    completion = await parse_completion_async(client, request)
+    return completion.choices[0].message.content, getattr(completion, "usage", None), get_parsed_message(completion)
+
+async def parse_completion_async(client, request):
+    """
+    发出结构化输出请求
+
+    SDK按输出格式解析模型输出，字段类型不符（如坐标给成了字符串）时会抛出异常并丢弃输出，
+    此时改用原始响应，输出文本交给本地校验修复
+    """
+    raw = await client.beta.chat.completions.with_raw_response.parse(**request)
+    try:
+        return raw.parse()
+    except ValidationError as e:
+        log_print(f"结构化输出与格式不符（{e.error_count()} 处），使用原始输出文本")
+        return ChatCompletion.model_validate(raw.http_response.json())
+
+async def get_next_element_async(user_content, frame=None, on_fields=None, model_name=None, thinking_type=None,
+                                 dynamic_content=""):
+    """
+    请求模型给出下一步操作
+    任务被取消时进行中的HTTP请求立即中止；超时和临时性错误按request_config重试，
+    开启对冲时请求耗时超过历史p95后再发出一个相同的请求，采用先返回的结果。
+    model_name和thinking_type由模型路由按档位指定
+    """
+    global last_completion_usage, last_parsed_response, last_model_request
+    last_parsed_response = None
+    # 读取配置和编码截图在线程池中进行，不阻塞事件循环
+    request = await asyncio.to_thread(build_model_request, user_content, frame, model_name, thinking_type, dynamic_content)
+    if request is None:
+        return
+    last_model_request = request
+    log_print("\n正在调用多模态模型分析图片...")
+    client = get_async_model_client(API_CONFIG["api_key"], API_CONFIG["base_url"])
+    content, last_completion_usage, last_parsed_response = await get_request_policy().call(
+        lambda: send_model_request(client, request, on_fields)
+    )
+    log_print(format_cache_usage(last_completion_usage))
+    log_print(content)
+    return content
 
-    log_print(completion.choices[0].message.content)
-    return completion.choices[0].message.content
 
+async def reask_model_async(previous_output, problems):
+    """
+    针对未通过校验的输出追问模型
+
+    在上一次请求的消息之后追加模型的输出和问题说明，系统提示词、任务和截图与上一次请求相同，
+    可以命中前缀缓存，只增加少量输入token
+    """
+    global last_completion_usage, last_parsed_response
+    last_parsed_response = None
+    if last_model_request is None:
+        return None
+    request = dict(last_model_request)
+    request["messages"] = last_model_request["messages"] + [
+        {"role": "assistant", "content": previous_output},
+        {"role": "user", "content": build_reask_prompt(problems)}
+    ]
+    log_print("\n正在追问模型修正输出...")
+    client = get_async_model_client(API_CONFIG["api_key"], API_CONFIG["base_url"])
+    content, last_completion_usage, last_parsed_response = await get_request_policy().call(
+        lambda: send_model_request(client, request)
+    )
+    log_print(format_cache_usage(last_completion_usage))
+    log_print(content)
+    return content
 
 # 一个解析json的函数
 def parse_json(json_str):
     """
     解析AI输出的JSON字符串，能够处理格式不规范的情况
-    例如：移除多余的大括号、处理代码块标记、从文本中提取JSON等
+    例如：移除多余的大括号、处理代码块标记、从文本中提取JSON等，被截断的输出返回None
+    结构化输出已经解析好的字典直接返回
     """
+    if isinstance(json_str, dict):
+        return json_str
     try:
-        # 预处理：移除代码块标记
-        if json_str.startswith('```json'):
-            json_str = json_str[7:]
-        if json_str.endswith('```'):
-            json_str = json_str[:-3]
-        
-        # 去除首尾空白字符
-        json_str = json_str.strip()
-        
-        # 使用正则表达式匹配JSON内容
-        # 这个正则表达式会匹配完整的JSON对象（包括嵌套结构）
-        json_pattern = r'\{\s*"(?:[^"\\]|\\.)*"\s*:\s*(?:"(?:[^"\\]|\\.)*"|\d+\.?\d*|true|false|null|\[.*?\]|\{.*?\})\s*(?:,\s*"(?:[^"\\]|\\.)*"\s*:\s*(?:"(?:[^"\\]|\\.)*"|\d+\.?\d*|true|false|null|\[.*?\]|\{.*?\})\s*)*\}'
-        
-        # 查找所有匹配的JSON对象
-        json_matches = re.findall(json_pattern, json_str, re.DOTALL)
-        
-        if json_matches:
-            # 取最长的匹配项（最可能是完整的JSON）
-            valid_json = max(json_matches, key=len)
-            log_print(f"从AI输出中提取的JSON: {valid_json}")
-            return json.loads(valid_json)
-        else:
-            # 如果正则匹配失败，尝试原始方法
-            log_print("正则匹配JSON失败，尝试原始方法")
-            # 找到第一个 '{' 和最后一个 '}'
-            first_brace = json_str.find('{')
-            last_brace = json_str.rfind('}')
-            
-            if first_brace != -1 and last_brace != -1 and first_brace < last_brace:
-                # 提取有效的JSON部分
-                valid_json = json_str[first_brace:last_brace + 1]
-                log_print(f"提取的有效JSON: {valid_json}")
-                return json.loads(valid_json)
-            else:
-                # 尝试直接解析原始字符串
-                return json.loads(json_str)
-            
-    except json.JSONDecodeError as e:
-        log_print(f"JSON解析错误: {e}")
-        # 尝试更复杂的修复策略
-        try:
-            # 移除多余的大括号
-            cleaned_str = re.sub(r'^\s*{\s*{\s*', '{', json_str)
-            cleaned_str = re.sub(r'\s*}\s*}\s*$', '}', cleaned_str)
-            log_print(f"清理后的JSON: {cleaned_str}")
-            return json.loads(cleaned_str)
-        except json.JSONDecodeError as e2:
-            log_print(f"二次解析失败: {e2}")
-            return None
+        element = extract_json(json_str)
     except Exception as e:
         log_print(f"解析过程中发生错误: {e}")
         return None
+    if element is None:
+        log_print(f"未能从AI输出中提取JSON: {json_str[:200] if json_str else json_str}")
+    return element
 
 # 控制鼠标函数
-def move_mouse_to_coordinates(coordinates, action, type_information, duration=MOUSE_CONFIG["move_duration"], scale=1):
+def move_mouse_to_coordinates(coordinates, action, type_information, duration=MOUSE_CONFIG["move_duration"], scale=1, frame=None, submit=True):
     """
     将鼠标移动到指定坐标点并执行相应操作
     :param coordinates: 目标坐标，可以是单点[x, y]或拖拽坐标[[x1, y1], [x2, y2]]
     :param duration: 移动动画时间（秒），默认0.1秒
+    :param frame: 本次决策所用的截图帧，用于获取图像宽高和缩放比例
+    :param submit: 输入文本后是否按回车，对应模型输出的submit字段
     """
     # 验证坐标有效性的辅助函数
     def validate_coordinate(coord):
@@ -369,37 +878,46 @@ def move_mouse_to_coordinates(coordinates, action, type_information, duration=MO
         return coord
     
     # 验证并修复坐标
+    def fix_point(point):
+        """单点坐标 [x, y]，缺少数值（如快捷键操作给出的 []）时为 [0, 0]"""
+        if not isinstance(point, (list, tuple)) or len(point) < 2:
+            return [0, 0]
+        return [validate_coordinate(point[0]), validate_coordinate(point[1])]
+
     def fix_coordinates(coords):
         """修复坐标数据，确保其格式正确且值在合理范围内"""
-        if isinstance(coords[0], list):
+        if isinstance(coords, (list, tuple)) and coords and isinstance(coords[0], (list, tuple)):
             # 拖拽坐标 [[x1, y1], [x2, y2]]
-            return [
-                [validate_coordinate(coords[0][0]), validate_coordinate(coords[0][1])],
-                [validate_coordinate(coords[1][0]), validate_coordinate(coords[1][1])]
-            ]
-        else:
-            # 单点坐标 [x, y]
-            return [validate_coordinate(coords[0]), validate_coordinate(coords[1])]
+            return [fix_point(coords[0]), fix_point(coords[1] if len(coords) > 1 else None)]
+        # 单点坐标 [x, y]
+        return fix_point(coords)
     
     # 修复坐标
     coordinates = fix_coordinates(coordinates)
+    executor = get_input_executor()
     # 先处理页面加载状态
     if action == "page_loading":
-        log_print("检测到页面正在加载，暂停3秒...")
-        action_str = "检测到页面正在加载，暂停3秒..."+"\n"
-        time.sleep(0.5)
+        log_print("检测到页面正在加载，等待画面稳定...")
+        action_str = "检测到页面正在加载，等待画面稳定..."+"\n"
+        wait_for_screen_settle(action, 0.5)
         log_print("暂停结束，继续操作")
         action_str = action_str + "暂停结束，继续操作"+"\n"
         return action_str, None
     
-    # 获取图像实际宽高
-    image_path = SCREENSHOT_CONFIG["input_path"]
-    img = cv2.imread(image_path)
-    if img is not None:
-        img_height, img_width, _ = img.shape
+    # 获取图像实际宽高及其在屏幕上的偏移（区域放大截图时非0）
+    offset_x = offset_y = 0
+    if frame is not None:
+        img_width, img_height = frame.size
+        scale = frame.scale
+        offset_x, offset_y = frame.offset_x, frame.offset_y
     else:
-        img_width = None
-        img_height = None
+        image_path = SCREENSHOT_CONFIG["input_path"]
+        img = cv2.imread(image_path)
+        if img is not None:
+            img_height, img_width, _ = img.shape
+        else:
+            img_width = None
+            img_height = None
     
     action_str = ""
     
@@ -420,10 +938,13 @@ def move_mouse_to_coordinates(coordinates, action, type_information, duration=MO
                 keys = ["win" if key == "meta" else key for key in keys]
             
             log_print(f"执行热键操作: {'+'.join(keys)}")
-            pyautogui.hotkey(*keys)
+            executor.hotkey(*keys)
             action_str = f"执行热键操作: {'+'.join(keys)}"+"\n"
         else:
             log_print("热键操作但未提供快捷键信息")
+        # 快捷键通常会切换窗口或界面，等待画面稳定后再截图（未启用时不额外等待）
+        if settle_waiter is not None:
+            wait_for_screen_settle(action, 0)
         return action_str, None
     
     # 处理拖拽操作
@@ -433,31 +954,35 @@ def move_mouse_to_coordinates(coordinates, action, type_information, duration=MO
         end_x, end_y = coordinates[1]
         
         # 映射坐标
-        start_x, start_y = map_coordinates(start_x, start_y, scale, img_width, img_height)
+        start_x, start_y = map_coordinates(start_x, start_y, scale, img_width, img_height, offset_x, offset_y)
         
         # 通知主窗口拖拽起点坐标（仅在坐标有效时）
-        if coordinate_callback and 0 <= start_x <= 100000 and 0 <= start_y <= 100000:
+        if coordinate_callback and -100000 <= start_x <= 100000 and -100000 <= start_y <= 100000:
             try:
                 coordinate_callback((start_x, start_y))
             except Exception as e:
                 log_print(f"调用坐标回调函数时出错: {e}")
         
-        end_x, end_y = map_coordinates(end_x, end_y, scale, img_width, img_height)
+        end_x, end_y = map_coordinates(end_x, end_y, scale, img_width, img_height, offset_x, offset_y)
+        
+        if not is_on_monitor(start_x, start_y) or not is_on_monitor(end_x, end_y):
+            log_print(f"拖拽坐标位于显示器之外，不执行操作: ({start_x}, {start_y}) -> ({end_x}, {end_y})")
+            return "拖拽坐标位于显示器之外，未执行操作"+"\n", None
         
         # 通知主窗口拖拽终点坐标（仅在坐标有效时）
-        if coordinate_callback and 0 <= end_x <= 100000 and 0 <= end_y <= 100000:
+        if coordinate_callback and -100000 <= end_x <= 100000 and -100000 <= end_y <= 100000:
             try:
                 coordinate_callback((end_x, end_y))
             except Exception as e:
                 log_print(f"调用坐标回调函数时出错: {e}")
         
         # 执行拖拽操作
-        pyautogui.moveTo(start_x, start_y, duration=duration)
+        executor.move_to(start_x, start_y, duration=duration)
         log_print(f"鼠标已移动到拖拽起点: ({start_x}, {start_y})")
         action_str = f"鼠标已移动到拖拽起点: ({start_x}, {start_y})"+"\n"
         
         # 按下鼠标左键并拖动到终点
-        pyautogui.dragTo(end_x, end_y, duration=duration*10)
+        executor.drag_to(end_x, end_y, duration=duration*10)
         log_print(f"已完成拖拽操作: ({start_x}, {start_y}) -> ({end_x}, {end_y})")
         action_str = action_str + f"已完成拖拽操作: ({start_x}, {start_y}) -> ({end_x}, {end_y})"+"\n"
         
@@ -468,89 +993,162 @@ def move_mouse_to_coordinates(coordinates, action, type_information, duration=MO
         x, y = coordinates
         
         # 映射坐标
-        x, y = map_coordinates(x, y, scale, img_width, img_height)
+        x, y = map_coordinates(x, y, scale, img_width, img_height, offset_x, offset_y)
+        
+        if not is_on_monitor(x, y):
+            log_print(f"坐标位于显示器之外，不执行操作: ({x}, {y})")
+            return f"坐标 ({x}, {y}) 位于显示器之外，未执行操作"+"\n", None
         
         # 通知主窗口AI输出的坐标（仅在坐标有效时）
-        if coordinate_callback and 0 <= x <= 100000 and 0 <= y <= 100000:
+        if coordinate_callback and -100000 <= x <= 100000 and -100000 <= y <= 100000:
             try:
                 coordinate_callback((x, y))
                 log_print(f"已通知主窗口AI输出的坐标: ({x}, {y})")
             except Exception as e:
                 log_print(f"调用坐标回调函数时出错: {e}")
         
-        # 移动鼠标
-        pyautogui.moveTo(x, y, duration=duration)
-        log_print(f"鼠标已移动到坐标: ({x}, {y})")
-        action_str = f"鼠标已移动到坐标: ({x}, {y})"+"\n"
+        # 移动鼠标和随后的点击合并为一批事件发送
+        with executor.batch():
+            executor.move_to(x, y, duration=duration)
+            log_print(f"鼠标已移动到坐标: ({x}, {y})")
+            action_str = f"鼠标已移动到坐标: ({x}, {y})"+"\n"
         
-        # 保存映射后的坐标
-        mapped_coordinates = [x, y]
+            # 保存映射后的坐标
+            mapped_coordinates = [x, y]
         
-        # 执行相应操作
-        if action == "click":
-            pyautogui.click()
-            log_print(f"已点击 ({x}, {y})")
-            action_str = action_str + f"已点击 ({x}, {y})"+"\n"
-        elif action == "double_click":
-            pyautogui.doubleClick()
-            log_print(f"已双击 ({x}, {y})")
-            action_str = action_str + f"已双击 ({x}, {y})"+"\n" 
-        elif action == "long_press":
-            pyautogui.mouseDown()
-            log_print(f"已长按 ({x}, {y})")
-            action_str = action_str + f"已长按 ({x}, {y})"+"\n" 
-        elif action == "right_click":
-            pyautogui.rightClick()
-            log_print(f"已右键点击 ({x}, {y})")
-            action_str = action_str + f"已右键点击 ({x}, {y})"+"\n" 
-        elif action == "scroll_up":
-            pyautogui.scroll(500)
-            log_print(f"已向上滚动 ({x}, {y})")
-            action_str = action_str + f"已向上滚动 ({x}, {y})"+"\n" 
-        elif action == "scroll_down":
-            pyautogui.scroll(-500)
-            log_print(f"已向下滚动 ({x}, {y})")
-            action_str = action_str + f"已向下滚动 ({x}, {y})"+"\n" 
-        else:
-            log_print(f"未知操作: {action}")
+            # 执行相应操作
+            if action == "click":
+                executor.click()
+                log_print(f"已点击 ({x}, {y})")
+                action_str = action_str + f"已点击 ({x}, {y})"+"\n"
+            elif action == "double_click":
+                executor.double_click()
+                log_print(f"已双击 ({x}, {y})")
+                action_str = action_str + f"已双击 ({x}, {y})"+"\n" 
+            elif action == "long_press":
+                executor.mouse_down()
+                log_print(f"已长按 ({x}, {y})")
+                action_str = action_str + f"已长按 ({x}, {y})"+"\n" 
+            elif action == "right_click":
+                executor.right_click()
+                log_print(f"已右键点击 ({x}, {y})")
+                action_str = action_str + f"已右键点击 ({x}, {y})"+"\n" 
+            elif action == "scroll_up":
+                executor.scroll(500)
+                log_print(f"已向上滚动 ({x}, {y})")
+                action_str = action_str + f"已向上滚动 ({x}, {y})"+"\n" 
+            elif action == "scroll_down":
+                executor.scroll(-500)
+                log_print(f"已向下滚动 ({x}, {y})")
+                action_str = action_str + f"已向下滚动 ({x}, {y})"+"\n" 
+            else:
+                log_print(f"未知操作: {action}")
     
-    time.sleep(0.2)
     if type_information != "" and action != "hotkey":
-        # 将type_information保存到剪切板
-        pyperclip.copy(type_information)
-        
-        # 根据操作系统执行粘贴
-        current_os = platform.system()
-        time.sleep(0.1)
-        if current_os == "Darwin":  # macOS
-            # macOS上使用更可靠的粘贴方法
-            # 先确保焦点在正确的输入框中
-            time.sleep(0.2)
-            # 使用keydown和keyup确保按键持续时间足够
-            pyautogui.keyDown('command')
-            time.sleep(0.1)
-            pyautogui.press('v')
-            time.sleep(0.1)
-            pyautogui.keyUp('command')
-        else:  # Windows和其他系统
-            pyautogui.hotkey('ctrl', 'v')
-        
-        log_print(f"已粘贴: {type_information}")
-        time.sleep(0.5)
-        pyautogui.press('enter')
-        time.sleep(0.5)
-        log_print("已发送")
-        action_str = action_str + f"已发送: {type_information}"+"\n" 
+        # 直接输入文本（不支持时粘贴），文本中的换行符表示回车，submit为True时输入后再按回车
+        typer = get_text_input()
+        submitted = typer.enter(type_information, submit)
+        if typer.fallback_reason:
+            log_print(f"无法直接输入文本，改为粘贴: {typer.fallback_reason}")
+            typer.fallback_reason = None
+        method = "粘贴" if typer.last_method == "clipboard" else "输入"
+        log_print(f"已{method}: {type_information!r}")
+        if submitted:
+            log_print("已发送")
+            action_str = action_str + f"已发送: {type_information}"+"\n" 
+        else:
+            action_str = action_str + f"已输入: {type_information}"+"\n" 
     # 将鼠标快速移动到屏幕的最左上角
-    pyautogui.moveTo(0, 0, duration=duration)
-    time.sleep(1.5)
+    executor.move_to(0, 0, duration=duration)
+    # 等待界面响应操作后稳定下来，而不是固定等待1.5秒
+    wait_for_screen_settle(action, 1.5)
 
     return action_str, mapped_coordinates
 
 # 定义自动控制电脑的函数
 def auto_control_computer(user_content, max_visual_model_iterations=EXECUTION_CONFIG["default_max_iterations"]):
+    """
+    执行自动控制任务，阻塞直到任务完成或被取消
+
+    任务在执行引擎的事件循环中运行，request_stop()可从任意线程立即取消
+    """
+    try:
+        return get_agent_engine().run(auto_control_computer_async(user_content, max_visual_model_iterations))
+    except concurrent.futures.CancelledError:
+        return "程序已被用户中断"
+
+async def auto_control_computer_async(user_content, max_visual_model_iterations=EXECUTION_CONFIG["default_max_iterations"]):
+    global settle_waiter
+    # 画面变化检测器：画面与上次发送给模型的相同时，本地等待变化而不重复请求模型
+    change_detector = create_change_detector()
+    # 画面稳定等待器：操作后轮询低分辨率截图，替代固定sleep
+    settle_waiter = create_settle_waiter()
+    # 按定位模式统计步数和token，用于对比单次定位与区域放大定位
+    grounding_stats = GroundingStats(SCREENSHOT_CONFIG.get("grounding_mode", "single"))
+    # 调试图片在后台线程中标记和写盘，不占用操作与下一次截图之间的时间
+    annotation_writer = create_annotation_writer()
+    # 每一步的截图、模型响应和坐标写入单个会话录制文件
+    recorder = create_session_recorder()
+    # 模型路由：默认使用快速档位，遇到困难信号时升级
+    router = create_router(ROUTER_CONFIG)
+    # 每次模型调用的token、截图大小和费用，任务结束时写出JSON摘要
+    accounting = create_task_accounting(user_content)
+    # 相同画面、相同任务时复用上次的模型输出
+    cache = get_response_cache()
+    # 任务成功后保存操作轨迹，再次执行相同任务时先在本地回放
+    macro_library = get_macro_library()
+    # 模型一次给出多步操作时，后续操作在本地执行并用画面变化确认
+    action_plan = create_action_plan()
+    result = None
+    try:
+        result = await _auto_control_loop(user_content, max_visual_model_iterations, change_detector, grounding_stats,
+                                          annotation_writer, recorder, router, accounting, cache, macro_library,
+                                          action_plan)
+        return result
+    except asyncio.CancelledError:
+        # 停止按钮或Ctrl+C取消了任务，进行中的模型请求已中止
+        log_print("任务已取消，停止循环...")
+        result = "程序已被用户中断"
+        return result
+    finally:
+        finish_task_accounting(accounting, result)
+        if annotation_writer is not None:
+            # 任务结束时等待队列中的标记图片和录制数据全部写入
+            flush_timeout = ANNOTATION_CONFIG.get("flush_timeout", DEFAULT_CONFIG["annotation_config"]["flush_timeout"])
+            if not annotation_writer.close(flush_timeout):
+                log_print(f"后台写入在 {flush_timeout} 秒内未全部完成")
+            log_print(annotation_writer.report())
+        if recorder is not None:
+            recorder.close()
+            log_print(recorder.report())
+        log_print(grounding_stats.report())
+        if change_detector is not None:
+            log_print(f"画面变化检测：本次任务节省 {change_detector.saved_calls} 次模型调用"
+                      f"（本地重新截图 {change_detector.recaptures} 次）")
+        if request_policy is not None:
+            log_print(request_policy.report())
+        if router is not None:
+            log_print(router.report())
+        if action_plan is not None:
+            log_print(action_plan.report())
+        if cache is not None:
+            try:
+                cache.save()
+            except OSError as e:
+                log_print(f"保存响应缓存失败: {e}")
+            log_print(cache.report())
+        if settle_waiter is not None:
+            for action_type, stats in settle_waiter.summary().items():
+                log_print(f"画面稳定耗时[{action_type}]: 平均 {stats['mean']:.2f}秒，最长 {stats['max']:.2f}秒，"
+                          f"共 {stats['count']} 次，超时 {stats['timeouts']} 次")
+
+async def _auto_control_loop(user_content, max_visual_model_iterations, change_detector, grounding_stats,
+                       annotation_writer=None, recorder=None, router=None, accounting=None, response_cache=None,
+                       macro_library=None, action_plan=None):
     global should_exit
     before_output = []  # 将记忆改为列表，方便管理数量
+    # 上一步已完成的操作（上一步出错或未执行操作时保持为空）
+    action_str = ""
     current_status = "未完成"
     # 创建一个收集报错信息的列表
     error_messages = []
@@ -558,10 +1156,38 @@ def auto_control_computer(user_content, max_visual_model_iterations=EXECUTION_CO
     recent_coordinates = []
     # 连续相同坐标的次数
     same_coordinate_count = 0
+    # 归一化的最近操作，作为响应缓存键的一部分
+    recent_actions = []
+    history_length = RESPONSE_CACHE_CONFIG.get("history_length", DEFAULT_CONFIG["response_cache_config"]["history_length"])
+    # 连续发生错误的循环次数，超过上限时结束任务
+    consecutive_errors = 0
+    max_consecutive_errors = EXECUTION_CONFIG.get("max_consecutive_errors",
+                                                  DEFAULT_CONFIG["execution_config"]["max_consecutive_errors"])
+    # 操作轨迹宏：记录本次任务的操作，已有宏时按模板确认逐步回放
+    macro_recorder = macro_player = None
+    if macro_library is not None:
+        defaults = DEFAULT_CONFIG["macro_config"]
+        macro_recorder = MacroRecorder(MACRO_CONFIG.get("template_size", defaults["template_size"]))
+        macro_steps = macro_library.load(user_content)
+        if macro_steps:
+            macro_player = MacroPlayer(macro_steps,
+                                       search_radius=MACRO_CONFIG.get("search_radius", defaults["search_radius"]),
+                                       match_threshold=MACRO_CONFIG.get("match_threshold", defaults["match_threshold"]))
+            log_print(f"找到本任务的操作宏，共 {len(macro_steps)} 步，先在本地回放")
 
-    # 清空label文件夹中的所有标记图片
-    label_dir = SCREENSHOT_CONFIG["output_path"]
-    if os.path.exists(label_dir):
+    # 按显示器截图时，每个任务开始前重新检测显示器（任务之间可能插拔显示器或修改分辨率）
+    if SCREENSHOT_CONFIG.get("monitor") is not None:
+        reset_monitor_layout()
+
+    # 按配置选择截图后端（auto只在首次或配置变化时测速选择最快的可用后端）
+    configure_capture_backend(
+        SCREENSHOT_CONFIG.get("capture_backend", "auto"),
+        replay_path=SCREENSHOT_CONFIG.get("replay_path") or None
+    )
+
+    # 清空label文件夹中的所有标记图片（output_path可能配置为文件路径，此时使用其所在文件夹）
+    label_dir = get_label_dir()
+    if os.path.isdir(label_dir):
         # 删除所有以screen_label开头的png文件
         for filename in os.listdir(label_dir):
             if filename.startswith("screen_label") and filename.endswith(".png"):
@@ -569,6 +1195,8 @@ def auto_control_computer(user_content, max_visual_model_iterations=EXECUTION_CO
                 os.remove(file_path)
         log_print(f"已清空label文件夹: {label_dir}")
 
+    # 上一步通过校验的模型输出（字典），上一步出错或未通过校验时为None
+    next_element = None
     # 视觉模型循环次数
     for i in range(max_visual_model_iterations):
         # 检查退出标志
@@ -583,43 +1211,201 @@ def auto_control_computer(user_content, max_visual_model_iterations=EXECUTION_CO
             before_output = []
             before_content = ""
         else:
-            # 添加新的记录到列表
-            before_output.append(str(next_element))
+            # 添加新的记录到列表（只记录上一步实际解析出的操作）
+            if isinstance(next_element, dict):
+                before_output.append(str(next_element))
             # 保持最多保存10条记录
             if len(before_output) > 10:
                 before_output.pop(0)  # 删除最旧的记录
             # 将列表连接成字符串
             before_output_str = "".join(before_output)
             before_content = "之前的AI输出操作为: "+before_output_str+"\n"+"之前已完成的操作为:"+action_str
+        next_element = None
         
         try:
-            success, scale = capture_screen_and_save(
-                save_path=SCREENSHOT_CONFIG["input_path"],
-                optimize_for_speed=SCREENSHOT_CONFIG["optimize_for_speed"],
-                max_png=SCREENSHOT_CONFIG["max_png"]
-            )
-            if not success:
-                log_print("屏幕截图保存失败")
+            # 截图保留在内存中，仅在开启调试图片时写入磁盘
+            save_debug_images = SCREENSHOT_CONFIG.get("save_debug_images", False)
+            # 区域放大模式需要保留原始分辨率截图，用于第二阶段裁剪
+            zoom_enabled = SCREENSHOT_CONFIG.get("grounding_mode", "single") == "zoom"
+            # 截图缓冲区循环复用，最近两帧始终有效，足够覆盖变化检测和放大定位
+            capture_pool = get_capture_pool() if SCREENSHOT_CONFIG.get("use_buffer_pool", True) else None
+            timings = {}
+            step_start = time.time()
+            def capture():
+                return capture_screen_frame(
+                    optimize_for_speed=SCREENSHOT_CONFIG["optimize_for_speed"],
+                    max_png=SCREENSHOT_CONFIG["max_png"],
+                    save_path=SCREENSHOT_CONFIG["input_path"] if save_debug_images and annotation_writer is None else None,
+                    keep_full_image=zoom_enabled,
+                    monitor=SCREENSHOT_CONFIG.get("monitor"),
+                    pool=capture_pool
+                )
+            # 截图、操作等阻塞阶段在工作线程中执行，事件循环始终可以响应取消
+            frame = await asyncio.to_thread(capture)
+            if frame is None:
+                log_print("屏幕截图失败")
                 continue
-            log_print(f"屏幕截图已保存为 {os.path.basename(SCREENSHOT_CONFIG['input_path'])}")
+            log_print(f"屏幕截图完成: {frame.width} x {frame.height}")
+
+            # 画面与上次执行操作时的相同（页面加载中或操作尚未生效）时，先在本地等待画面变化
+            if change_detector is not None:
+                frame, changed = await asyncio.to_thread(
+                    change_detector.wait_for_change, frame, capture,
+                    should_stop=lambda: should_exit, sleep=get_agent_engine().sleep
+                )
+                if not changed:
+                    log_print(f"画面在 {change_detector.max_wait} 秒内无变化，继续请求模型")
 
             # is_page_loading_message = is_page_loading()
             # log_print(is_page_loading_message)
 
-            next_element = get_next_element(before_content+"\n"+user_content)
+            # 调试模式下保存发送给模型的截图
+            if save_debug_images and annotation_writer is not None:
+                annotation_writer.submit_image(frame.image, SCREENSHOT_CONFIG["input_path"])
+            timings["capture"] = time.time() - step_start
+
+            grounding_stats.steps += 1
+            executor = get_input_executor()
+            model_start = time.time()
+            # 流式模式下坐标和操作一生成就先把鼠标移过去，点击等完整输出校验通过后再执行
+            premove = {"time": None}
+            def on_fields(fields):
+                if premove["time"] is not None or not ("coordinates" in fields and "action" in fields):
+                    return
+                point = get_action_point(fields["coordinates"], fields["action"], frame)
+                if point is not None:
+                    executor.move_to(*point, pause=False)
+                    premove["time"] = time.time()
+                    log_print(f"流式输出已给出坐标，提前移动鼠标到: {point}")
+            # 响应缓存：画面相似、任务和最近操作相同时直接使用缓存的操作，不请求模型
+            # （使用缓存后画面没有推进、出现连续相同坐标时不再查缓存）
+            model_name = thinking_type = parsed_element = None
+            cache_key = cache_hit = macro_element = planned_element = None
+            # 多步计划：上一步确认生效时直接执行模型已给出的下一步操作
+            if action_plan is not None and action_plan.pending:
+                planned_element = await asyncio.to_thread(action_plan.next_element, frame.image)
+                if planned_element is None:
+                    log_print(f"计划中上一步操作的预期区域没有变化（变化占比 {action_plan.last_ratio:.4f}），"
+                              f"放弃剩余计划，重新请求模型")
+            # 操作宏：模板确认目标仍在原处时直接执行宏中的操作，从第一次确认失败开始请求模型
+            if planned_element is None and macro_player is not None and macro_player.active:
+                macro_element = await asyncio.to_thread(macro_player.next_element, frame.image)
+                if macro_element is None and macro_player.index < len(macro_player.steps):
+                    score = f"{macro_player.last_score:.2f}" if macro_player.last_score is not None else "无"
+                    log_print(f"操作宏第 {macro_player.index + 1} 步模板确认失败（匹配分数 {score}），从本步开始请求模型")
+            if planned_element is None and macro_element is None and response_cache is not None \
+                    and same_coordinate_count < 2:
+                cache_key = response_cache.make_key(frame.image, user_content, recent_actions)
+                cache_hit = response_cache.get(cache_key)
+            if planned_element is not None:
+                next_element = json.dumps(planned_element, ensure_ascii=False)
+                log_print(f"执行计划中的下一步操作，跳过模型请求: {next_element}")
+            elif macro_element is not None:
+                next_element = json.dumps(macro_element, ensure_ascii=False)
+                log_print(f"操作宏第 {macro_player.index} 步模板确认通过，跳过模型请求: {next_element}")
+            elif cache_hit is not None:
+                next_element = json.dumps(cache_hit[1], ensure_ascii=False)
+                log_print(f"响应缓存命中，跳过模型请求: {next_element}")
+            else:
+                # 模型路由按当前档位选择模型和深度思考设置
+                level = router.level if router is not None else 0
+                model_name, thinking_type = (router.resolve(API_CONFIG["model_name"], AI_CONFIG["thinking_type"])
+                                             if router is not None else (None, None))
+                # 任务在前、历史操作和当前时间在后，请求前缀在各步之间保持不变
+                dynamic_content = before_content + "\n" + "当前时间为:" + time.strftime("%Y-%m-%d %H:%M", time.localtime())
+                next_element = await get_next_element_async(user_content, frame=frame, on_fields=on_fields,
+                                                            model_name=model_name, thinking_type=thinking_type,
+                                                            dynamic_content=dynamic_content)
+                # 结构化输出已解析的结果直接使用，不再从文本中提取
+                parsed_element = last_parsed_response
+                call_seconds = time.time() - model_start
+                if router is not None:
+                    router.record(level, call_seconds, last_completion_usage)
+                record_model_call(accounting, i, call_seconds, model_name)
+                grounding_stats.add_call(last_completion_usage)
+            consecutive_errors = 0
+            step_info = {"step": i, "timestamp": step_start, "response": next_element,
+                         "frame_scale": frame.scale, "frame_offset": [frame.offset_x, frame.offset_y],
+                         "timings": timings}
 
             # 解析JSON响应
             if next_element:
-                next_element = parse_json(next_element)
+                raw_output = next_element
+                next_element = parse_json(parsed_element if parsed_element is not None else next_element)
+                if VALIDATION_CONFIG.get("enabled", True) and (isinstance(next_element, dict) or isinstance(raw_output, str)):
+                    # 严格校验：含义明确的问题在本地修复，其余问题追问模型，仍无法修复时不执行本步
+                    defaults = DEFAULT_CONFIG["validation_config"]
+                    tolerance = VALIDATION_CONFIG.get("coordinate_tolerance", defaults["coordinate_tolerance"])
+                    max_reasks = VALIDATION_CONFIG.get("max_reasks", defaults["max_reasks"])
+                    if isinstance(next_element, dict):
+                        next_element, repairs, problems = validate_model_response(next_element, tolerance)
+                    else:
+                        # 输出被截断或没有JSON对象，同样追问模型
+                        repairs, problems = [], ["输出中没有完整的JSON对象（可能被截断），请重新输出完整的JSON"]
+                    # 缓存、宏和计划中的操作不是本步请求的输出，无法追问
+                    from_model = planned_element is None and macro_element is None and cache_hit is None
+                    reasks = 0
+                    while problems and from_model and reasks < max_reasks:
+                        reasks += 1
+                        log_print(f"模型输出未通过校验（{'；'.join(problems)}），追问模型")
+                        reask_start = time.time()
+                        reask_output = await reask_model_async(
+                            raw_output if isinstance(raw_output, str) else json.dumps(next_element, ensure_ascii=False),
+                            problems)
+                        record_model_call(accounting, i, time.time() - reask_start, model_name, kind="reask")
+                        grounding_stats.add_call(last_completion_usage)
+                        reask_element = parse_json(last_parsed_response or reask_output) if reask_output else None
+                        if not isinstance(reask_element, dict):
+                            break
+                        raw_output = reask_output
+                        next_element, repairs, problems = validate_model_response(reask_element, tolerance)
+                    if repairs:
+                        log_print(f"模型输出已在本地修复: {'；'.join(repairs)}")
+                    if repairs or problems or reasks:
+                        step_info["validation"] = {"repairs": repairs, "problems": problems, "reasks": reasks}
+                    if problems:
+                        log_print(f"模型输出未通过校验，不执行本步: {'；'.join(problems)}")
+                        next_element = None
+                elif isinstance(next_element, dict) and AI_CONFIG.get("stream", False) and not validate_response(next_element):
+                    next_element = None
+                if not isinstance(next_element, dict):
+                    # 鼠标可能已提前移动，但未通过校验的输出不执行点击
+                    action_str = "模型输出未通过校验，未执行操作"+"\n"
+                    # 没有执行操作，下一步不需要等待画面变化
+                    if change_detector is not None:
+                        change_detector.forget()
+                    if router is not None and router.observe(parse_failed=True):
+                        log_print(f"模型输出解析失败，升级到档位: {router.current.get('name')}")
+                    continue
                 current_status = next_element.get('current_status', '未知状态')
                 whether_completed = next_element.get('whether_completed', 'difficult')
                 element_info = next_element.get('element_info', '未知元素')
                 coordinates = next_element.get('coordinates', [0, 0])
                 action = next_element.get('action', '未知操作')
                 type_information = next_element.get('type_information', '')
+                submit = next_element.get('submit', True)
+                step_info.update(element_info=element_info, action=action, coordinates=coordinates,
+                                 whether_completed=whether_completed, current_status=current_status)
+                # 模型（或缓存）给出的后续操作替换之前未执行完的计划
+                if action_plan is not None and planned_element is None:
+                    action_plan.set(next_element)
+                    if action_plan.pending:
+                        log_print(f"模型给出 {len(action_plan.pending)} 步后续操作，将在本地依次执行")
+
+                if whether_completed in ("True", "difficult"):
+                    timings["model"] = time.time() - model_start
+                    record_session_step(recorder, annotation_writer, frame, step_info)
 
                 if whether_completed == "True":
                     log_print(f"AI分析用时: {time.time() - start_time:.2f}秒")
+                    if macro_recorder is not None and macro_recorder.steps:
+                        try:
+                            macro_dir = macro_library.save(user_content, macro_recorder.steps)
+                            log_print(f"已保存操作宏（{len(macro_recorder.steps)} 步）: {macro_dir}")
+                        except OSError as e:
+                            log_print(f"保存操作宏失败: {e}")
+                    if macro_player is not None:
+                        log_print(macro_player.report())
                     return current_status
                     break
                 elif whether_completed == "difficult":
@@ -629,26 +1415,62 @@ def auto_control_computer(user_content, max_visual_model_iterations=EXECUTION_CO
                 else:
                     pass
                 
+                # 区域放大定位：在原始分辨率的局部截图上重新定位目标元素
+                action_frame = frame
+                if zoom_enabled and cache_hit is None and macro_element is None and planned_element is None \
+                        and should_zoom(frame, action, coordinates):
+                    region = compute_zoom_region(frame, coordinates, SCREENSHOT_CONFIG.get("zoom_factor", 3.0))
+                    zoom_frame = crop_zoom_frame(frame, region, SCREENSHOT_CONFIG["max_png"])
+                    log_print(f"区域放大定位: 区域 {region}，放大图 {zoom_frame.width} x {zoom_frame.height}")
+                    zoom_start = time.time()
+                    zoom_output = await get_next_element_async(user_content, frame=zoom_frame,
+                                                               model_name=model_name, thinking_type=thinking_type,
+                                                               dynamic_content=build_zoom_prompt(element_info, action))
+                    grounding_stats.add_call(last_completion_usage, zoom=True)
+                    record_model_call(accounting, i, time.time() - zoom_start, model_name, kind="zoom")
+                    zoom_element = parse_json(last_parsed_response or zoom_output) if zoom_output else None
+                    zoom_coordinates = zoom_element.get('coordinates') if zoom_element else None
+                    if zoom_coordinates and should_zoom(frame, action, zoom_coordinates):
+                        coordinates = zoom_coordinates
+                        action_frame = zoom_frame
+                    else:
+                        log_print("区域放大定位未返回有效坐标，使用整屏定位结果")
+                
+                # 缓存和操作历史使用整屏截图上的坐标，区域放大的结果换算回整屏坐标
+                frame_coordinates = (rebase_coordinates(coordinates, action_frame, frame)
+                                     if action_frame is not frame else coordinates)
+                if cache_key is not None and cache_hit is None:
+                    response_cache.put(cache_key, dict(next_element, coordinates=frame_coordinates))
+
+                timings["model"] = time.time() - model_start
                 log_print(f"AI分析用时: {time.time() - start_time:.2f}秒")
                 log_print(f"下一步应该点击的元素: {element_info}")
                 #location_str = get_location(element_info)
                 
                 # 检查坐标是否与之前相同
                 # 使用值比较而不是引用比较
-                coordinates_match = False
-                for coord in recent_coordinates:
-                    if coord[0] == coordinates[0] and coord[1] == coordinates[1]:
-                        coordinates_match = True
-                        break
+                coordinates_match = coordinates in recent_coordinates
+                record_macro_step = True
                         
                 if not coordinates_match:
-                    recent_coordinates.append(coordinates.copy())  # 复制坐标列表
+                    recent_coordinates.append(coordinates.copy() if isinstance(coordinates, list) else coordinates)  # 复制坐标列表
                     same_coordinate_count = 1
+                    if macro_recorder is not None:
+                        macro_recorder.mark()
                     # 保持列表长度为3
                     if len(recent_coordinates) > 3:
                         recent_coordinates.pop(0)
                 else:
                     same_coordinate_count += 1
+                    # 使用缓存的操作后画面没有推进，删除这条缓存
+                    if cache_hit is not None:
+                        response_cache.invalidate(cache_hit[0])
+
+                # 连续相同坐标或连续page_loading时，下一步升级到更强的档位
+                if router is not None:
+                    reason = router.observe(same_coordinate_count, action=action)
+                    if reason:
+                        log_print(f"{reason}，升级到档位: {router.current.get('name')}")
                 
                 # 如果连续3次相同坐标，清空记忆
                 if same_coordinate_count >= 3:
@@ -656,49 +1478,74 @@ def auto_control_computer(user_content, max_visual_model_iterations=EXECUTION_CO
                     before_output = []  # 清空记忆列表
                     same_coordinate_count = 0
                     recent_coordinates = []
+                    recent_actions = []
+                    if macro_player is not None:
+                        macro_player.active = False
+                    if macro_recorder is not None:
+                        # 重复点击相同坐标的步骤没有推进任务，不写入宏，本步同样不记录
+                        macro_recorder.discard_since_mark()
+                        record_macro_step = False
+                    if action_plan is not None:
+                        action_plan.clear()
                     
-                action_str, mapped_coordinates = move_mouse_to_coordinates(coordinates, action, type_information, scale=scale)
-                # 标记坐标点
-                if mapped_coordinates:
-                    # 获取图像实际宽高
-                    image_path = SCREENSHOT_CONFIG["input_path"]
-                    img = cv2.imread(image_path)
-                    if img is not None:
-                        img_height, img_width = img.shape[:2]
-                        
-                        # 将实际屏幕坐标转换回图片上的坐标用于标记
-                        if isinstance(mapped_coordinates[0], list):
-                            # 拖拽坐标 [[x1, y1], [x2, y2]]
-                            image_coordinates = []
-                            for coord in mapped_coordinates:
-                                # 应用缩放比例将实际坐标转换为图片坐标
-                                img_x = int(coord[0] * scale)
-                                img_y = int(coord[1] * scale)
-                                image_coordinates.append([img_x, img_y])
-                        else:
-                            # 单点坐标 [x, y]
-                            # 应用缩放比例将实际坐标转换为图片坐标
-                            img_x = int(mapped_coordinates[0] * scale)
-                            img_y = int(mapped_coordinates[1] * scale)
-                            image_coordinates = [img_x, img_y]
-                        
-                        # 标记图片上的坐标
-                        # 为每次循环生成不同的输出文件名
-                        output_filename = f"screen_label{i+1}.png"
-                        output_path = os.path.join(SCREENSHOT_CONFIG["output_path"], output_filename)
-                        mark_coordinate_on_image(
-                            image_coordinates,
-                            input_path=SCREENSHOT_CONFIG["input_path"],
-                            output_path=output_path
-                        )
+                action_start = time.time()
+                # 请求发出到鼠标第一次移动的时间：流式提前移动时取提前移动的时刻
+                if premove["time"] is not None or action in PREMOVE_ACTIONS:
+                    first_move = (premove["time"] or action_start) - model_start
+                    timings["first_move"] = first_move
+                    log_print(f"请求到首次移动鼠标用时: {first_move:.2f}秒"
+                              f"{'（流式提前移动）' if premove['time'] is not None else ''}")
+                # 记录执行前的画面，下一步用预期区域的变化确认本步操作生效
+                if action_plan is not None:
+                    action_plan.remember(frame.image, next_element.get("expected_region"))
+                action_str, mapped_coordinates = await asyncio.to_thread(
+                    move_mouse_to_coordinates, coordinates, action, type_information, frame=action_frame, submit=submit
+                )
+                timings["action"] = time.time() - action_start
+                # 通知截图后端已执行操作（回放后端据此切换到下一帧）
+                get_capture_backend().notify_action()
+                # 操作已执行，下一步截图与本步画面相同时说明操作尚未生效，先在本地等待
+                if change_detector is not None:
+                    change_detector.remember(frame)
+                if macro_recorder is not None and record_macro_step:
+                    macro_recorder.add(frame.image, next_element, frame_coordinates)
+                if response_cache is not None:
+                    recent_actions.append(normalize_action(dict(next_element, coordinates=frame_coordinates)))
+                    recent_actions = recent_actions[-history_length:]
+                # 录制本步：坐标统一换算到整屏截图上，区域放大时同样可以在录制中标记
+                step_info.update(mapped_coordinates=mapped_coordinates, action_str=action_str,
+                                 image_coordinates=to_image_coordinates(frame, mapped_coordinates) if mapped_coordinates else None)
+                record_session_step(recorder, annotation_writer, frame, step_info)
+                # 标记坐标点（仅在开启调试图片时写入磁盘）
+                # 为每次循环生成不同的输出文件名
+                output_path = os.path.join(get_label_dir(), f"screen_label{i+1}.png")
+                if mapped_coordinates and save_debug_images and annotation_writer is not None:
+                    annotation_writer.submit_annotation(action_frame, mapped_coordinates, output_path)
+                elif mapped_coordinates and save_debug_images:
+                    # 将实际屏幕坐标转换回图片上的坐标用于标记
+                    mark_coordinate_on_image(
+                        to_image_coordinates(action_frame, mapped_coordinates),
+                        output_path=output_path,
+                        image=action_frame.image
+                    )
             else:
                 log_print("错误：未收到模型响应")
+                if change_detector is not None:
+                    change_detector.forget()
         except Exception as e:
             # 收集报错信息
             error_messages.append(f"第 {i} 次循环发生错误: {e}")
             log_print(f"发生错误: {e}")
-            # 抛出异常，让AIWorker的run方法捕获
-            raise e
+            # 单次循环出错（重试后仍失败的请求、截图或操作异常）不终止任务，下一次循环重新截图再试
+            consecutive_errors += 1
+            # 出错后画面状态不确定，剩余计划不再执行，下一步也不等待画面变化
+            if action_plan is not None:
+                action_plan.clear()
+            if change_detector is not None:
+                change_detector.forget()
+            if consecutive_errors >= max_consecutive_errors:
+                log_print(f"连续 {consecutive_errors} 次循环发生错误，停止任务")
+                return f"任务因连续错误停止: {e}"
 
     return current_status
 
@@ -710,10 +1557,8 @@ if __name__ == "__main__":
     # 如果需要继续其他功能，可以取消下面的注释
     user_content = input("请输入您的需求：")
     time.sleep(3)
-    # 获取时间字符串，年月日时分
-    time_str = time.strftime("%Y-%m-%d %H:%M", time.localtime())
-    # 用户输入内容添加时间
-    user_content = "当前时间为:"+time_str + "\n" + "用户任务为:"+user_content
+    # 当前时间由每一步的请求附加在历史操作之后，任务内容保持不变以便前缀缓存命中
+    user_content = "用户任务为:"+user_content
     log_print("正在处理...")
     log_print(user_content)
     #time.sleep(5)